@@ -0,0 +1,70 @@
+"""
+Benchmark de arranque en frío: tiempo de importación de los puntos de entrada.
+
+Cada medida se hace en un proceso nuevo (`python -X importtime -c "import ..."`), así
+que refleja lo que paga un worker del modo batch o la primera carga de la página.
+
+Uso:
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --repeticiones 5 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+OBJETIVOS = {
+    'ui': 'src.ui.streamlit_interface',
+    'headless': 'src.controllers.batch_runner',
+    'controlador': 'src.controllers.main_controller',
+}
+
+
+def _importtime(modulo):
+    """Devuelve (tiempo_total_s, {modulo: acumulado_us}) de un import en un proceso limpio."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else f"import {modulo} falló")
+    acumulado = {}
+    for linea in proc.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        _, cum_us, nombre = linea[len("import time:"):].split("|")
+        acumulado[nombre.strip()] = int(cum_us)
+    return acumulado.get(modulo, 0) / 1e6, acumulado
+
+
+def medir(modulo, repeticiones=3, top=10):
+    mejores, detalle = None, {}
+    for _ in range(repeticiones):
+        total, acumulado = _importtime(modulo)
+        if mejores is None or total < mejores:
+            mejores, detalle = total, acumulado
+    # Dependencias de terceros de primer nivel más caras
+    externos = {}
+    for nombre, us in detalle.items():
+        raiz = nombre.strip().split(".")[0]
+        if raiz != "src":
+            externos[raiz] = max(externos.get(raiz, 0), us)
+    ranking = sorted(externos.items(), key=lambda x: -x[1])[:top]
+    return mejores, ranking
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de importación en frío")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    for etiqueta, modulo in OBJETIVOS.items():
+        total, ranking = medir(modulo, args.repeticiones, args.top)
+        print(f"⏱️ {etiqueta:<12} import {modulo}: {total:.3f} s")
+        for nombre, us in ranking:
+            print(f"      {nombre:<22} {us / 1e6:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark de ingesta CSV: mide el tiempo de DataLoader.load_from_csv con un
+LineasPedido.csv grande (generado a partir de la muestra de data/raw).
+
+Uso:
+    python -m benchmarks.bench_ingest --filas 2000000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.etl.db_loader import DataLoader
+
+RAW_DIR = "data/raw"
+
+
+def preparar_carpeta(n_filas, destino):
+    """Copia data/raw y sustituye LineasPedido.csv por una versión de n_filas."""
+    for f in os.listdir(RAW_DIR):
+        if f.endswith('.csv'):
+            shutil.copy(os.path.join(RAW_DIR, f), destino)
+
+    lineas = pd.read_csv(os.path.join(RAW_DIR, "LineasPedido.csv"))
+    reps = int(np.ceil(n_filas / len(lineas)))
+    grande = pd.concat([lineas] * reps, ignore_index=True).iloc[:n_filas]
+    grande['LineaPedidoID'] = np.arange(1, len(grande) + 1)
+    grande.to_csv(os.path.join(destino, "LineasPedido.csv"), index=False)
+    return os.path.getsize(os.path.join(destino, "LineasPedido.csv"))
+
+
+def medir(folder, engine, workers, repeticiones):
+    DataLoader.MAX_WORKERS = workers
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        dfs = DataLoader.load_from_csv(folder, engine=engine)
+        tiempos.append(time.perf_counter() - t0)
+        assert dfs is not None
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta CSV")
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        size = preparar_carpeta(args.filas, tmp)
+        print(f"LineasPedido.csv: {args.filas} filas ({size / 1e6:.1f} MB)")
+
+        escenarios = [("c", 1), ("c", DataLoader.MAX_WORKERS), ("pyarrow", DataLoader.MAX_WORKERS)]
+        for engine, workers in escenarios:
+            try:
+                t = medir(tmp, engine, workers, args.repeticiones)
+                print(f"   engine={engine:<8} workers={workers}: {t:.3f} s")
+            except ImportError as e:
+                print(f"   engine={engine:<8} no disponible ({e})")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
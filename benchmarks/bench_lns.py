@@ -0,0 +1,92 @@
+"""
+Benchmark del optimizador entre rutas (LNS, src/models/plan_optimizer.py).
+
+Planifica el maestro sintético con flota fija (clustering + routing, sin caché) y
+optimiza el mismo plan con varios presupuestos de tiempo. Informa del coste en km
+(€), pedidos sin servir, pedidos que cambian de ruta y cuándo se encontró la última
+mejora. Con --validar re-simula cada ruta (capacidad, plazos y tacógrafo).
+
+Uso:
+    python -m benchmarks.bench_lns
+    python -m benchmarks.bench_lns --sizes 1000,5000 --presupuestos 1,5,20 --validar
+"""
+import argparse
+import contextlib
+import io
+
+import numpy as np
+
+from benchmarks.synthetic import generar_maestro, FECHA_BASE
+
+
+def _flota(n):
+    return {1: max(1, n // 100), 2: max(1, n // 100), 3: max(1, n // 200), 4: max(1, n // 400)}
+
+
+def planificar(df, flota):
+    """Clustering con flota fija + routing, sin caché. Retorna (aceptados, rutas)."""
+    from src.controllers.main_controller import LogisticsController
+    from src.models.clustering_service import ClusteringService
+    with contextlib.redirect_stdout(io.StringIO()):
+        acc, _, _, _ = ClusteringService(df).run_user_fleet_clustering(flota)
+        rutas = LogisticsController._ejecutar_routing(acc, FECHA_BASE)
+    return acc, rutas
+
+
+def validar(tabla, rutas):
+    """Re-simula cada ruta con RouteSolver.OPTIONS. Retorna la lista de incidencias."""
+    from src.config.fleet_config import FLEET_CONFIG
+    from src.models.routing import RouteSolver
+    plazo = RouteSolver.plazos(tabla, FECHA_BASE)
+    peso = tabla['Peso_Total_Kg'].to_numpy()
+    tipo = tabla['tipoVehiculo_id'].to_numpy()
+    opt = RouteSolver.OPTIONS
+    errores, vistos = [], set()
+    for r in rutas:
+        paradas = r['ruta'].paradas[:-1]
+        specs = FLEET_CONFIG[tipo[paradas[0]]]
+        if vistos & set(paradas.tolist()): errores.append(f"ruta {r['cluster_id']}: pedido repetido")
+        vistos |= set(paradas.tolist())
+        if peso[paradas].sum() > specs['capacidad_kg'] + 1e-6: errores.append(f"ruta {r['cluster_id']}: capacidad")
+        tramos = np.diff(r['ruta'].km_acum)[:-1]  # sin la vuelta al origen
+        vel = specs['velocidad_media_kmh'] / 60.0
+        drv = tot = 0.0
+        for j, km in zip(paradas[1:], tramos):
+            t = km / vel
+            drv += t; tot += t + opt['servicio_min']
+            if drv > opt['max_conduccion_min']:
+                tot += opt['descanso_min']; drv = t
+            if tot > plazo[j] + 1e-6: errores.append(f"ruta {r['cluster_id']}: pedido {j} fuera de plazo")
+    return errores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Optimizador LNS entre rutas: mejora frente al presupuesto")
+    parser.add_argument("--sizes", default="1000,5000", help="Pedidos (separados por comas)")
+    parser.add_argument("--presupuestos", default="1,5", help="Segundos de optimización (separados por comas)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--validar", action="store_true", help="Re-simular las rutas optimizadas")
+    args = parser.parse_args(argv)
+
+    from src.controllers.main_controller import LogisticsController
+    from src.models.plan_optimizer import PlanOptimizer
+    from src.utils.stage_cache import StageCache
+    LogisticsController._cache = StageCache(enabled=False)
+
+    for n in [int(s) for s in args.sizes.split(",")]:
+        acc, rutas = planificar(generar_maestro(n, args.seed), _flota(n))
+        print(f"🔁 {n} pedidos, {len(rutas)} rutas")
+        for presupuesto in [float(s) for s in args.presupuestos.split(",")]:
+            rutas_opt, tabla, st = PlanOptimizer(acc, rutas, FECHA_BASE, semilla=args.seed).optimizar(presupuesto)
+            mejora = 1 - st['coste_km_final'] / st['coste_km_inicial'] if st['coste_km_inicial'] else 0.0
+            print(f"   {presupuesto:>5g} s | {st['coste_km_inicial']:,.0f} € -> {st['coste_km_final']:,.0f} € "
+                  f"(-{mejora:.1%}) | sin servir {st['sin_servir_inicial']} -> {st['sin_servir_final']} | "
+                  f"{st['pedidos_movidos']} cambian de ruta | última mejora a los {st['historial'][-1][0]:.2f} s | "
+                  f"{st['iteraciones']} iteraciones")
+            if args.validar:
+                errores = validar(tabla, rutas_opt)
+                print(f"     {'✅ rutas factibles' if not errores else '❌ ' + '; '.join(errores[:5])}")
+
+
+if __name__ == "__main__":
+    main()
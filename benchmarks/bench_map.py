@@ -0,0 +1,91 @@
+"""
+Benchmark del mapa: peso del HTML y tiempo de construcción/serialización de
+create_interactive_map en modo 'detallado' y 'escalable' sobre planes sintéticos.
+
+Las geometrías de carretera se sintetizan (tramos densificados con un zigzag de ~5 m,
+como los que devuelve OSRM) para no depender del servidor y medir también la
+simplificación de las polilíneas. El tiempo de pintado en el navegador no se mide
+aquí; el peso del HTML y el nº de vértices son su mejor aproximación.
+
+Uso:
+    python -m benchmarks.bench_map
+    python -m benchmarks.bench_map --sizes 200,2000,10000 --puntos-tramo 60
+"""
+import argparse
+import contextlib
+import io
+import time
+import warnings
+
+import numpy as np
+
+from benchmarks.synthetic import generar_maestro
+
+MODOS = ('detallado', 'escalable')
+
+
+def _flota(n):
+    return {4: max(1, n // 20)}
+
+
+def preparar_rutas(n, seed=42):
+    """Plan sintético: clustering con flota dimensionada + routing (sin caché)."""
+    from src.controllers.main_controller import LogisticsController
+    from src.models.clustering_service import ClusteringService
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_acc = ClusteringService(generar_maestro(n, seed)).run_user_fleet_clustering(_flota(n))[0]
+        return LogisticsController._ejecutar_routing(df_acc)
+
+
+def geometria_sintetica(waypoints, puntos_tramo, rng):
+    """Polilínea densa entre waypoints con ruido de ~5 m (imita un trazado de carretera)."""
+    w = np.asarray(waypoints, dtype=float)
+    t = np.linspace(0, 1, puntos_tramo, endpoint=False)[:, None]
+    tramos = [a + t * (b - a) for a, b in zip(w[:-1], w[1:])]
+    linea = np.vstack(tramos + [w[-1:]])
+    linea[1:-1] += rng.normal(0, 0.00005, size=linea[1:-1].shape)
+    return linea.tolist()
+
+
+def medir(rutas, modo, geometrias, repeticiones=3):
+    from src.utils.map_renderer import create_interactive_map
+    construir, serializar, html = [], [], ""
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        m = create_interactive_map(rutas, modo=modo, geometrias=geometrias)
+        t1 = time.perf_counter()
+        html = m.get_root().render()
+        t2 = time.perf_counter()
+        construir.append(t1 - t0)
+        serializar.append(t2 - t1)
+    return {'construir_s': min(construir), 'html_s': min(serializar), 'html_kb': len(html.encode()) / 1024}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peso y tiempo del mapa interactivo")
+    parser.add_argument("--sizes", default="200,2000", help="Pedidos por escenario (separados por comas)")
+    parser.add_argument("--puntos-tramo", type=int, default=40, help="Vértices sintéticos por tramo")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore", message="CartoDB tiles")
+
+    from src.utils.map_renderer import HUB_COORDS, simplificar_rdp, tolerancia_zoom
+    for n in [int(s) for s in args.sizes.split(",")]:
+        rutas = preparar_rutas(n, args.seed)
+        rng = np.random.default_rng(args.seed)
+        geometrias = [geometria_sintetica([HUB_COORDS] + r['ruta'].coordenadas().tolist() + [HUB_COORDS],
+                                          args.puntos_tramo, rng) for r in rutas]
+        vertices = sum(len(g) for g in geometrias)
+        simplificados = sum(len(simplificar_rdp(g, tolerancia_zoom())) for g in geometrias)
+        paradas = sum(len(r['ruta']) for r in rutas)
+        print(f"🗺️  {n} pedidos -> {len(rutas)} rutas, {paradas} paradas, "
+              f"vértices {vertices} -> {simplificados} tras simplificar")
+        for modo in MODOS:
+            r = medir(rutas, modo, geometrias, args.repeticiones)
+            print(f"   {modo:<10} construir {r['construir_s']:.3f} s | HTML {r['html_s']:.3f} s | "
+                  f"{r['html_kb']:,.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de memoria: RSS pico de clustering (flota fija) y routing frente al nº de pedidos.
+
+Cada tamaño se mide en un proceso nuevo que lee el maestro sintético de un parquet,
+así que el pico no arrastra la generación de datos ni medidas anteriores. Se informa
+del RSS tras cargar la tabla (y sklearn/geopy) y de lo que añade cada etapa sobre él
+(pico - base).
+
+Uso:
+    python -m benchmarks.bench_memory
+    python -m benchmarks.bench_memory --sizes 1000,10000,50000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _flota(n):
+    return {4: max(1, n // 20)}
+
+
+def _rss_actual_mb():
+    with open("/proc/self/status") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1]) / 1024
+    return 0.0
+
+
+def _rss_pico_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def medir(parquet, n):
+    """Proceso hijo: carga el maestro y mide el pico de cada etapa (MB)."""
+    import pandas as pd
+    from src.controllers.main_controller import LogisticsController
+    from src.models.clustering_service import ClusteringService
+
+    import sklearn.cluster, geopy.distance  # noqa: F401  (imports diferidos: fuera de la medida)
+
+    df = pd.read_parquet(parquet)
+    base = _rss_actual_mb()
+    with contextlib.redirect_stdout(io.StringIO()):
+        acc = ClusteringService(df).run_user_fleet_clustering(_flota(n))[0]
+        pico_clustering = _rss_pico_mb()
+        rutas = LogisticsController._ejecutar_routing(acc)
+        pico_routing = _rss_pico_mb()
+    return {'pedidos': n, 'rutas': len(rutas), 'base_mb': base,
+            'clustering_mb': pico_clustering - base, 'routing_mb': pico_routing - base,
+            'pico_mb': pico_routing}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RSS pico de clustering y routing por nº de pedidos")
+    parser.add_argument("--sizes", default="1000,10000,30000", help="Pedidos por escenario (separados por comas)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--medir", nargs=2, metavar=("PARQUET", "N"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.medir:
+        print(json.dumps(medir(args.medir[0], int(args.medir[1]))))
+        return 0
+
+    from benchmarks.synthetic import generar_maestro
+    env = {**os.environ, 'IADELIVERY_CACHE': '0', 'IADELIVERY_PLANS': '0'}
+    print(f"   {'Pedidos':>8} | {'Rutas':>6} | {'Base (MB)':>9} | {'+Clustering':>11} | {'+Routing':>9} | {'Pico (MB)':>9}")
+    with tempfile.TemporaryDirectory(prefix="bench_mem_") as tmp:
+        for n in [int(s) for s in args.sizes.split(",")]:
+            parquet = os.path.join(tmp, f"maestro_{n}.parquet")
+            generar_maestro(n, args.seed).to_parquet(parquet, index=False)
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_memory", "--medir", parquet, str(n)],
+                                  cwd=ROOT, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"❌ {n} pedidos: {proc.stderr.strip().splitlines()[-1] if proc.stderr else 'error'}")
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"   {r['pedidos']:>8} | {r['rutas']:>6} | {r['base_mb']:>9.1f} | {r['clustering_mb']:>11.1f} | "
+                  f"{r['routing_mb']:>9.1f} | {r['pico_mb']:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""
+Benchmark de calidad de la solución (clustering + routing) sobre conjuntos de instancias fijos.
+
+Conjuntos:
+- optimos: rutas pequeñas de un solo vehículo sin plazos (6-10 paradas) cuyo recorrido
+  óptimo se calcula exactamente (Held-Karp sobre la misma matriz haversine que el solver).
+  Se informa del gap del solver frente al óptimo.
+- capacitadas: maestro sintético con plazos y flota fija (capacidad + MAX_STOPS +
+  tacógrafo), planificado de principio a fin.
+
+Por instancia y modo del solver (MODOS: routing denso/candidatos, asignación óptima/por
+rango, con o sin LNS) se registran km totales, coste en € según FLEET_CONFIG (fijo por
+viaje + variable por km), pedidos descartados (por el clustering o fuera de plazo) y
+tiempo. Todo es determinista salvo el tiempo: el LNS se limita por iteraciones, no por reloj.
+
+Con --registrar el resultado se añade al histórico (benchmarks/quality_history.json), con el
+commit. Cada ejecución muestra la frontera de Pareto tiempo/calidad de cada conjunto sobre
+todo el histórico y falla si la calidad empeora frente a la última entrada registrada. Una
+ejecución que empeora no se registra (pasaría a ser la referencia) salvo con --forzar.
+
+Uso:
+    python -m benchmarks.bench_quality
+    python -m benchmarks.bench_quality --sizes 500,2000 --modos por_defecto,lns --registrar
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import generar_maestro, FECHA_BASE
+
+HISTORIAL_PATH = "benchmarks/quality_history.json"
+
+MODOS = {
+    'por_defecto': {'routing': 'auto', 'asignacion': 'optima', 'lns_iteraciones': 0},
+    'candidatos': {'routing': 'candidatos', 'asignacion': 'optima', 'lns_iteraciones': 0},
+    'rango': {'routing': 'auto', 'asignacion': 'rango', 'lns_iteraciones': 0},
+    'lns': {'routing': 'auto', 'asignacion': 'optima', 'lns_iteraciones': 2000},
+}
+# Tope de tiempo del LNS (solo para que no se eternice en máquinas lentas)
+LNS_MAX_S = 120
+
+# Instancias con óptimo conocido: (paradas, semilla)
+OPTIMOS = [(n, s) for n in (6, 8, 10) for s in range(5)]
+
+
+def _flota(n):
+    return {1: max(1, n // 100), 2: max(1, n // 100), 3: max(1, n // 200), 4: max(1, n // 400)}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+@contextlib.contextmanager
+def _modo(cfg):
+    """Aplica la configuración de un modo a RouteSolver / ClusteringService y la restaura."""
+    from src.models.routing import RouteSolver
+    from src.models.clustering_service import ClusteringService
+    candidatos, asignacion = dict(RouteSolver.CANDIDATOS), ClusteringService.ASIGNACION
+    RouteSolver.CANDIDATOS = {**candidatos, 'modo': cfg['routing']}
+    ClusteringService.ASIGNACION = cfg['asignacion']
+    try:
+        yield
+    finally:
+        RouteSolver.CANDIDATOS, ClusteringService.ASIGNACION = candidatos, asignacion
+
+
+# ----------------------------------------------------------------------------- instancias
+
+def instancia_optima(n, semilla):
+    """Depósito + n - 1 pedidos en un área de ~100 km, sin plazos."""
+    rng = np.random.default_rng(semilla)
+    lat = 40.4 + rng.uniform(-0.5, 0.5, n)
+    lon = -3.7 + rng.uniform(-0.6, 0.6, n)
+    return pd.DataFrame({'PedidoID': np.arange(n), 'Latitud': lat, 'Longitud': lon,
+                         'Peso_Total_Kg': np.ones(n)})
+
+
+def recorrido_optimo_km(D):
+    """Held-Karp: km del ciclo hamiltoniano mínimo que empieza y acaba en el nodo 0."""
+    n = len(D)
+    if n <= 1: return 0.0
+    m = n - 1
+    # coste[S, j]: camino mínimo desde 0 por el conjunto S (bits de 1..n-1) que acaba en j
+    coste = np.full((1 << m, m), np.inf)
+    for j in range(m):
+        coste[1 << j, j] = D[0, j + 1]
+    for S in range(1, 1 << m):
+        fila = coste[S]
+        if not np.isfinite(fila).any(): continue
+        for k in range(m):
+            if S & (1 << k): continue
+            T = S | (1 << k)
+            c = np.min(fila + D[1:, k + 1])
+            if c < coste[T, k]: coste[T, k] = c
+    return float(np.min(coste[(1 << m) - 1] + D[1:, 0]))
+
+
+def medir_optima(df, cfg):
+    from src.models.routing import RouteSolver
+    from src.models.distance_provider import HaversineProvider
+    with _modo(cfg):
+        t0 = time.perf_counter()
+        r = RouteSolver.solve_route(df, 60, FECHA_BASE, distancias=HaversineProvider())
+        t = time.perf_counter() - t0
+    D = HaversineProvider().matriz(df[['Latitud', 'Longitud']].to_numpy())
+    np.fill_diagonal(D, 0.0)
+    optimo = recorrido_optimo_km(D)
+    return {'km': r.km, 'km_optimo': optimo, 'gap_pct': 100 * (r.km / optimo - 1) if optimo else 0.0,
+            'descartados': len(df) - (len(r) - 1 if len(r) else 0), 'tiempo_s': t}
+
+
+def coste_plan(tabla, rutas):
+    """(km totales, € según FLEET_CONFIG, pedidos servidos) de un plan."""
+    from src.config.fleet_config import FLEET_CONFIG
+    tipo = tabla['tipoVehiculo_id'].to_numpy()
+    km = eur = servidos = 0.0
+    for r in rutas:
+        ruta = r['ruta']
+        if not ruta: continue
+        specs = FLEET_CONFIG[tipo[ruta.paradas[0]]]
+        km += ruta.km
+        eur += specs['coste_fijo_por_viaje'] + ruta.km * specs['coste_variable_por_km']
+        servidos += len(np.unique(ruta.paradas))
+    return km, eur, int(servidos)
+
+
+def medir_capacitada(df, cfg, seed):
+    from src.controllers.main_controller import LogisticsController
+    from src.models.clustering_service import ClusteringService
+    from src.models.plan_optimizer import PlanOptimizer
+    with _modo(cfg), contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        acc, disc, _, _ = ClusteringService(df).run_user_fleet_clustering(_flota(len(df)))
+        rutas = LogisticsController._ejecutar_routing(acc, FECHA_BASE)
+        if cfg['lns_iteraciones']:
+            rutas, acc, _ = PlanOptimizer(acc, rutas, FECHA_BASE, semilla=seed).optimizar(
+                LNS_MAX_S, max_iteraciones=cfg['lns_iteraciones'])
+        t = time.perf_counter() - t0
+    km, eur, servidos = coste_plan(acc, rutas)
+    descartados = (0 if disc is None else len(disc)) + len(acc) - servidos
+    return {'km': km, 'coste_eur': eur, 'descartados': int(descartados), 'tiempo_s': t}
+
+
+# ----------------------------------------------------------------------------- ejecución
+
+def ejecutar(sizes, modos, seed=42):
+    from src.controllers.main_controller import LogisticsController
+    from src.utils.stage_cache import StageCache
+    # La caché de etapas falsearía los tiempos
+    LogisticsController._cache = StageCache(enabled=False)
+    # Calentamiento (imports diferidos, primeras llamadas) fuera de las medidas
+    medir_capacitada(generar_maestro(100, seed), MODOS['por_defecto'], seed)
+
+    resultados = []
+    for modo in modos:
+        cfg = MODOS[modo]
+        if cfg['asignacion'] != 'optima' or cfg['lns_iteraciones']:
+            continue  # en rutas de un solo vehículo solo influye el routing
+        for n, s in OPTIMOS:
+            r = medir_optima(instancia_optima(n, s), cfg)
+            resultados.append({'conjunto': 'optimos', 'instancia': f"n{n}_s{s}", 'modo': modo, **r})
+        gaps = [r['gap_pct'] for r in resultados if r['conjunto'] == 'optimos' and r['modo'] == modo]
+        print(f"   optimos      {modo:<12} gap medio {np.mean(gaps):5.2f} % | máximo {np.max(gaps):5.2f} % "
+              f"({len(gaps)} instancias)")
+
+    for n in sizes:
+        df = generar_maestro(n, seed)
+        for modo in modos:
+            r = medir_capacitada(df, MODOS[modo], seed)
+            resultados.append({'conjunto': 'capacitadas', 'instancia': f"n{n}", 'modo': modo, **r})
+            print(f"   capacitadas  {modo:<12} n={n:<6} {r['km']:>10,.0f} km | {r['coste_eur']:>10,.0f} € | "
+                  f"{r['descartados']:>5} descartados | {r['tiempo_s']:7.2f} s")
+
+    return {
+        'meta': {'commit': _commit(), 'fecha': time.strftime('%Y-%m-%d %H:%M:%S'), 'seed': seed,
+                 'modos': {m: MODOS[m] for m in modos}},
+        'resultados': resultados
+    }
+
+
+def resumen(ejecucion, instancias):
+    """
+    Un punto (tiempo, calidad) por conjunto y modo sobre `instancias` ({conjunto: {instancia}}),
+    solo si el modo las cubre todas. Calidad: gap medio (%) en optimos; en capacitadas, €
+    totales + PENALIZACION_DESCARTE por pedido descartado (como la asignación: primero los
+    descartes, después el coste).
+    """
+    from src.models.clustering_service import ClusteringService
+    puntos, cubiertas = {}, {}
+    for r in ejecucion['resultados']:
+        if r['instancia'] not in instancias.get(r['conjunto'], ()): continue
+        clave = (r['conjunto'], r['modo'])
+        p = puntos.setdefault(clave, {'tiempo_s': 0.0, 'calidad': 0.0, 'n': 0})
+        cubiertas.setdefault(clave, set()).add(r['instancia'])
+        p['tiempo_s'] += r['tiempo_s']; p['n'] += 1
+        if r['conjunto'] == 'optimos':
+            p['calidad'] += r['gap_pct']
+        else:
+            p['calidad'] += r['coste_eur'] + ClusteringService.PENALIZACION_DESCARTE * r['descartados']
+    for (conjunto, _), p in puntos.items():
+        if conjunto == 'optimos': p['calidad'] /= p['n']
+    return {c: p for c, p in puntos.items() if cubiertas[c] == instancias[c[0]]}
+
+
+def frontera_pareto(puntos):
+    """Etiquetas de los puntos {etiqueta: (tiempo, calidad)} no dominados (menos es mejor en ambos)."""
+    return {e for e, (t, q) in puntos.items()
+            if not any(t2 <= t and q2 <= q and (t2, q2) != (t, q) for t2, q2 in puntos.values())}
+
+
+def comparar(actual, anterior, tolerancia=1e-6):
+    """Instancias (conjunto, instancia, modo) cuya calidad empeora frente a la ejecución anterior."""
+    def clave(r): return r['conjunto'], r['instancia'], r['modo']
+    def calidad(r): return (r['descartados'], r.get('coste_eur', r['km']))
+    previos = {clave(r): r for r in anterior['resultados']}
+    peores = []
+    for r in actual['resultados']:
+        ref = previos.get(clave(r))
+        if ref is None: continue
+        d, c = calidad(r); d0, c0 = calidad(ref)
+        if d > d0 or (d == d0 and c > c0 * (1 + tolerancia)):
+            peores.append((clave(r), calidad(ref), calidad(r)))
+    return peores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calidad de la solución (km, €, descartes) por modo del solver")
+    parser.add_argument("--sizes", default="500,2000", help="Pedidos de las instancias capacitadas (separados por comas)")
+    parser.add_argument("--modos", default=",".join(MODOS), help="Subconjunto de modos")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--historial", default=HISTORIAL_PATH)
+    parser.add_argument("--registrar", action="store_true", help="Añadir esta ejecución al histórico")
+    parser.add_argument("--forzar", action="store_true",
+                        help="Con --registrar, añadirla aunque empeore (p.ej. un compromiso calidad/tiempo aceptado)")
+    parser.add_argument("--tolerancia", type=float, default=1e-6, help="Empeoramiento relativo de coste admitido")
+    args = parser.parse_args(argv)
+
+    modos = [m for m in args.modos.split(",") if m]
+    desconocidos = set(modos) - set(MODOS)
+    if desconocidos:
+        parser.error(f"Modos desconocidos: {desconocidos}")
+
+    print(f"🎯 Calidad: tamaños={args.sizes} modos={modos}")
+    res = ejecutar([int(float(s)) for s in args.sizes.split(",")], modos, args.seed)
+
+    historial = []
+    if os.path.exists(args.historial):
+        with open(args.historial, encoding="utf-8") as f:
+            historial = json.load(f)
+
+    referencia = historial[-1]['meta'].get('commit') if historial else None
+    peores = comparar(res, historial[-1], args.tolerancia) if historial else []
+
+    # Frontera tiempo/calidad de cada conjunto sobre todo el histórico + esta ejecución
+    # (solo las instancias de esta ejecución, para comparar sumas homogéneas)
+    instancias = {}
+    for r in res['resultados']:
+        instancias.setdefault(r['conjunto'], set()).add(r['instancia'])
+    etiquetas = {}
+    for i, ejecucion in enumerate(historial + [res]):
+        nombre = "actual" if i == len(historial) else (ejecucion['meta'].get('commit') or f"#{i}")
+        for (conjunto, modo), p in resumen(ejecucion, instancias).items():
+            etiquetas.setdefault(conjunto, {})[f"{nombre}:{modo}"] = (p['tiempo_s'], p['calidad'])
+    for conjunto, puntos in etiquetas.items():
+        frontera = frontera_pareto(puntos)
+        print(f"📈 Frontera de Pareto ({conjunto}: tiempo total vs {'gap medio %' if conjunto == 'optimos' else '€ + descartes'}):")
+        for e in sorted(frontera, key=lambda e: puntos[e][0]):
+            t, q = puntos[e]
+            print(f"   {e:<28} {t:8.2f} s | {q:12,.2f}{'  ← esta ejecución' if e.startswith('actual:') else ''}")
+
+    if args.registrar and peores and not args.forzar:
+        print("⛔ No se registra: empeora la calidad (usa --forzar si el cambio es intencionado).")
+    elif args.registrar:
+        historial.append(res)
+        os.makedirs(os.path.dirname(args.historial) or ".", exist_ok=True)
+        with open(args.historial, "w", encoding="utf-8") as f:
+            json.dump(historial, f, indent=1)
+        print(f"📌 Ejecución añadida al histórico: {args.historial}")
+
+    if peores:
+        print(f"🔴 La calidad empeora en {len(peores)} instancias frente a {referencia}:")
+        for (conjunto, instancia, modo), antes, ahora in peores:
+            print(f"   {conjunto}/{instancia} [{modo}]: (descartes, coste) {antes} -> {ahora}")
+        return 1
+    if historial:
+        print("🟢 Ninguna instancia empeora respecto a la última ejecución registrada.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Benchmark del routing en un único cluster muy grande: modo denso (matrices n x n)
+frente a modo candidatos (BallTree + k vecinos, ver RouteSolver.CANDIDATOS).
+
+Todas las paradas del maestro sintético van a una sola ruta. Por defecto se quitan las
+fechas límite (la ruta recorre todo el cluster, el peor caso para el voraz); con
+--con-plazos se conservan. El modo denso solo se mide hasta --max-denso paradas: por
+encima sus matrices no caben en memoria razonable. Se informa de tiempo, pico de memoria
+(tracemalloc, en una pasada aparte) y, donde corren ambos modos, si las rutas coinciden.
+
+Uso:
+    python -m benchmarks.bench_routing
+    python -m benchmarks.bench_routing --sizes 1000,5000,20000,50000 --con-plazos
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import generar_maestro
+
+
+def medir(df, modo, velocidad, fecha, memoria=True):
+    """
+    Resuelve la ruta con el modo indicado. Retorna (RouteResult, segundos, MB pico).
+    El tiempo se toma sin tracemalloc (ralentiza mucho el bucle denso) y el pico de
+    memoria en una segunda pasada trazada.
+    """
+    from src.models.routing import RouteSolver
+    RouteSolver.CANDIDATOS = {**RouteSolver.CANDIDATOS, 'modo': modo}
+    t0 = time.perf_counter()
+    r = RouteSolver.solve_route(df, velocidad, fecha)
+    t = time.perf_counter() - t0
+    if not memoria: return r, t, float('nan')
+    tracemalloc.start()
+    RouteSolver.solve_route(df, velocidad, fecha)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return r, t, pico / 2**20
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Routing denso vs candidatos en un cluster grande")
+    parser.add_argument("--sizes", default="1000,5000,20000,50000", help="Paradas del cluster (separadas por comas)")
+    parser.add_argument("--max-denso", type=int, default=5000, help="Tamaño máximo medido en modo denso")
+    parser.add_argument("--con-plazos", action="store_true", help="Conservar Fecha_Limite_Entrega")
+    parser.add_argument("--sin-memoria", action="store_true", help="No medir el pico de memoria (una pasada menos)")
+    parser.add_argument("--velocidad", type=float, default=90)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    from sklearn.neighbors import BallTree  # noqa: F401  (que el import no cuente en la primera medida)
+    from src.models.routing import RouteSolver
+    from benchmarks.synthetic import FECHA_BASE
+    original = dict(RouteSolver.CANDIDATOS)
+
+    try:
+        for n in [int(s) for s in args.sizes.split(",")]:
+            df = generar_maestro(n, args.seed).head(n)
+            if not args.con_plazos:
+                df = df.drop(columns=['Fecha_Limite_Entrega'])
+            print(f"🛣️  {len(df)} paradas en un solo cluster ({'con' if args.con_plazos else 'sin'} plazos)")
+            rutas = {}
+            for modo in ('denso', 'candidatos'):
+                if modo == 'denso' and len(df) > args.max_denso:
+                    print(f"   {modo:<10} (omitido: más de {args.max_denso} paradas)")
+                    continue
+                r, t, mb = medir(df, modo, args.velocidad, FECHA_BASE, memoria=not args.sin_memoria)
+                rutas[modo] = r
+                print(f"   {modo:<10} {t:8.2f} s | pico {mb:8.1f} MB | "
+                      f"{max(len(r) - 1, 0)} pedidos servidos | {r.km:,.0f} km")
+            if len(rutas) == 2:
+                a, b = rutas['denso'], rutas['candidatos']
+                igual = np.array_equal(a.paradas, b.paradas) and np.array_equal(a.min_acum, b.min_acum)
+                print(f"   rutas {'idénticas ✅' if igual else 'distintas ⚠️'}")
+    finally:
+        RouteSolver.CANDIDATOS = original
+
+
+if __name__ == "__main__":
+    main()
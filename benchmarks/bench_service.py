@@ -0,0 +1,80 @@
+"""
+Prueba de carga del servicio HTTP de planificación (src/controllers/plan_service.py).
+
+Levanta el servicio en un puerto libre (o usa uno ya arrancado con --url) y lanza
+peticiones concurrentes: la mitad idénticas (se coalescen) y el resto con flotas
+distintas. Informa de latencias, peticiones coalescidas y rechazadas.
+
+Uso:
+    python -m benchmarks.bench_service --peticiones 20 --concurrencia 8
+    python -m benchmarks.bench_service --url http://127.0.0.1:8000 --carpeta data/raw
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def planificar(url, payload, endpoint="/plan"):
+    """Una petición; devuelve (segundos, líneas NDJSON recibidas, código HTTP)."""
+    req = urllib.request.Request(url + endpoint, data=json.dumps(payload).encode(),
+                                 headers={'Content-Type': 'application/json'})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            lineas = [json.loads(l) for l in resp if l.strip()]
+            return time.perf_counter() - t0, lineas, resp.status
+    except urllib.error.HTTPError as e:
+        return time.perf_counter() - t0, [json.loads(e.read() or b"{}")], e.code
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga sobre el servicio de planificación")
+    parser.add_argument("--url", default=None, help="Servicio ya arrancado (por defecto se levanta uno)")
+    parser.add_argument("--workers", type=int, default=2, help="Procesos del servicio levantado")
+    parser.add_argument("--carpeta", default="data/raw")
+    parser.add_argument("--peticiones", type=int, default=12)
+    parser.add_argument("--concurrencia", type=int, default=6)
+    args = parser.parse_args(argv)
+
+    servidor = None
+    url = args.url
+    if url is None:
+        from src.controllers.plan_service import crear_servidor
+        servidor = crear_servidor(puerto=0, workers=args.workers)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{servidor.server_address[1]}"
+
+    payloads = []
+    for i in range(args.peticiones):
+        # La mitad idénticas; el resto con flotas distintas (no coalescibles)
+        flota = {"4": 2} if i % 2 == 0 else {"4": 1 + i % 5, "3": 1}
+        payloads.append({'carpeta': args.carpeta, 'flota': flota})
+
+    print(f"🛰️ {args.peticiones} peticiones ({args.concurrencia} concurrentes) -> {url}")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+        resultados = list(pool.map(lambda p: planificar(url, p), payloads))
+    total = time.perf_counter() - t0
+
+    tiempos = np.array([r[0] for r in resultados])
+    ok = sum(1 for _, lineas, codigo in resultados if codigo == 200 and lineas[-1].get('status') == 'completado')
+    coalescidas = sum(1 for _, lineas, codigo in resultados if codigo == 200 and lineas[0].get('coalescida'))
+    print(f"   completadas {ok}/{len(resultados)} | coalescidas {coalescidas} | total {total:.2f} s")
+    print(f"   latencia p50 {np.percentile(tiempos, 50):.2f} s | p95 {np.percentile(tiempos, 95):.2f} s | "
+          f"máx {tiempos.max():.2f} s")
+    with urllib.request.urlopen(url + "/salud") as resp:
+        print(f"   salud: {json.loads(resp.read())}")
+
+    if servidor is not None:
+        servidor.shutdown()
+        servidor.RequestHandlerClass.servicio.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark del plano de datos en memoria compartida (src/utils/shared_data.py).
+
+Para el maestro sintético con flota fija compara lo que viaja a cada worker por tarea
+(el DataFrame de aceptados en pickle frente al descriptor + posiciones), el tiempo de
+publicar y de adjuntarse frente a deserializar la tabla, y el RSS que añade cada caso
+al worker. Después planifica el routing y el clustering óptimo en secuencia y con el pool
+(--workers), comprobando que las rutas y la flota elegida coinciden.
+
+Uso:
+    python -m benchmarks.bench_shared
+    python -m benchmarks.bench_shared --sizes 5000,20000 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import generar_maestro, FECHA_BASE
+
+
+def _flota(n):
+    return {1: max(1, n // 100), 2: max(1, n // 100), 3: max(1, n // 200), 4: max(1, n // 400)}
+
+
+def _rss_actual_mb():
+    with open("/proc/self/status") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1]) / 1024
+    return 0.0
+
+
+def worker_adjunto(descriptor):
+    """En el worker: (segundos en adjuntarse, MB de RSS que añade leer todas las columnas)."""
+    from src.utils.shared_data import adjuntar
+    base = _rss_actual_mb()
+    t0 = time.perf_counter()
+    datos = adjuntar(descriptor)
+    t = time.perf_counter() - t0
+    float(sum(v.sum() for v in datos.values()))
+    return t, _rss_actual_mb() - base
+
+
+def worker_pickle(carga):
+    """En el worker que recibe la tabla en pickle: (segundos en deserializarla, MB de RSS que añade)."""
+    base = _rss_actual_mb()
+    t0 = time.perf_counter()
+    tabla = pickle.loads(carga)
+    t = time.perf_counter() - t0
+    rss = _rss_actual_mb() - base
+    del tabla
+    return t, rss
+
+
+def _rutas(rutas):
+    return [(r['cluster_id'], r['ruta'].paradas.tolist(), r['ruta'].km_acum.tolist()) for r in rutas]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memoria compartida para los workers de routing y clustering")
+    parser.add_argument("--sizes", default="2000,10000", help="Pedidos (separados por comas)")
+    parser.add_argument("--workers", type=int, default=2, help="Procesos del pool")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    from src.controllers.main_controller import LogisticsController
+    from src.models.clustering_service import ClusteringService
+    from src.models.routing import RouteSolver
+    from src.utils import shared_data
+    from src.utils.stage_cache import StageCache
+    LogisticsController._cache = StageCache(enabled=False)
+    shared_data.POOL_WORKERS = args.workers
+    pool = shared_data.pool_procesos()
+    # Arranque de los workers (spawn + imports) fuera de las medidas
+    list(pool.map(worker_pickle, [pickle.dumps(None)] * args.workers))
+
+    for n in [int(s) for s in args.sizes.split(",")]:
+        df = generar_maestro(n, args.seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            acc = ClusteringService(df).run_user_fleet_clustering(_flota(n))[0]
+        posiciones = np.flatnonzero(acc['cluster_id'].to_numpy() == acc['cluster_id'].iloc[0])
+        print(f"🧩 {n} pedidos ({len(acc)} aceptados, {acc['cluster_id'].nunique()} rutas)")
+
+        t0 = time.perf_counter()
+        arrays = {'Latitud': acc['Latitud'].to_numpy(dtype=float), 'Longitud': acc['Longitud'].to_numpy(dtype=float),
+                  'plazo_min': RouteSolver.plazos(acc, FECHA_BASE)}
+        with shared_data.DatosCompartidos(arrays) as datos:
+            t_pub = time.perf_counter() - t0
+            carga = pickle.dumps((acc, posiciones))
+            b_desc = len(pickle.dumps((datos.descriptor, posiciones)))
+            print(f"   por tarea: tabla en pickle {len(carga) / 1024:,.0f} KB | descriptor {b_desc / 1024:,.1f} KB "
+                  f"(segmento de {datos.nbytes / 1024:,.0f} KB publicado en {t_pub * 1000:.1f} ms)")
+            t_adj, rss_adj = pool.submit(worker_adjunto, datos.descriptor).result()
+            t_pkl, rss_pkl = pool.submit(worker_pickle, carga).result()
+            print(f"   worker: adjuntarse {t_adj * 1000:.2f} ms (+{rss_adj:.1f} MB RSS) | "
+                  f"deserializar la tabla {t_pkl * 1000:.2f} ms (+{rss_pkl:.1f} MB RSS)")
+
+        for nombre, workers in (("secuencial", 0), (f"pool x{args.workers}", args.workers)):
+            shared_data.POOL_WORKERS = workers
+            with contextlib.redirect_stdout(io.StringIO()):
+                t0 = time.perf_counter()
+                rutas = LogisticsController._ejecutar_routing(acc, FECHA_BASE)
+                t_rut = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                detalle, coste = ClusteringService(df).run_optimal_clustering()
+                t_opt = time.perf_counter() - t0
+            if workers == 0:
+                ref = (_rutas(rutas), coste)
+            igual = (_rutas(rutas), coste) == ref
+            print(f"   {nombre:<12} routing {t_rut:6.2f} s | clustering óptimo {t_opt:6.2f} s | "
+                  f"{'mismo plan ✅' if igual else 'plan distinto ⚠️'}")
+        shared_data.POOL_WORKERS = args.workers
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark del arranque en caliente (histórico de planes, src/utils/plan_store.py).
+
+Simula dos días consecutivos: el día 2 repite una fracción de los pedidos del día 1
+(mismos destinos) y añade pedidos nuevos. El día 1 se planifica y se guarda en un
+histórico temporal; el día 2 se planifica en frío (KMeans con n_init completo y
+solver sin orden previo) y en caliente (centroides y secuencias del plan del día 1).
+Informa de tiempo de clustering y routing, km totales y pedidos servidos.
+
+Uso:
+    python -m benchmarks.bench_warm_start
+    python -m benchmarks.bench_warm_start --sizes 500,2000 --solape 0.7,0.9
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import generar_maestro
+
+
+def _flota(n):
+    return {4: max(1, n // 20)}
+
+
+def dia_siguiente(df_dia1, n, solape, seed):
+    """Pedidos del día 2: `solape` del día 1 (mismos destinos) + pedidos nuevos."""
+    repetidos = df_dia1.sample(frac=solape, random_state=seed)
+    nuevos = generar_maestro(n, seed + 1).head(n - len(repetidos)).copy()
+    nuevos['PedidoID'] = nuevos['PedidoID'] + int(df_dia1['PedidoID'].max())
+    return pd.concat([repetidos, nuevos], ignore_index=True)
+
+
+def planificar(df, flota, semillas=None, secuencias=None):
+    """Clustering con flota fija + routing, sin caché. Retorna (res_clustering, rutas, t_cluster, t_rutas)."""
+    from src.controllers.main_controller import LogisticsController
+    from src.models.clustering_service import ClusteringService
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        acc, disc, cost, details = ClusteringService(df, semillas=semillas).run_user_fleet_clustering(flota)
+        t1 = time.perf_counter()
+        rutas = LogisticsController._ejecutar_routing(acc, secuencias=secuencias)
+        t2 = time.perf_counter()
+    res = {'accepted_df': acc, 'discarded_df': disc, 'fleet_used': flota, 'metrics': {'cost': cost}}
+    return res, rutas, t1 - t0, t2 - t1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Planificación en frío vs arranque en caliente")
+    parser.add_argument("--sizes", default="500,2000", help="Pedidos por día (separados por comas)")
+    parser.add_argument("--solape", default="0.8", help="Fracción de pedidos repetidos del día 1")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    from src.controllers.main_controller import LogisticsController
+    from src.utils.plan_store import PlanStore
+    from src.utils.stage_cache import StageCache
+    LogisticsController._cache = StageCache(enabled=False)
+
+    for n in [int(s) for s in args.sizes.split(",")]:
+        flota = _flota(n)
+        df1 = generar_maestro(n, args.seed)
+        with tempfile.TemporaryDirectory(prefix="planes_") as tmp:
+            store = PlanStore(os.path.join(tmp, "planes.sqlite"), enabled=True)
+            res1, rutas1, _, _ = planificar(df1, flota)
+            plan_id = store.guardar('manual', 'dia1', res1, rutas1)
+            centros, secuencias = store.semillas(plan_id)
+
+        for solape in [float(s) for s in args.solape.split(",")]:
+            df2 = dia_siguiente(df1, n, solape, args.seed)
+            print(f"🔥 {n} pedidos/día, solape {solape:.0%}")
+            for nombre, kw in [('frío', {}), ('caliente', {'semillas': centros, 'secuencias': secuencias})]:
+                res, rutas, t_c, t_r = planificar(df2, flota, **kw)
+                km = sum(r['km'] for r in rutas)
+                servidos = len(res['accepted_df'])
+                print(f"   {nombre:<9} clustering {t_c:.3f} s | routing {t_r:.3f} s | "
+                      f"{km:,.0f} km | {servidos} pedidos servidos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Suite de benchmarks por etapa y del pipeline completo sobre datos sintéticos.
+
+Escenarios: ingesta, maestro, clustering_flota, clustering_optimo, routing y pipeline
+(LogisticsController.inicializar_sistema). Cada escenario tiene un tamaño máximo
+razonable (LIMITES); los tamaños por encima se omiten salvo --sin-limites.
+
+Uso:
+    python -m benchmarks.run_benchmarks --sizes 100,1000,10000
+    python -m benchmarks.run_benchmarks --baseline benchmarks/baseline.json   # falla si hay regresión
+    python -m benchmarks.run_benchmarks --guardar-baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import generar_dataset, escribir_csv
+
+RESULTS_DIR = "benchmarks/results"
+BASELINE_PATH = "benchmarks/baseline.json"
+
+# Tamaño máximo (nº de pedidos) por escenario con la implementación actual
+LIMITES = {
+    'ingesta': 1_000_000,
+    'maestro': 1_000_000,
+    'clustering_flota': 100_000,
+    'clustering_optimo': 2_000,
+    'routing': 100_000,
+    # La búsqueda de flota óptima deja de encontrar soluciones factibles (MAX_STOPS)
+    # con demanda muy dispersa por encima de unos cientos de pedidos
+    'pipeline': 200,
+}
+
+
+@contextlib.contextmanager
+def _silencio():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _rss_mb():
+    try:
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        return None
+
+
+def _cronometrar(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        with _silencio():
+            fn()
+        tiempos.append(time.perf_counter() - t0)
+    return min(tiempos)
+
+
+def _flota(n):
+    # Flota dimensionada al volumen: un tráiler por cada 20 pedidos (MAX_STOPS)
+    return {4: max(1, n // 20)}
+
+
+class Escenarios:
+    """Cada método recibe el tamaño y el contexto preparado y devuelve la función a medir."""
+
+    @staticmethod
+    def ingesta(n, ctx):
+        from src.etl.db_loader import DataLoader
+        return lambda: DataLoader.load_from_csv(ctx['carpeta'])
+
+    @staticmethod
+    def maestro(n, ctx):
+        from src.etl.feature import FeatureEngineering
+        return lambda: FeatureEngineering.create_master_dataset({k: v.copy() for k, v in ctx['dfs'].items()})
+
+    @staticmethod
+    def clustering_flota(n, ctx):
+        from src.models.clustering_service import ClusteringService
+        return lambda: ClusteringService(ctx['maestro']).run_user_fleet_clustering(_flota(n))
+
+    @staticmethod
+    def clustering_optimo(n, ctx):
+        from src.models.clustering_service import ClusteringService
+        return lambda: ClusteringService(ctx['maestro']).run_optimal_clustering()
+
+    @staticmethod
+    def routing(n, ctx):
+        from src.controllers.main_controller import LogisticsController
+        from src.models.clustering_service import ClusteringService
+        with _silencio():
+            df_acc = ClusteringService(ctx['maestro']).run_user_fleet_clustering(_flota(n))[0]
+        return lambda: LogisticsController._ejecutar_routing(df_acc)
+
+    @staticmethod
+    def pipeline(n, ctx):
+        from src.controllers.main_controller import LogisticsController
+        salida = os.path.join(ctx['tmp'], "salida")
+        return lambda: LogisticsController.inicializar_sistema('csv', carpeta_datos=ctx['carpeta'],
+                                                               dir_salida=salida)
+
+
+def _preparar(n, tmp, seed):
+    from src.etl.feature import FeatureEngineering
+    dfs = generar_dataset(n, seed)
+    carpeta = escribir_csv(dfs, os.path.join(tmp, "raw"))
+    with _silencio():
+        maestro = FeatureEngineering.create_master_dataset({k: v.copy() for k, v in dfs.items()})
+    return {'dfs': dfs, 'carpeta': carpeta, 'maestro': maestro, 'tmp': tmp}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def ejecutar(sizes, escenarios, repeticiones=3, seed=42, sin_limites=False):
+    from src.controllers.main_controller import LogisticsController
+    from src.utils.plan_store import PlanStore
+    from src.utils.stage_cache import StageCache
+
+    # La caché de etapas falsearía las medidas; los planes sintéticos no van al histórico
+    # real (serían la semilla del próximo arranque en caliente)
+    LogisticsController._cache = StageCache(enabled=False)
+    LogisticsController._store = PlanStore(enabled=False)
+
+    resultados = []
+    for n in sizes:
+        activos = [e for e in escenarios if sin_limites or n <= LIMITES[e]]
+        if not activos:
+            continue
+        tmp = tempfile.mkdtemp(prefix=f"bench_{n}_")
+        try:
+            ctx = _preparar(n, tmp, seed)
+            for nombre in activos:
+                fn = getattr(Escenarios, nombre)(n, ctx)
+                try:
+                    t = _cronometrar(fn, repeticiones)
+                except Exception as e:
+                    # Un escenario inviable (p.ej. sin flota óptima factible) no aborta la suite
+                    resultados.append({'escenario': nombre, 'n': n, 'error': f"{type(e).__name__}: {e}"})
+                    print(f"   {nombre:<18} n={n:<9} ❌ {type(e).__name__}: {e}")
+                    continue
+                r = {'escenario': nombre, 'n': n, 'tiempo_s': round(t, 4), 'rss_max_mb': _rss_mb()}
+                resultados.append(r)
+                print(f"   {nombre:<18} n={n:<9} {t:9.4f} s")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        'meta': {
+            'commit': _commit(),
+            'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'maquina': platform.node(),
+            'repeticiones': repeticiones,
+            'seed': seed
+        },
+        'resultados': resultados
+    }
+
+
+def comparar(actual, baseline, tolerancia=0.25, minimo_s=0.01):
+    """
+    Devuelve la lista de regresiones: escenarios cuyo tiempo supera el de la baseline
+    en más de `tolerancia` (relativo). Tiempos por debajo de minimo_s se ignoran (ruido).
+    """
+    base = {(r['escenario'], r['n']): r['tiempo_s'] for r in baseline.get('resultados', []) if 'tiempo_s' in r}
+    regresiones = []
+    for r in actual['resultados']:
+        if 'tiempo_s' not in r:
+            continue
+        ref = base.get((r['escenario'], r['n']))
+        if ref is None or max(ref, r['tiempo_s']) < minimo_s:
+            continue
+        ratio = r['tiempo_s'] / ref if ref > 0 else float('inf')
+        r['vs_baseline'] = round(ratio, 3)
+        if ratio > 1 + tolerancia:
+            regresiones.append({**r, 'baseline_s': ref})
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de IA Delivery")
+    parser.add_argument("--sizes", default="100,1000", help="Nº de pedidos, separados por comas (p.ej. 100,1000,1e6)")
+    parser.add_argument("--escenarios", default=",".join(LIMITES), help="Subconjunto de escenarios")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sin-limites", action="store_true", help="No omitir tamaños por encima de LIMITES")
+    parser.add_argument("--baseline", default=None, help="JSON de referencia para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    parser.add_argument("--guardar-baseline", action="store_true", help=f"Sobrescribe {BASELINE_PATH}")
+    parser.add_argument("--salida", default=None, help="Fichero JSON de resultados")
+    args = parser.parse_args(argv)
+
+    sizes = [int(float(s)) for s in args.sizes.split(',')]
+    escenarios = [e for e in args.escenarios.split(',') if e]
+    desconocidos = set(escenarios) - set(LIMITES)
+    if desconocidos:
+        parser.error(f"Escenarios desconocidos: {desconocidos}")
+
+    print(f"⏱️ Benchmarks: tamaños={sizes} escenarios={escenarios}")
+    res = ejecutar(sizes, escenarios, args.repeticiones, args.seed, args.sin_limites)
+
+    regresiones = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regresiones = comparar(res, json.load(f), args.tolerancia)
+        res['regresiones'] = regresiones
+
+    salida = args.salida or os.path.join(RESULTS_DIR, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(salida) or ".", exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(res, f, indent=1)
+    print(f"📄 Resultados: {salida}")
+
+    if args.guardar_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=1)
+        print(f"📌 Baseline actualizada: {BASELINE_PATH}")
+
+    if regresiones:
+        print(f"🔴 {len(regresiones)} regresiones (> {args.tolerancia:.0%}):")
+        for r in regresiones:
+            print(f"   {r['escenario']} n={r['n']}: {r['baseline_s']} s -> {r['tiempo_s']} s")
+        return 1
+    if args.baseline:
+        print("🟢 Sin regresiones respecto a la baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Generador sintético (con semilla) de las tablas de entrada con el mismo esquema
+que data/raw: Pedidos, LineasPedido, Productos, Clientes, Destinos, Provincias
+y Provincias_geo (coordenadas).
+
+Uso:
+    from benchmarks.synthetic import generar_dataset, escribir_csv
+    dfs = generar_dataset(10_000, seed=7)
+    escribir_csv(dfs, "/tmp/escenario_10k")
+
+    python -m benchmarks.synthetic --pedidos 100000 --salida /tmp/escenario_100k
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Caja aproximada de la España peninsular
+LAT_RANGE = (36.2, 43.5)
+LON_RANGE = (-8.9, 3.1)
+
+FECHA_BASE = "2025-12-05"
+
+
+def _n_destinos(n_pedidos):
+    return int(max(10, min(n_pedidos // 5, 50_000)))
+
+
+def _n_provincias(n_destinos):
+    # Las coordenadas van por provincia: un punto geográfico por destino (unos 5 pedidos
+    # por punto) para que ningún punto supere por sí solo el máximo de paradas por ruta
+    return int(max(5, min(n_destinos, 50_000)))
+
+
+def generar_dataset(n_pedidos, seed=42, lineas_por_pedido=(1, 8), fecha_base=FECHA_BASE,
+                    n_productos=200, n_clientes=None):
+    """
+    Devuelve un dict {tabla: DataFrame} listo para FeatureEngineering.create_master_dataset
+    o para escribir como CSV y pasar por DataLoader.
+    """
+    rng = np.random.default_rng(seed)
+    n_destinos = _n_destinos(n_pedidos)
+    n_prov = _n_provincias(n_destinos)
+    n_clientes = n_clientes or max(10, n_pedidos // 10)
+
+    # --- Provincias y coordenadas ---
+    prov_ids = np.array([str(i).zfill(2) for i in range(1, n_prov + 1)])
+    provincias = pd.DataFrame({
+        'ProvinciaID': prov_ids,
+        'nombre': [f"Provincia{i}" for i in range(1, n_prov + 1)],
+        'pais': 'ESP'
+    })
+    provincias_geo = provincias.copy()
+    provincias_geo['Latitud'] = rng.uniform(*LAT_RANGE, n_prov).round(6)
+    provincias_geo['Longitud'] = rng.uniform(*LON_RANGE, n_prov).round(6)
+
+    # --- Destinos ---
+    dest_prov = rng.permutation(np.arange(n_destinos) % n_prov)
+    destinos = pd.DataFrame({
+        'DestinoID': np.arange(1, n_destinos + 1),
+        'nombre_completo': [f"Destino {i}" for i in range(1, n_destinos + 1)],
+        'distancia_km': rng.uniform(20, 1100, n_destinos).round(2),
+        'coordenadas_gps': '',
+        'provinciaID': prov_ids[dest_prov]
+    })
+
+    # --- Productos ---
+    productos = pd.DataFrame({
+        'ProductoID': np.arange(1, n_productos + 1),
+        'Nombre': [f"Producto{i}" for i in range(1, n_productos + 1)],
+        'PrecioVenta': rng.uniform(5, 120, n_productos).round(2),
+        'TiempoFabricacionMedio': rng.integers(1, 11, n_productos),
+        'Caducidad': rng.integers(3, 31, n_productos)
+    })
+
+    # --- Clientes ---
+    clientes = pd.DataFrame({
+        'ClienteID': np.arange(1, n_clientes + 1),
+        'nombre': [f"Cliente{i}" for i in range(1, n_clientes + 1)],
+        'email': [f"cliente{i}@correo.com" for i in range(1, n_clientes + 1)],
+        'fecha_registro': '2020-01-01'
+    })
+
+    # --- Pedidos ---
+    base = pd.Timestamp(fecha_base)
+    pedidos = pd.DataFrame({
+        'PedidoID': np.arange(1, n_pedidos + 1),
+        'FechaPedido': (base + pd.to_timedelta(rng.integers(0, 10, n_pedidos), unit='D')).strftime('%Y-%m-%d'),
+        'ClienteID': rng.integers(1, n_clientes + 1, n_pedidos),
+        'DestinoEntregaID': rng.integers(1, n_destinos + 1, n_pedidos)
+    })
+
+    # --- Líneas de pedido ---
+    n_lineas = rng.integers(lineas_por_pedido[0], lineas_por_pedido[1] + 1, n_pedidos)
+    total = int(n_lineas.sum())
+    lineas = pd.DataFrame({
+        'LineaPedidoID': np.arange(1, total + 1),
+        'PedidoID': np.repeat(pedidos['PedidoID'].values, n_lineas),
+        'ProductoID': rng.integers(1, n_productos + 1, total),
+        'Cantidad': rng.integers(1, 61, total)
+    })
+
+    return {
+        'Pedidos': pedidos, 'LineasPedido': lineas, 'Productos': productos,
+        'Clientes': clientes, 'Destinos': destinos,
+        'Provincias': provincias, 'Provincias_geo': provincias_geo
+    }
+
+
+def generar_maestro(n_pedidos, seed=42):
+    """Atajo: dataset maestro ya construido (para medir clustering/routing sin el ETL)."""
+    from src.etl.feature import FeatureEngineering
+    import contextlib, io
+    with contextlib.redirect_stdout(io.StringIO()):
+        return FeatureEngineering.create_master_dataset(generar_dataset(n_pedidos, seed))
+
+
+def escribir_csv(dfs, carpeta):
+    os.makedirs(carpeta, exist_ok=True)
+    for nombre, df in dfs.items():
+        df.to_csv(os.path.join(carpeta, f"{nombre}.csv"), index=False)
+    return carpeta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador sintético de pedidos")
+    parser.add_argument("--pedidos", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--salida", required=True)
+    args = parser.parse_args()
+    dfs = generar_dataset(args.pedidos, args.seed)
+    escribir_csv(dfs, args.salida)
+    print(f"✅ {args.pedidos} pedidos ({len(dfs['LineasPedido'])} líneas) en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,22 @@
-from src.ui.streamlit_interface import main as streamlit_interface
+import logging
+import sys
 
 
 def main():
+    logging.basicConfig(level=logging.INFO)
+
+    # `python main.py batch ...` -> planificación headless (sin cargar Streamlit)
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from src.controllers.batch_runner import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "simular":
+        from src.controllers.simulation_runner import main as sim_main
+        sys.exit(sim_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "servir":
+        from src.controllers.plan_service import main as service_main
+        sys.exit(service_main(sys.argv[2:]))
+
+    from src.ui.streamlit_interface import main as streamlit_interface
     streamlit_interface()
 
 if __name__ == "__main__":
@@ -1,8 +1,6 @@
 import logging
-from sqlalchemy import create_engine
 
-# Configuración de logs
-logging.basicConfig(level=logging.INFO)
+# La configuración de logs (basicConfig) la hace el punto de entrada, no este módulo
 logger = logging.getLogger(__name__)
 
 class DBConfig:
@@ -22,6 +20,7 @@ class DBConfig:
 
     @classmethod
     def get_engine(db):
+        from sqlalchemy import create_engine  # solo se carga en modo SQL
         try:
             url = db.get_connection_url()
             engine = create_engine(url)
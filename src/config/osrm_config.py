@@ -0,0 +1,25 @@
+import os
+from urllib.parse import urlparse
+
+# SERVIDOR OSRM (geometría de carreteras y matrices de distancias)
+# Por defecto el servidor público de demostración; para uno local:
+#   IADELIVERY_OSRM_URL=http://localhost:5000
+OSRM_URL = os.environ.get('IADELIVERY_OSRM_URL', 'http://router.project-osrm.org').rstrip('/')
+OSRM_PROFILE = os.environ.get('IADELIVERY_OSRM_PROFILE', 'driving')
+
+# Servidor público de demostración: su política de uso no admite peticiones en paralelo
+OSRM_DEMO_HOST = 'router.project-osrm.org'
+
+# Timeout por petición (segundos) y peticiones simultáneas en un servidor propio
+OSRM_TIMEOUT = float(os.environ.get('IADELIVERY_OSRM_TIMEOUT', 2.0))
+_WORKERS_PROPIO = int(os.environ.get('IADELIVERY_OSRM_WORKERS', 8))
+
+
+def osrm_workers(url, workers=None):
+    """Peticiones simultáneas contra `url` (por defecto IADELIVERY_OSRM_WORKERS); 1 en el de demostración."""
+    if (urlparse(url).hostname or '').lower() == OSRM_DEMO_HOST:
+        return 1
+    return max(1, int(_WORKERS_PROPIO if workers is None else workers))
+
+
+OSRM_WORKERS = osrm_workers(OSRM_URL)
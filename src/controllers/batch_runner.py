@@ -0,0 +1,244 @@
+"""
+Planificación headless (sin Streamlit/folium/plotly) para servidores batch.
+
+Ejemplos:
+    python main.py batch --carpeta data/raw --fecha 2025-12-15 --fecha 2025-12-16
+    python -m src.controllers.batch_runner --carpeta dia1/ --carpeta dia2/ --workers 4 --flota 1=2,3=1
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.controllers.main_controller import LogisticsController
+from src.config.fleet_config import SIMULATION_START_DATE
+from src.utils.instrumentation import export_json, export_prometheus
+from src.utils import profiling
+
+OUTPUT_BATCH = "data/batch"
+
+# Columnas de cada parada que se exportan en rutas.json
+STOP_COLUMNS = ['PedidoID', 'nombre_completo', 'Latitud', 'Longitud', 'Peso_Total_Kg', 'Fecha_Limite_Entrega']
+
+
+def _json_default(obj):
+    if hasattr(obj, 'item'): return obj.item()          # escalares numpy
+    if hasattr(obj, 'isoformat'): return obj.isoformat()  # Timestamp / datetime
+    return str(obj)
+
+
+class BatchRunner:
+
+    @staticmethod
+    def serializar_rutas(rutas):
+        """Convierte la salida de _ejecutar_routing en una estructura JSON."""
+        out = []
+        for r in rutas or []:
+            paradas = r['ruta'].registros(STOP_COLUMNS) if r.get('ruta') else []
+            out.append({
+                'cluster_id': r.get('cluster_id'),
+                'vehiculo': r.get('vehiculo'),
+                'carga': r.get('carga'),
+                'km': r.get('km'),
+                'coste': r.get('coste'),
+                'paradas': paradas
+            })
+        return out
+
+    @staticmethod
+    def serializar_resultado(res):
+        """Resultado completo del controlador -> dict JSON-serializable (sin DataFrames)."""
+        if res.get('status') != 'success':
+            return {'status': res.get('status'), 'msg': res.get('msg')}
+        clustering = res.get('clustering', {})
+        acc = clustering.get('accepted_df')
+        disc = clustering.get('discarded_df')
+        return {
+            'status': 'success',
+            'plan_id': res.get('plan_id'),
+            'optimizacion': res.get('optimizacion'),
+            'reparacion': res.get('reparacion'),
+            'fleet_used': {str(k): int(v) for k, v in (res.get('fleet_used') or {}).items()},
+            'metrics': clustering.get('metrics', {}),
+            'details': clustering.get('details', []),
+            'pedidos_entregados': 0 if acc is None else len(acc),
+            'pedidos_descartados': 0 if disc is None else len(disc),
+            'descartes': [] if disc is None or disc.empty else disc['PedidoID'].tolist(),
+            'rutas': BatchRunner.serializar_rutas(res.get('rutas'))
+        }
+
+    @staticmethod
+    def _nombre_ejecucion(carpeta, fecha):
+        """'<carpeta>_<hash de la ruta absoluta>_<fecha>': a/raw y b/raw no comparten directorio."""
+        ruta = os.path.abspath(carpeta)
+        base = os.path.basename(ruta) or "raw"
+        huella = hashlib.sha1(ruta.encode()).hexdigest()[:6]
+        return f"{base}_{huella}_{pd.to_datetime(fecha):%Y%m%d}"
+
+    @staticmethod
+    def planificar(carpeta, fecha, salida, flota=None, warm_start=None, lns=None, reparar=None):
+        """
+        Ejecuta una planificación completa y escribe en `salida`:
+        rutas.json, metricas.json, aceptados.parquet, descartes.parquet, log.txt
+        y la instrumentación por etapa (perf.json, perf.prom).
+        warm_start: arrancar desde el último plan del histórico (ver PlanStore).
+        lns: segundos de optimización entre rutas (ver PlanOptimizer).
+        reparar: reinsertar los descartes en las rutas al final (ver PlanRepair).
+        Pensado para ejecutarse en un proceso del pool.
+        """
+        os.makedirs(salida, exist_ok=True)
+        t0 = time.perf_counter()
+        with open(os.path.join(salida, "log.txt"), "w", encoding="utf-8") as log, \
+                contextlib.redirect_stdout(log):
+            res = LogisticsController.inicializar_sistema('csv', carpeta_datos=carpeta,
+                                                          fecha_inicio=fecha, dir_salida=salida,
+                                                          warm_start=warm_start, lns=0 if flota else lns,
+                                                          reparar=False if flota else reparar)
+            coste_optimo = None
+            perf = list(res.get('perf', []))
+            if res['status'] == 'success':
+                coste_optimo = res['clustering']['metrics'].get('cost')
+                if flota:
+                    res = LogisticsController.recalcular_con_flota_manual(flota, fecha_inicio=fecha,
+                                                                          dir_salida=salida,
+                                                                          warm_start=warm_start, lns=lns,
+                                                                          reparar=reparar)
+                    perf += res.get('perf', [])
+
+        export_json(perf, os.path.join(salida, "perf.json"))
+        export_prometheus(perf, os.path.join(salida, "perf.prom"))
+
+        resumen = {
+            'carpeta': carpeta,
+            'fecha': str(fecha),
+            'salida': salida,
+            'status': res['status'],
+            'tiempo_s': round(time.perf_counter() - t0, 3)
+        }
+        if res['status'] != 'success':
+            resumen['msg'] = res.get('msg')
+            return resumen
+
+        data = BatchRunner.serializar_resultado(res)
+        clustering = res['clustering']
+        metricas = {
+            **resumen,
+            'plan_id': data['plan_id'],
+            'coste': data['metrics'].get('cost'),
+            'coste_optimo': coste_optimo,
+            'flota': data['fleet_used'],
+            'n_rutas': len(data['rutas']),
+            'pedidos_entregados': data['pedidos_entregados'],
+            'pedidos_descartados': data['pedidos_descartados'],
+            'optimizacion': data['optimizacion'],
+            'reparacion': data['reparacion'],
+            'detalle': data['details']
+        }
+
+        with open(os.path.join(salida, "rutas.json"), "w", encoding="utf-8") as f:
+            json.dump(data['rutas'], f, ensure_ascii=False, indent=1, default=_json_default)
+        with open(os.path.join(salida, "metricas.json"), "w", encoding="utf-8") as f:
+            json.dump(metricas, f, ensure_ascii=False, indent=1, default=_json_default)
+        for nombre, df in [("aceptados", clustering.get('accepted_df')), ("descartes", clustering.get('discarded_df'))]:
+            if df is not None:
+                df.reset_index(drop=True).to_parquet(os.path.join(salida, f"{nombre}.parquet"), index=False)
+
+        resumen.update({k: metricas[k] for k in ['plan_id', 'coste', 'coste_optimo', 'n_rutas',
+                                                 'pedidos_entregados', 'pedidos_descartados']})
+        return resumen
+
+    @staticmethod
+    def ejecutar_lote(carpetas, fechas, salida=OUTPUT_BATCH, workers=None, flota=None, warm_start=None, lns=None,
+                      reparar=None):
+        """
+        Planifica el producto carpetas x fechas. Cada ejecución es independiente
+        y va a su propio directorio, así que se reparten en un pool de procesos.
+        """
+        trabajos = []
+        for carpeta in carpetas:
+            for fecha in fechas:
+                destino = os.path.join(salida, BatchRunner._nombre_ejecucion(carpeta, fecha))
+                if any(t[2] == destino for t in trabajos):
+                    raise ValueError(f"Ejecución repetida: {carpeta} @ {fecha} (mismo directorio {destino})")
+                trabajos.append((carpeta, fecha, destino, flota, warm_start, lns, reparar))
+
+        resultados = []
+        if workers == 1 or len(trabajos) == 1:
+            for t in trabajos:
+                resultados.append(BatchRunner.planificar(*t))
+                print(f"   ✅ {resultados[-1]['salida']} ({resultados[-1]['status']})")
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(BatchRunner.planificar, *t): t for t in trabajos}
+                for fut in as_completed(futures):
+                    carpeta, fecha, destino = futures[fut][:3]
+                    try:
+                        r = fut.result()
+                    except Exception as e:
+                        r = {'carpeta': carpeta, 'fecha': str(fecha), 'salida': destino,
+                             'status': 'error', 'msg': str(e)}
+                    resultados.append(r)
+                    print(f"   ✅ {r['salida']} ({r['status']})")
+
+        resultados.sort(key=lambda r: (r['carpeta'], r['fecha']))
+        os.makedirs(salida, exist_ok=True)
+        with open(os.path.join(salida, "resumen.json"), "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=1, default=_json_default)
+        return resultados
+
+
+def _parse_flota(texto):
+    """'1=2,3=1' -> {1: 2, 3: 1}"""
+    if not texto: return None
+    flota = {}
+    for par in texto.split(','):
+        vid, n = par.split('=')
+        flota[int(vid)] = int(n)
+    return flota
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Planificación logística headless (batch)")
+    parser.add_argument("--carpeta", action="append", help="Carpeta de CSVs de entrada (repetible)")
+    parser.add_argument("--fecha", action="append", help="Fecha de inicio de simulación (repetible)")
+    parser.add_argument("--salida", default=OUTPUT_BATCH, help="Directorio raíz de resultados")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo")
+    parser.add_argument("--flota", default=None, help="Flota manual, p.ej. 1=2,3=1 (por defecto la óptima)")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="Arranca cada planificación desde el último plan guardado (histórico de planes)")
+    parser.add_argument("--lns", type=float, default=None, metavar="SEGUNDOS",
+                        help="Segundos de optimización entre rutas tras el routing (por defecto IADELIVERY_LNS_SEGUNDOS)")
+    parser.add_argument("--reparar", action="store_true",
+                        help="Reinserta los pedidos descartados en las rutas al final (por defecto IADELIVERY_REPARAR)")
+    parser.add_argument("--profile", nargs="?", const=profiling.PROFILE_DIR, default=None, metavar="DIR",
+                        help=f"Perfila cada etapa (cProfile + tracemalloc) en DIR (por defecto {profiling.PROFILE_DIR})")
+    args = parser.parse_args(argv)
+
+    if args.profile: profiling.enable(args.profile)
+
+    carpetas = args.carpeta or ["data/raw"]
+    fechas = args.fecha or [SIMULATION_START_DATE]
+
+    print(f"🚛 Planificando {len(carpetas) * len(fechas)} ejecuciones -> {args.salida}")
+    try:
+        resultados = BatchRunner.ejecutar_lote(carpetas, fechas, args.salida, args.workers, _parse_flota(args.flota),
+                                               args.warm_start or None, args.lns, args.reparar or None)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    errores = [r for r in resultados if r['status'] != 'success']
+    for r in errores:
+        print(f"❌ {r['carpeta']} @ {r['fecha']}: {r.get('msg')}")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
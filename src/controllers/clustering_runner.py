@@ -4,43 +4,45 @@ from src.models.clustering_service import ClusteringService
 from src.config.fleet_config import FLEET_CONFIG
 
 # Rutas de salida
-OUTPUT_CLUSTERED = "data/processed/dataset_clustered.csv"
-OUTPUT_DISCARDED = "data/processed/pedidos_descartados.csv"
+OUTPUT_DIR = "data/processed"
+OUTPUT_CLUSTERED = "dataset_clustered.csv"
+OUTPUT_DISCARDED = "pedidos_descartados.csv"
 
 class ClusteringRunner:
     
     @staticmethod
-    def _limpiar_archivos():
+    def _limpiar_archivos(output_dir=OUTPUT_DIR):
         for f in [OUTPUT_CLUSTERED, OUTPUT_DISCARDED]:
-            if os.path.exists(f):
-                try: os.remove(f)
+            path = os.path.join(output_dir, f)
+            if os.path.exists(path):
+                try: os.remove(path)
                 except: pass
 
     @staticmethod
-    def _guardar_resultados(df_accepted, df_discarded):
+    def _guardar_resultados(df_accepted, df_discarded, output_dir=OUTPUT_DIR):
         """Helper para guardar CSVs"""
-        os.makedirs(os.path.dirname(OUTPUT_CLUSTERED), exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
         cols_export = ['PedidoID', 'cluster_id', 'tipoVehiculo_id', 'vehiculo_nombre', 
                        'Latitud', 'Longitud', 'Peso_Total_Kg', 'Fecha_Limite_Entrega']
         final_cols = [c for c in cols_export if c in df_accepted.columns]
         
         if not df_accepted.empty:
-            df_accepted[final_cols].to_csv(OUTPUT_CLUSTERED, index=False)
+            df_accepted[final_cols].to_csv(os.path.join(output_dir, OUTPUT_CLUSTERED), index=False)
         
         if not df_discarded.empty:
-            df_discarded.to_csv(OUTPUT_DISCARDED, index=False)
+            df_discarded.to_csv(os.path.join(output_dir, OUTPUT_DISCARDED), index=False)
 
     @staticmethod
-    def run_manual_fleet_analysis(df_maestro, user_fleet_config):
+    def run_manual_fleet_analysis(df_maestro, user_fleet_config, output_dir=OUTPUT_DIR, semillas=None):
         """MODO MANUAL: El usuario dice qué flota tiene."""
-        ClusteringRunner._limpiar_archivos()
-        service = ClusteringService(df_maestro)
+        ClusteringRunner._limpiar_archivos(output_dir)
+        service = ClusteringService(df_maestro, semillas=semillas)
         
         # 1. Ejecutamos con la flota impuesta
         df_acc, df_disc, cost, details = service.run_user_fleet_clustering(user_fleet_config)
         
         # 2. Guardamos y Retornamos
-        ClusteringRunner._guardar_resultados(df_acc, df_disc)
+        ClusteringRunner._guardar_resultados(df_acc, df_disc, output_dir)
         
         return {
             "mode": "manual",
@@ -52,15 +54,15 @@ class ClusteringRunner:
         }
 
     @staticmethod
-    def run_automatic_optimal_solution(df_maestro):
+    def run_automatic_optimal_solution(df_maestro, output_dir=OUTPUT_DIR, semillas=None):
         """
         MODO AUTOMÁTICO:
         1. La IA calcula la flota ideal teórica.
         2. Convertimos esa recomendación en una configuración de flota real.
         3. Ejecutamos el clustering normal con esa flota 'perfecta' para generar las rutas.
         """
-        ClusteringRunner._limpiar_archivos()
-        service = ClusteringService(df_maestro)
+        ClusteringRunner._limpiar_archivos(output_dir)
+        service = ClusteringService(df_maestro, semillas=semillas)
         
         print("[INFO] 🧠 Calculando Flota Óptima Automática...")
         
@@ -87,7 +89,7 @@ class ClusteringRunner:
         df_acc, df_disc, cost, details = service.run_user_fleet_clustering(optimal_fleet_config)
         
         # 4. Guardamos
-        ClusteringRunner._guardar_resultados(df_acc, df_disc)
+        ClusteringRunner._guardar_resultados(df_acc, df_disc, output_dir)
         
         return {
             "mode": "optimal",
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import sys
 import os
 
@@ -6,133 +7,552 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 from src.etl.db_loader import DataLoader
 from src.etl.feature import FeatureEngineering
-from src.controllers.clustering_runner import ClusteringRunner
+from src.controllers.clustering_runner import ClusteringRunner, OUTPUT_DIR
 from src.models.routing import RouteSolver
+from src.models.route_result import RouteResult
+from src.models.clustering_service import ClusteringService
+from src.models.plan_optimizer import PlanOptimizer, LNS_BUDGET
+from src.models.plan_repair import PlanRepair, REPAIR_ENABLED
+from src.models.distance_provider import proveedor_distancias
 from src.config.fleet_config import FLEET_CONFIG, SIMULATION_START_DATE
+from src.utils.stage_cache import StageCache
+from src.utils.plan_store import PlanStore, WARM_START, clave_destino, elegir_secuencia
+from src.utils.instrumentation import recorded, traced, span, count
+from src.utils.shared_data import DatosCompartidos, pool_procesos
+
+MASTER_FILE = "dataset_master.csv"
 
 class LogisticsController:
-    
+
+    _cache = None
+    _store = None
+
+    @staticmethod
+    def _get_cache():
+        if LogisticsController._cache is None:
+            LogisticsController._cache = StageCache()
+        return LogisticsController._cache
+
+    @staticmethod
+    def _get_store():
+        if LogisticsController._store is None:
+            LogisticsController._store = PlanStore()
+        return LogisticsController._store
+
+    @staticmethod
+    def _semillas(df_maestro, warm_start=None):
+        """
+        Arranque en caliente desde el último plan guardado que comparte destinos con
+        df_maestro: (plan_id, centroides para el KMeans, secuencias de destinos para el solver).
+        """
+        if not (WARM_START if warm_start is None else warm_start):
+            return None, None, None
+        store = LogisticsController._get_store()
+        plan_id = store.ultimo(clave_destino(df_maestro['Latitud'].to_numpy(), df_maestro['Longitud'].to_numpy()))
+        if plan_id is None:
+            print("   🧊 Sin plan previo con destinos en común: arranque en frío")
+            return None, None, None
+        print(f"   🔥 Arranque en caliente desde el plan #{plan_id}")
+        centros, secuencias = store.semillas(plan_id)
+        return plan_id, centros, secuencias
+
+    @staticmethod
+    def _registrar_plan(modo, fecha_inicio, res_clustering, rutas, plan_previo=None):
+        """Guarda el plan en el histórico (PlanStore). Un fallo aquí no invalida la planificación."""
+        try:
+            return LogisticsController._get_store().guardar(modo, fecha_inicio or SIMULATION_START_DATE,
+                                                            res_clustering, rutas, plan_previo)
+        except Exception as e:
+            print(f"[WARN] No se pudo guardar el plan en el histórico: {e}")
+            return None
+
+    @staticmethod
+    def _actualizar_costes(res_clustering, rutas_antes, rutas):
+        """
+        metrics['cost'] y details al día tras cambiar las rutas (LNS, reparación): carga y
+        paradas de cada cluster salen de la tabla final y su coste es la estimación del
+        clustering más la variación real de € en km de su ruta (el fijo por viaje no cambia).
+        """
+        details = res_clustering.get('details')
+        tabla = res_clustering['accepted_df']
+        if not isinstance(details, list) or tabla is None or tabla.empty:
+            return res_clustering
+        km_antes = {r['cluster_id']: r['km'] for r in rutas_antes}
+        km_final = {r['cluster_id']: r['km'] for r in rutas}
+        g = tabla.groupby('cluster_id')
+        peso, paradas, tipo = g['Peso_Total_Kg'].sum(), g.size(), g['tipoVehiculo_id'].first()
+
+        nuevos, delta_total = [], 0.0
+        for d in details:
+            cid = d['cluster_id']
+            delta = 0.0
+            if cid in tipo.index:
+                eur_km = FLEET_CONFIG[int(tipo[cid])]['coste_variable_por_km']
+                delta = (km_final.get(cid, 0.0) - km_antes.get(cid, 0.0)) * eur_km
+            delta_total += delta
+            nuevos.append({**d, 'peso': float(peso.get(cid, 0.0)), 'paradas': int(paradas.get(cid, 0)),
+                           'coste': d['coste'] + delta})
+        metrics = {**res_clustering.get('metrics', {})}
+        metrics['cost'] = metrics.get('cost', 0.0) + delta_total
+        return {**res_clustering, 'metrics': metrics, 'details': nuevos}
+
+    @staticmethod
+    def _optimizar_plan(res_clustering, rutas, fecha_inicio=None, lns=None, dir_salida=OUTPUT_DIR, progreso=None):
+        """
+        Búsqueda LNS entre rutas (PlanOptimizer) durante `lns` segundos
+        (por defecto IADELIVERY_LNS_SEGUNDOS; 0 = no se optimiza).
+        Retorna (res_clustering, rutas, estadísticas o None). Si algún pedido cambia de
+        ruta, accepted_df pasa a ser la tabla con su nuevo cluster y vehículo.
+        """
+        lns = LNS_BUDGET if lns is None else float(lns)
+        if lns <= 0 or not rutas:
+            return res_clustering, rutas, None
+        print(f"\n🔁 Optimizando el plan entre rutas ({lns:g} s)...")
+        tabla, rutas_antes = res_clustering["accepted_df"], rutas
+        rutas, tabla_final, stats = PlanOptimizer(tabla, rutas, fecha_inicio).optimizar(lns, progreso=progreso)
+        if tabla_final is not tabla:
+            res_clustering = {**res_clustering, "accepted_df": tabla_final}
+            ClusteringRunner._guardar_resultados(tabla_final, res_clustering["discarded_df"], dir_salida)
+        res_clustering = LogisticsController._actualizar_costes(res_clustering, rutas_antes, rutas)
+        print(f"   ✅ {stats['coste_km_inicial']:,.0f} € -> {stats['coste_km_final']:,.0f} € en km, "
+              f"{stats['pedidos_movidos']} pedidos cambian de ruta ({stats['iteraciones']} iteraciones)")
+        return res_clustering, rutas, stats
+
+    @staticmethod
+    def _reparar_plan(res_clustering, rutas, fecha_inicio=None, reparar=None, dir_salida=OUTPUT_DIR, progreso=None):
+        """
+        Reinserción rápida de descartes y backlog en las rutas ya calculadas (PlanRepair)
+        si `reparar` (por defecto IADELIVERY_REPARAR). Retorna (res_clustering, rutas,
+        estadísticas o None). Los pedidos reinsertados pasan de discarded_df a accepted_df.
+        """
+        reparar = REPAIR_ENABLED if reparar is None else bool(reparar)
+        if not reparar or not rutas:
+            return res_clustering, rutas, None
+        print("\n🩹 Reinsertando pedidos descartados en las rutas...")
+        tabla, rutas_antes = res_clustering["accepted_df"], rutas
+        rutas, tabla_final, descartados, stats = PlanRepair(tabla, rutas, res_clustering["discarded_df"],
+                                                             fecha_inicio).reparar(progreso)
+        if tabla_final is not tabla:
+            res_clustering = {**res_clustering, "accepted_df": tabla_final, "discarded_df": descartados}
+            res_clustering = LogisticsController._actualizar_costes(res_clustering, rutas_antes, rutas)
+            ClusteringRunner._limpiar_archivos(dir_salida)
+            ClusteringRunner._guardar_resultados(tabla_final, descartados, dir_salida)
+        print(f"   ✅ {stats['reinsertados']}/{stats['pendientes']} pedidos reinsertados en "
+              f"{stats['segundos'] * 1000:.0f} ms ({len(stats['no_colocados'])} sin hueco)")
+        return res_clustering, rutas, stats
+
+    @staticmethod
+    def _cerrar_plan(modo, res_clustering, rutas, fecha_inicio, lns, reparar, dir_salida, progreso, plan_previo):
+        """
+        Etapas finales comunes a las planificaciones: LNS, reparación de descartes y registro
+        en el histórico. Cada etapa avisa a `progreso` (punto de cancelación de PlanningJob):
+        un trabajo cancelado no llega a guardar resultados ni a registrar su plan.
+        Retorna (res_clustering, rutas, optimizacion, reparacion, plan_id).
+        """
+        progreso(0.99, "Optimizando el plan...")
+        res_clustering, rutas, optimizacion = LogisticsController._optimizar_plan(
+            res_clustering, rutas, fecha_inicio, lns, dir_salida, LogisticsController._tramo(progreso, 0.99, 0.995))
+        progreso(0.995, "Reinsertando descartes...")
+        res_clustering, rutas, reparacion = LogisticsController._reparar_plan(
+            res_clustering, rutas, fecha_inicio, reparar, dir_salida, LogisticsController._tramo(progreso, 0.995, 0.999))
+        progreso(0.999, "Guardando el plan...")
+        plan_id = LogisticsController._registrar_plan(modo, fecha_inicio, res_clustering, rutas, plan_previo)
+        return res_clustering, rutas, optimizacion, reparacion, plan_id
+
+    @staticmethod
+    def reparar_descartes(res, fecha_inicio=None, dir_salida=OUTPUT_DIR):
+        """
+        Reinserta los descartes de un resultado ya calculado (p.ej. el del dashboard) sin
+        replanificar. Retorna el resultado con clustering y rutas al día y "reparacion".
+        """
+        if res.get('status') != 'success':
+            return res
+        res_clustering, rutas, reparacion = LogisticsController._reparar_plan(res['clustering'], res['rutas'],
+                                                                             fecha_inicio, True, dir_salida)
+        plan_id = res.get('plan_id')
+        if reparacion and reparacion['reinsertados']:
+            plan_id = LogisticsController._registrar_plan('reparacion', fecha_inicio, res_clustering, rutas,
+                                                          res.get('plan_id'))
+        return {**res, "clustering": res_clustering, "rutas": rutas, "plan_id": plan_id, "reparacion": reparacion}
+
+    @staticmethod
+    def _tramo(progreso, inicio, fin):
+        """Adapta un callback de progreso para que una sub-etapa informe de 0 a 1 dentro de [inicio, fin]."""
+        if progreso is None: return None
+        return lambda f, msg: progreso(inicio + (fin - inicio) * f, msg)
+
+    @staticmethod
+    def _hash_entrada(modo_carga, archivos_usuario, carpeta="data/raw"):
+        """
+        Clave de la carga antes de leer nada (CSV y subida manual).
+        En modo SQL no se conoce hasta haber leído las tablas -> None.
+        """
+        geo_interno = "data/raw/Provincias_geo.csv"
+        if modo_carga == 'manual_upload':
+            return StageCache.hash_inputs('manual', archivos_usuario, StageCache.hash_files([geo_interno]))
+        if modo_carga == 'sql':
+            return None
+        paths = [os.path.join(carpeta, f) for f in DataLoader.CSV_FILES.values()]
+        return StageCache.hash_inputs('csv', StageCache.hash_files(paths))
+
+    @staticmethod
+    @traced('clustering')
+    def _clustering_cacheado(df_maestro, user_fleet=None, dir_salida=OUTPUT_DIR, semillas=None):
+        """Clustering (óptimo o con flota manual) memoizado por maestro + configuración (+ semillas)."""
+        cache = LogisticsController._get_cache()
+        modo = 'manual' if user_fleet is not None else 'optimal'
+        key = StageCache.hash_inputs('clustering', modo, df_maestro, user_fleet,
+                                     FLEET_CONFIG, ClusteringService.MAX_STOPS, ClusteringService.ASIGNACION,
+                                     proveedor_distancias().clave(), semillas)
+        count('pedidos', len(df_maestro))
+        hit, res = cache.get('clustering', key)
+        if hit:
+            print(f"   ♻️ Clustering ({modo}) recuperado de caché.")
+            count('cache_hit')
+            ClusteringRunner._limpiar_archivos(dir_salida)
+            ClusteringRunner._guardar_resultados(res["accepted_df"], res["discarded_df"], dir_salida)
+            return res
+
+        if user_fleet is not None:
+            res = ClusteringRunner.run_manual_fleet_analysis(df_maestro, user_fleet, dir_salida, semillas)
+        else:
+            res = ClusteringRunner.run_automatic_optimal_solution(df_maestro, dir_salida, semillas)
+        cache.put('clustering', key, res)
+        return res
+
+    @staticmethod
+    @traced('datos')
+    def obtener_dataset_maestro(modo_carga, archivos_usuario=None, carpeta_datos="data/raw"):
+        """
+        Etapas 1 (Carga) y 2 (Feature Engineering), memoizadas.
+        Retorna: (df_maestro, mensaje_error)
+        """
+        cache = LogisticsController._get_cache()
+
+        if modo_carga == 'manual_upload' and not archivos_usuario:
+            return None, "No se recibieron archivos para cargar."
+
+        # 0. ¿Tenemos ya el maestro de estas mismas entradas?
+        input_key = LogisticsController._hash_entrada(modo_carga, archivos_usuario, carpeta_datos)
+        master_key = StageCache.hash_inputs('master', input_key) if input_key else None
+        hit, df_maestro = cache.get('master', master_key)
+
+        if hit:
+            print("   ♻️ Dataset Maestro recuperado de caché (entradas sin cambios).")
+            count('cache_hit')
+        else:
+            # 1. CARGA DE DATOS
+            dfs_raw = None
+
+            if modo_carga == 'manual_upload':
+                dfs_raw = DataLoader.load_manual_buffers(archivos_usuario)
+
+            elif modo_carga == 'sql':
+                dfs_raw = DataLoader.load_from_sql()
+
+            else:
+                dfs_raw = DataLoader.load_from_csv(carpeta_datos)
+
+            if not dfs_raw:
+                return None, "Fallo crítico en la carga de datos."
+
+            if master_key is None:
+                master_key = StageCache.hash_inputs('master', dfs_raw)
+                hit, df_maestro = cache.get('master', master_key)
+
+            # 2. FEATURE ENGINEERING
+            if not hit:
+                df_maestro = FeatureEngineering.create_master_dataset(dfs_raw)
+                if df_maestro is None or df_maestro.empty:
+                    return None, "Error generando Dataset Maestro (revisa los CSVs)."
+                # No cacheamos un maestro con coordenadas pendientes (geocoding fallido)
+                if df_maestro['Latitud'].notna().all():
+                    cache.put('master', master_key, df_maestro)
+
+        return df_maestro, None
+
     @staticmethod
-    def inicializar_sistema(modo_carga, archivos_usuario=None):
+    @recorded('pipeline')
+    def inicializar_sistema(modo_carga, archivos_usuario=None, carpeta_datos="data/raw",
+                            fecha_inicio=None, dir_salida=OUTPUT_DIR, progreso=None, warm_start=None, lns=None,
+                            reparar=None):
         """
         Orquesta TODO el flujo inicial:
         1. Carga (SQL/CSV/Manual)
         2. Feature Engineering
         3. Clustering Automático (IA)
         4. Routing Automático
+        Cada etapa se memoiza en disco (StageCache): si sus entradas no cambian, no se recalcula.
+        fecha_inicio (por defecto SIMULATION_START_DATE) y dir_salida permiten lanzar
+        varias planificaciones independientes (ver BatchRunner).
+        progreso: callback opcional progreso(fraccion, mensaje) (ver PlanningJob).
+        warm_start: arrancar desde el último plan guardado (por defecto IADELIVERY_WARM_START).
+        lns: segundos de optimización entre rutas (por defecto IADELIVERY_LNS_SEGUNDOS).
+        reparar: reinsertar los descartes en las rutas al final (por defecto IADELIVERY_REPARAR).
         """
+        progreso = progreso or (lambda f, msg: None)
         print("\n" + "="*50)
         print("INICIANDO SISTEMA DE LOGÍSTICA")
         print("="*50)
-        
-        # 1. CARGA DE DATOS
-        dfs_raw = None
-        
-        if modo_carga == 'manual_upload':
-            if not archivos_usuario:
-                return {"status": "error", "msg": "No se recibieron archivos para cargar."}
-            dfs_raw = DataLoader.load_manual_buffers(archivos_usuario)
-            
-        elif modo_carga == 'sql':
-            dfs_raw = DataLoader.load_from_sql()
-            
-        else:
-            dfs_raw = DataLoader.load_from_csv()
-            
-        if not dfs_raw:
-            return {"status": "error", "msg": "Fallo crítico en la carga de datos."}
 
-        # 2. FEATURE ENGINEERING
-        df_maestro = FeatureEngineering.create_master_dataset(dfs_raw)
-        if df_maestro is None or df_maestro.empty:
-            return {"status": "error", "msg": "Error generando Dataset Maestro (revisa los CSVs)."}
-        
+        progreso(0.05, "Cargando datos y generando Dataset Maestro...")
+        df_maestro, error = LogisticsController.obtener_dataset_maestro(modo_carga, archivos_usuario, carpeta_datos)
+        if error:
+            return {"status": "error", "msg": error}
+
         # Guardamos backup procesado
-        os.makedirs("data/processed", exist_ok=True)
-        df_maestro.to_csv("data/processed/dataset_master.csv", index=False)
+        os.makedirs(dir_salida, exist_ok=True)
+        df_maestro.to_csv(os.path.join(dir_salida, MASTER_FILE), index=False)
 
         # 3. CLUSTERING AUTOMÁTICO (SOLUCIÓN ÓPTIMA)
         print("\n🤖 Calculando Flota Óptima (K-Means)...")
-        res_clustering = ClusteringRunner.run_automatic_optimal_solution(df_maestro)
+        progreso(0.35, f"Calculando flota óptima ({len(df_maestro)} pedidos)...")
+        plan_previo, centros, secuencias = LogisticsController._semillas(df_maestro, warm_start)
+        res_clustering = LogisticsController._clustering_cacheado(df_maestro, dir_salida=dir_salida, semillas=centros)
         
         # 4. ROUTING AUTOMÁTICO
         print("\nGenerando Rutas GPS...")
-        rutas_gps = LogisticsController._ejecutar_routing(res_clustering["accepted_df"])
+        rutas_gps = LogisticsController._ejecutar_routing(res_clustering["accepted_df"], fecha_inicio,
+                                                          LogisticsController._tramo(progreso, 0.6, 0.99),
+                                                          secuencias)
+        res_clustering, rutas_gps, optimizacion, reparacion, plan_id = LogisticsController._cerrar_plan(
+            'optimal', res_clustering, rutas_gps, fecha_inicio, lns, reparar, dir_salida, progreso, plan_previo)
+        progreso(1.0, "¡Completado!")
         
         return {
             "status": "success",
             "clustering": res_clustering,
             "rutas": rutas_gps,
-            "fleet_used": res_clustering['fleet_used']
+            "fleet_used": res_clustering['fleet_used'],
+            "plan_id": plan_id,
+            "optimizacion": optimizacion,
+            "reparacion": reparacion
         }
 
     @staticmethod
-    def recalcular_con_flota_manual(user_fleet):
+    @recorded('recalculo')
+    def recalcular_con_flota_manual(user_fleet, fecha_inicio=None, dir_salida=OUTPUT_DIR, progreso=None,
+                                    warm_start=None, lns=None, reparar=None):
         """
         Se llama desde la interfaz cuando el usuario mueve los sliders de flota.
         """
+        progreso = progreso or (lambda f, msg: None)
         print(f"\nRECALCULO MANUAL: Flota {user_fleet}")
         
         # Cargamos el dataset maestro (ya generado en el inicio)
-        path = "data/processed/dataset_master.csv"
+        path = os.path.join(dir_salida, MASTER_FILE)
         if not os.path.exists(path):
             return {"status": "error", "msg": "Faltan datos procesados. Reinicia la app."}
             
+        progreso(0.05, "Cargando Dataset Maestro...")
         df_maestro = pd.read_csv(path)
         
         # Clustering Manual
-        res_clustering = ClusteringRunner.run_manual_fleet_analysis(df_maestro, user_fleet)
+        progreso(0.15, "Asignando pedidos a la flota...")
+        plan_previo, centros, secuencias = LogisticsController._semillas(df_maestro, warm_start)
+        res_clustering = LogisticsController._clustering_cacheado(df_maestro, user_fleet, dir_salida, centros)
         
         # Routing (Solo de lo que ha entrado en la flota)
-        rutas = LogisticsController._ejecutar_routing(res_clustering["accepted_df"])
+        rutas = LogisticsController._ejecutar_routing(res_clustering["accepted_df"], fecha_inicio,
+                                                      LogisticsController._tramo(progreso, 0.4, 0.99),
+                                                      secuencias)
+        res_clustering, rutas, optimizacion, reparacion, plan_id = LogisticsController._cerrar_plan(
+            'manual', res_clustering, rutas, fecha_inicio, lns, reparar, dir_salida, progreso, plan_previo)
+        progreso(1.0, "¡Completado!")
         
         return {
             "status": "success",
             "clustering": res_clustering,
             "rutas": rutas,
-            "fleet_used": user_fleet
+            "fleet_used": user_fleet,
+            "plan_id": plan_id,
+            "optimizacion": optimizacion,
+            "reparacion": reparacion
+        }
+
+    @staticmethod
+    @recorded('insercion')
+    def insertar_pedidos(pedidos, modo_carga='csv', archivos_usuario=None, carpeta_datos="data/raw",
+                         fecha_inicio=None, user_fleet=None, dir_salida=OUTPUT_DIR, progreso=None,
+                         warm_start=None, lns=None, reparar=None):
+        """
+        Replanifica tras añadir pedidos nuevos al dataset maestro.
+        pedidos: lista de dicts con al menos PedidoID, Latitud, Longitud, Peso_Total_Kg
+        y Fecha_Limite_Entrega. Con user_fleet se usa esa flota; si no, la óptima.
+        """
+        progreso = progreso or (lambda f, msg: None)
+        obligatorias = ['PedidoID', 'Latitud', 'Longitud', 'Peso_Total_Kg', 'Fecha_Limite_Entrega']
+        nuevos = pd.DataFrame(list(pedidos or []))
+        if nuevos.empty:
+            return {"status": "error", "msg": "No se indicó ningún pedido."}
+        faltan = [c for c in obligatorias if c not in nuevos.columns or nuevos[c].isna().any()]
+        if faltan:
+            return {"status": "error", "msg": f"Faltan campos en los pedidos: {', '.join(faltan)}"}
+
+        progreso(0.05, "Cargando Dataset Maestro...")
+        df_maestro, error = LogisticsController.obtener_dataset_maestro(modo_carga, archivos_usuario, carpeta_datos)
+        if error:
+            return {"status": "error", "msg": error}
+        repetidos = set(nuevos['PedidoID'].astype(str)) & set(df_maestro['PedidoID'].astype(str))
+        if repetidos:
+            return {"status": "error", "msg": f"PedidoID ya existente: {', '.join(sorted(repetidos))}"}
+
+        if 'nombre_completo' not in nuevos.columns:
+            nuevos['nombre_completo'] = "Pedido " + nuevos['PedidoID'].astype(str)
+        nuevos = nuevos.reindex(columns=df_maestro.columns).astype(df_maestro.dtypes.to_dict(), errors='ignore')
+        df_maestro = pd.concat([df_maestro, nuevos], ignore_index=True)
+        os.makedirs(dir_salida, exist_ok=True)
+        df_maestro.to_csv(os.path.join(dir_salida, MASTER_FILE), index=False)
+
+        progreso(0.15, f"Asignando {len(df_maestro)} pedidos...")
+        plan_previo, centros, secuencias = LogisticsController._semillas(df_maestro, warm_start)
+        res_clustering = LogisticsController._clustering_cacheado(df_maestro, user_fleet, dir_salida, centros)
+        rutas = LogisticsController._ejecutar_routing(res_clustering["accepted_df"], fecha_inicio,
+                                                      LogisticsController._tramo(progreso, 0.4, 0.99),
+                                                      secuencias)
+        res_clustering, rutas, optimizacion, reparacion, plan_id = LogisticsController._cerrar_plan(
+            'insercion', res_clustering, rutas, fecha_inicio, lns, reparar, dir_salida, progreso, plan_previo)
+        progreso(1.0, "¡Completado!")
+
+        return {
+            "status": "success",
+            "clustering": res_clustering,
+            "rutas": rutas,
+            "fleet_used": res_clustering['fleet_used'],
+            "plan_id": plan_id,
+            "optimizacion": optimizacion,
+            "reparacion": reparacion
         }
 
     @staticmethod
-    def _ejecutar_routing(df_clustered):
+    def _routing_en_pool(pool, df_clustered, tareas, fecha_inicio, distancias):
+        """
+        Resuelve en el pool de procesos las rutas que no están en caché. Las columnas que usa el
+        solver (y la tabla de km de OSRM) se publican una vez en memoria compartida; a cada tarea
+        solo viajan el descriptor y sus posiciones. Retorna {cluster_id: (paradas, km, minutos)},
+        aciertos de caché incluidos; las rutas que fallen se repiten en el bucle secuencial.
+        """
+        cache = LogisticsController._get_cache()
+        resueltas, faltan = {}, []
+        for cid, posiciones, v_specs, semilla, key in tareas:
+            hit, valor = cache.get('ruta', key)
+            if hit: resueltas[cid] = valor
+            else: faltan.append((cid, posiciones, v_specs, semilla, key))
+        if len(faltan) < 2:
+            return resueltas
+
+        arrays = {
+            'Latitud': df_clustered['Latitud'].to_numpy(dtype=float),
+            'Longitud': df_clustered['Longitud'].to_numpy(dtype=float),
+            'plazo_min': RouteSolver.plazos(df_clustered, fecha_inicio)
+        }
+        tabla = distancias.tabla_ubicaciones() if distancias.red_viaria else None
+        if tabla is not None:
+            arrays['ubicaciones'], arrays['distancias'] = tabla
+
+        with span('routing_pool', rutas=len(faltan)), DatosCompartidos(arrays) as datos:
+            futuros = {
+                cid: (key, pool.submit(RouteSolver.resolver_compartido, datos.descriptor, posiciones,
+                                       v_specs['velocidad_media_kmh'], fecha_inicio, semilla, distancias.clave()))
+                for cid, posiciones, v_specs, semilla, key in faltan
+            }
+            for cid, (key, futuro) in futuros.items():
+                try:
+                    resueltas[cid] = futuro.result()
+                    cache.put('ruta', key, resueltas[cid])
+                except Exception as e:
+                    print(f"[WARN] Error ruteando cluster {cid} en el pool: {e}")
+        return resueltas
+
+    @staticmethod
+    @traced('routing')
+    def _ejecutar_routing(df_clustered, fecha_inicio=None, progreso=None, secuencias=None):
         """
         Helper privado que itera sobre los clusters y llama al motor de rutas (RouteSolver).
+        secuencias: orden de destinos de las rutas de un plan anterior (arranque en caliente).
         """
         if df_clustered is None or df_clustered.empty: 
             return []
         
+        cache = LogisticsController._get_cache()
+        fecha_inicio = fecha_inicio or SIMULATION_START_DATE
         rutas = []
+        # Tabla compartida por todas las rutas (de solo lectura): cada ruta son posiciones sobre ella
+        cluster_col = df_clustered['cluster_id'].to_numpy()
         clusters = df_clustered['cluster_id'].unique()
+        # Hash por fila en una sola pasada; la clave de caché de cada ruta usa solo sus filas
+        filas_hash = pd.util.hash_pandas_object(df_clustered, index=False).to_numpy()
+        esquema = [[str(c) for c in df_clustered.columns], [str(t) for t in df_clustered.dtypes]]
+        pesos = df_clustered['Peso_Total_Kg'].to_numpy()
+        vehiculos = df_clustered['tipoVehiculo_id'].to_numpy()
+        distancias = proveedor_distancias()
+        if distancias.red_viaria:
+            # Una matriz para todas las ubicaciones; cada ruta la recorta sin más peticiones
+            with span('distancias', pedidos=len(df_clustered)):
+                distancias.precargar(df_clustered[['Latitud', 'Longitud']].to_numpy(dtype=float))
         
-        # Bucle normal sin tqdm para evitar Broken Pipe
-        for i, cid in enumerate(clusters):
-            # Feedback simple en consola (opcional)
-            print(f"   > Procesando Cluster {cid} ({i+1}/{len(clusters)})...")
-            
-            subset = df_clustered[df_clustered['cluster_id'] == cid]
+        # Clave de caché y parámetros de cada ruta
+        tareas = []
+        for cid in clusters:
+            posiciones = np.flatnonzero(cluster_col == cid)
             
             # Obtenemos info del vehículo asignado a este cluster
-            vid = subset['tipoVehiculo_id'].iloc[0]
+            vid = vehiculos[posiciones[0]]
             v_specs = FLEET_CONFIG.get(vid, FLEET_CONFIG[1])
             
+            # Orden previo de la ruta anterior con más destinos en común con este cluster
+            semilla = None
+            if secuencias:
+                semilla = elegir_secuencia(secuencias, clave_destino(df_clustered['Latitud'].to_numpy()[posiciones],
+                                                                     df_clustered['Longitud'].to_numpy()[posiciones])) or None
+            key = StageCache.hash_inputs('ruta', esquema, filas_hash[posiciones], v_specs, fecha_inicio,
+                                         RouteSolver.OPTIONS, RouteSolver.CANDIDATOS, distancias.clave(), semilla)
+            tareas.append((cid, posiciones, v_specs, semilla, key))
+
+        # Con pool de procesos, las rutas que faltan en caché se resuelven en paralelo (memoria compartida)
+        resueltas = {}
+        pool = pool_procesos()
+        if pool is not None and len(tareas) > 1:
+            resueltas = LogisticsController._routing_en_pool(pool, df_clustered, tareas, fecha_inicio, distancias)
+        
+        # Bucle normal sin tqdm para evitar Broken Pipe
+        for i, (cid, posiciones, v_specs, semilla, key) in enumerate(tareas):
+            # Feedback simple en consola (opcional)
+            print(f"   > Procesando Cluster {cid} ({i+1}/{len(clusters)})...")
+            if progreso: progreso(i / len(clusters), f"Ruta {i+1}/{len(clusters)} (cluster {cid})...")
+
             try:
-                # Llamada al motor de routing
-                ruta, historial = RouteSolver.solve_route(
-                    pedidos=subset,
-                    velocidad_kmh=v_specs['velocidad_media_kmh'],
-                    fecha_inicio=SIMULATION_START_DATE
-                )
+                # Llamada al motor de routing (memoizada por pedidos + vehículo + fecha + opciones)
+                # En caché solo van los arrays de la ruta (orden relativo al cluster), no la tabla
+                def resolver():
+                    r = RouteSolver.solve_route(
+                        pedidos=df_clustered,
+                        velocidad_kmh=v_specs['velocidad_media_kmh'],
+                        fecha_inicio=fecha_inicio,
+                        distancias=distancias,
+                        semilla=semilla,
+                        posiciones=posiciones
+                    )
+                    # posiciones está ordenado: searchsorted devuelve el índice dentro del cluster
+                    return np.searchsorted(posiciones, r.paradas), r.km_acum, r.min_acum
+
+                if cid in resueltas:
+                    paradas, km_acum, min_acum = resueltas[cid]
+                else:
+                    paradas, km_acum, min_acum = cache.cached('ruta', key, resolver)
+                ruta = RouteResult(df_clustered, posiciones[paradas], km_acum, min_acum)
                 
                 if ruta:
                     rutas.append({
                         "cluster_id": cid, 
                         "vehiculo": v_specs['nombre'],
                         "ruta": ruta,
-                        "carga": subset['Peso_Total_Kg'].sum(),
-                        "audit_history": historial,
+                        "carga": pesos[posiciones].sum(),
+                        "km": ruta.km,
                         "coste": 0
                     })
             except Exception as e:
                 print(f"[WARN] Error ruteando cluster {cid}: {e}")
                 
+        count('rutas', len(rutas))
         return rutas
\ No newline at end of file
@@ -0,0 +1,281 @@
+"""
+Servicio HTTP local de planificación (solo librería estándar + controlador).
+
+Endpoints (JSON en el cuerpo de la petición):
+    GET  /salud        estado del servicio, trabajos en curso y peticiones coalescidas
+    POST /plan         {"carpeta": "data/raw", "fecha": "2025-12-15", "flota": {"4": 2}}
+                       flota óptima (y, si se indica flota, replanificación con ella)
+    POST /recalcular   {"carpeta": ..., "fecha": ..., "flota": {"1": 2, "3": 1}}  (flota obligatoria)
+    POST /pedidos      {"carpeta": ..., "fecha": ..., "flota": ..., "pedidos": [{PedidoID, Latitud,
+                       Longitud, Peso_Total_Kg, Fecha_Limite_Entrega, ...}]}
+    Opcional en los POST: "warm_start": true (arranca desde el último plan del histórico),
+    "lns": 5 (segundos de optimización entre rutas, ver PlanOptimizer), "reparar": true
+    (reinserta los descartes en las rutas al final, ver PlanRepair).
+
+Cada planificación se ejecuta en un pool de procesos acotado. Las peticiones idénticas
+(mismo endpoint y cuerpo) que llegan mientras otra igual está en curso comparten su
+resultado. La respuesta es NDJSON en streaming: una línea de aceptación, latidos
+mientras el trabajo corre, la cabecera del resultado, una línea por ruta y el cierre.
+
+    python main.py servir --puerto 8000 --workers 2
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.controllers.main_controller import LogisticsController, MASTER_FILE
+from src.controllers.batch_runner import BatchRunner, _json_default
+from src.config.fleet_config import FLEET_CONFIG, SIMULATION_START_DATE
+from src.utils.stage_cache import StageCache
+
+SERVICE_WORKERS = int(os.environ.get('IADELIVERY_SERVICE_WORKERS', 2))
+# Trabajos distintos admitidos a la vez (en cola + ejecutándose); el resto recibe 503
+SERVICE_MAX_PENDIENTES = int(os.environ.get('IADELIVERY_SERVICE_MAX_PENDIENTES', 32))
+# Las carpetas de entrada tienen que estar dentro de este directorio
+SERVICE_DATA_ROOT = os.path.abspath(os.environ.get('IADELIVERY_SERVICE_DATA', 'data'))
+LATIDO_S = 1.0
+
+ENDPOINTS = {'/plan': 'plan', '/recalcular': 'recalcular', '/pedidos': 'pedidos'}
+
+
+def _parse_flota(flota):
+    """{"4": 2} -> {4: 2}"""
+    if not flota: return None
+    return {int(k): int(v) for k, v in flota.items()}
+
+
+def _ejecutar(tipo, payload):
+    """Trabajo de un proceso del pool: planifica en un directorio temporal y serializa."""
+    carpeta = payload.get('carpeta', 'data/raw')
+    fecha = payload.get('fecha') or SIMULATION_START_DATE
+    flota = _parse_flota(payload.get('flota'))
+    warm_start = payload.get('warm_start')
+    lns = payload.get('lns')
+    reparar = payload.get('reparar')
+    t0 = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="iadelivery_") as salida, \
+            contextlib.redirect_stdout(io.StringIO()):
+        if tipo == 'plan':
+            res = LogisticsController.inicializar_sistema('csv', carpeta_datos=carpeta,
+                                                          fecha_inicio=fecha, dir_salida=salida,
+                                                          warm_start=warm_start, lns=0 if flota else lns,
+                                                          reparar=False if flota else reparar)
+            if flota and res['status'] == 'success':
+                res = LogisticsController.recalcular_con_flota_manual(flota, fecha_inicio=fecha, dir_salida=salida,
+                                                                      warm_start=warm_start, lns=lns, reparar=reparar)
+        elif tipo == 'recalcular':
+            df_maestro, error = LogisticsController.obtener_dataset_maestro('csv', carpeta_datos=carpeta)
+            if error:
+                res = {'status': 'error', 'msg': error}
+            else:
+                df_maestro.to_csv(os.path.join(salida, MASTER_FILE), index=False)
+                res = LogisticsController.recalcular_con_flota_manual(flota, fecha_inicio=fecha, dir_salida=salida,
+                                                                      warm_start=warm_start, lns=lns, reparar=reparar)
+        else:
+            res = LogisticsController.insertar_pedidos(payload.get('pedidos'), carpeta_datos=carpeta,
+                                                       fecha_inicio=fecha, user_fleet=flota, dir_salida=salida,
+                                                       warm_start=warm_start, lns=lns, reparar=reparar)
+
+    data = BatchRunner.serializar_resultado(res)
+    data['tiempo_s'] = round(time.perf_counter() - t0, 3)
+    return data
+
+
+class PlanService:
+    """Pool de procesos + registro de trabajos en curso (coalescencia por hash de la entrada)."""
+
+    def __init__(self, workers=SERVICE_WORKERS, max_pendientes=SERVICE_MAX_PENDIENTES):
+        self.workers = workers
+        self.max_pendientes = max_pendientes
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self._en_curso = {}
+        self._lock = threading.RLock()
+        self.stats = {'peticiones': 0, 'coalescidas': 0, 'rechazadas': 0}
+
+    @staticmethod
+    def validar(tipo, payload):
+        """Mensaje de error (str) si el cuerpo no es válido, None si lo es."""
+        if not isinstance(payload, dict):
+            return "El cuerpo debe ser un objeto JSON."
+        if not isinstance(payload.get('carpeta', 'data/raw'), str):
+            return "carpeta debe ser una cadena (ruta de la carpeta de datos)."
+        carpeta = os.path.abspath(payload.get('carpeta', 'data/raw'))
+        if os.path.commonpath([carpeta, SERVICE_DATA_ROOT]) != SERVICE_DATA_ROOT:
+            return f"La carpeta debe estar dentro de {SERVICE_DATA_ROOT}."
+        if not os.path.isdir(carpeta):
+            return f"No existe la carpeta {payload.get('carpeta', 'data/raw')}."
+        try:
+            flota = _parse_flota(payload.get('flota'))
+        except (AttributeError, TypeError, ValueError):
+            return "flota debe ser un objeto {tipo_vehiculo: cantidad}."
+        if flota:
+            desconocidos = sorted(set(flota) - set(FLEET_CONFIG))
+            if desconocidos:
+                return f"Tipos de vehículo desconocidos en flota: {desconocidos} (válidos: {sorted(FLEET_CONFIG)})."
+            if any(n < 0 for n in flota.values()) or sum(flota.values()) == 0:
+                return "flota debe tener cantidades >= 0 y al menos un vehículo."
+        if payload.get('fecha') is not None:
+            try:
+                valida = isinstance(payload['fecha'], str) and not pd.isna(pd.to_datetime(payload['fecha']))
+            except (TypeError, ValueError):
+                valida = False
+            if not valida:
+                return "fecha no es una fecha válida (p.ej. 2025-12-15)."
+        if tipo == 'recalcular' and not payload.get('flota'):
+            return "recalcular necesita una flota."
+        if tipo == 'pedidos' and not isinstance(payload.get('pedidos'), list):
+            return "pedidos debe ser una lista."
+        lns = payload.get('lns')
+        if lns is not None and (isinstance(lns, bool) or not isinstance(lns, (int, float)) or not 0 <= lns <= 600):
+            return "lns debe ser un número de segundos entre 0 y 600."
+        if payload.get('reparar') is not None and not isinstance(payload.get('reparar'), bool):
+            return "reparar debe ser true o false."
+        return None
+
+    def enviar(self, tipo, payload):
+        """Retorna (clave, future, coalescida) o None si el servicio está saturado."""
+        clave = StageCache.hash_inputs(tipo, json.dumps(payload, sort_keys=True, ensure_ascii=False))
+        with self._lock:
+            self.stats['peticiones'] += 1
+            fut = self._en_curso.get(clave)
+            if fut is not None:
+                self.stats['coalescidas'] += 1
+                return clave, fut, True
+            if len(self._en_curso) >= self.max_pendientes:
+                self.stats['rechazadas'] += 1
+                return None
+            try:
+                fut = self.pool.submit(_ejecutar, tipo, payload)
+            except BrokenProcessPool:
+                # Un worker murió (OOM, señal...): el pool ya no acepta trabajos, se recrea
+                print("[WARN] Pool de planificación roto: se recrea")
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                fut = self.pool.submit(_ejecutar, tipo, payload)
+            self._en_curso[clave] = fut
+        fut.add_done_callback(lambda f, c=clave: self._terminar(c, f))
+        return clave, fut, False
+
+    def _terminar(self, clave, fut):
+        with self._lock:
+            if self._en_curso.get(clave) is fut:
+                del self._en_curso[clave]
+
+    def salud(self):
+        with self._lock:
+            return {'status': 'ok', 'workers': self.workers, 'en_curso': len(self._en_curso), **self.stats}
+
+    def cerrar(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class PlanHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    servicio = None  # PlanService (lo asigna crear_servidor)
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _json(self, codigo, obj):
+        data = json.dumps(obj, ensure_ascii=False, default=_json_default).encode()
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _linea(self, obj):
+        """Escribe una línea NDJSON como un chunk HTTP."""
+        data = (json.dumps(obj, ensure_ascii=False, default=_json_default) + "\n").encode()
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == '/salud':
+            return self._json(200, self.servicio.salud())
+        self._json(404, {'status': 'error', 'msg': f"Ruta desconocida: {self.path}"})
+
+    def do_POST(self):
+        tipo = ENDPOINTS.get(self.path)
+        if tipo is None:
+            return self._json(404, {'status': 'error', 'msg': f"Ruta desconocida: {self.path}"})
+        try:
+            largo = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(largo) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            return self._json(400, {'status': 'error', 'msg': "JSON no válido."})
+        error = PlanService.validar(tipo, payload)
+        if error:
+            return self._json(400, {'status': 'error', 'msg': error})
+
+        enviado = self.servicio.enviar(tipo, payload)
+        if enviado is None:
+            return self._json(503, {'status': 'error', 'msg': "Servicio saturado, reintenta más tarde."})
+        clave, fut, coalescida = enviado
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        t0 = time.perf_counter()
+        try:
+            self._linea({'status': 'aceptado', 'trabajo': clave, 'coalescida': coalescida})
+            while not wait([fut], timeout=LATIDO_S).done:
+                self._linea({'status': 'en_curso', 'segundos': round(time.perf_counter() - t0, 1)})
+            try:
+                data = fut.result()
+            except Exception as e:
+                data = {'status': 'error', 'msg': f"{type(e).__name__}: {e}"}
+            # El resultado es compartido entre las peticiones coalescidas: solo lectura
+            rutas = data.get('rutas') or []
+            self._linea({**{k: v for k, v in data.items() if k != 'rutas'}, 'n_rutas': len(rutas)})
+            for r in rutas:
+                self._linea({'ruta': r})
+            self._linea({'status': 'completado', 'segundos': round(time.perf_counter() - t0, 3)})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # el cliente se fue; el trabajo sigue (puede estar compartido)
+
+
+def crear_servidor(host='127.0.0.1', puerto=8000, workers=SERVICE_WORKERS):
+    """Servidor listo para serve_forever() (puerto 0 = uno libre, ver server_address)."""
+    handler = type('Handler', (PlanHandler,), {'servicio': PlanService(workers)})
+    return ThreadingHTTPServer((host, puerto), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de planificación")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Procesos de planificación")
+    args = parser.parse_args(argv)
+
+    servidor = crear_servidor(args.host, args.puerto, args.workers)
+    print(f"🛰️ Servicio de planificación en http://{args.host}:{servidor.server_address[1]} "
+          f"({args.workers} procesos)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.RequestHandlerClass.servicio.cerrar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
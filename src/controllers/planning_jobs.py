@@ -0,0 +1,88 @@
+"""
+Planificaciones en segundo plano para la interfaz.
+
+Cada PlanningJob ejecuta una función del controlador (inicializar_sistema,
+recalcular_con_flota_manual) en un pool de hilos compartido por todas las sesiones,
+de modo que el script de Streamlit no se bloquea y varios usuarios pueden planificar
+a la vez. El controlador informa del avance con el callback `progreso(fraccion, mensaje)`;
+la cancelación es cooperativa: el siguiente aviso de progreso lanza PlanningCancelled.
+
+Cada trabajo escribe en su propio directorio (dir_salida, bajo IADELIVERY_JOBS_DIR), así
+dos trabajos a la vez (de usuarios distintos, o uno cancelado y su sustituto) no se pisan
+los CSV. El de un trabajo cancelado o fallido se borra; el de uno terminado lo libera
+quien use su resultado con limpiar().
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.environ.get('IADELIVERY_JOB_WORKERS', 4))
+JOBS_DIR = os.environ.get('IADELIVERY_JOBS_DIR', 'data/processed/jobs')
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="planificacion")
+
+
+class PlanningCancelled(Exception):
+    """La planificación se canceló (p.ej. la flota cambió antes de terminar)."""
+
+
+class PlanningJob:
+
+    def __init__(self, fn, *args, etiqueta=None, archivos=(), **kwargs):
+        """
+        fn(*args, progreso=..., dir_salida=..., **kwargs) se ejecuta en el pool.
+        archivos: ficheros que se copian antes al directorio del trabajo (p.ej. el dataset
+        maestro de un trabajo anterior, que recalcular_con_flota_manual lee de dir_salida).
+        """
+        self.etiqueta = etiqueta
+        self.progreso = 0.0
+        self.mensaje = "En cola..."
+        self.inicio = time.perf_counter()
+        self._cancel = threading.Event()
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        self.dir_salida = tempfile.mkdtemp(prefix="job_", dir=JOBS_DIR)
+        for path in archivos:
+            if os.path.exists(path): shutil.copy(path, self.dir_salida)
+        self._future = _executor.submit(self._run, fn, args, kwargs)
+
+    def _avisar(self, fraccion, mensaje):
+        if self._cancel.is_set():
+            raise PlanningCancelled()
+        self.progreso = max(self.progreso, min(float(fraccion), 1.0))
+        self.mensaje = mensaje
+
+    def _run(self, fn, args, kwargs):
+        try:
+            self._avisar(0.0, "Iniciando...")
+            return fn(*args, progreso=self._avisar, dir_salida=self.dir_salida, **kwargs)
+        except BaseException:
+            self.limpiar()
+            raise
+
+    def cancel(self):
+        """Pide la cancelación; si aún no había empezado, no llega a ejecutarse."""
+        self._cancel.set()
+        if self._future.cancel() or self._future.done():
+            self.limpiar()  # no hay hilo que lo borre al cancelarse
+
+    def limpiar(self):
+        """Borra el directorio de salida del trabajo."""
+        shutil.rmtree(self.dir_salida, ignore_errors=True)
+
+    @property
+    def cancelado(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        """Resultado del controlador (relanza la excepción del hilo, si la hubo)."""
+        return self._future.result(timeout)
+
+    @property
+    def segundos(self):
+        return time.perf_counter() - self.inicio
@@ -0,0 +1,235 @@
+"""
+Simulación de horizonte rodante (día a día) con arrastre de backlog.
+
+Cada día se planifica con los pedidos disponibles más los que quedaron pendientes
+(descartes de clustering y backlog del tacógrafo). Los pedidos cuya fecha límite
+ya ha pasado al empezar el día se dan por perdidos (caducados).
+
+Ejemplo:
+    python main.py simular --fecha 2025-12-15 --dias 30 --flota 3=3,4=1
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.controllers.main_controller import LogisticsController
+from src.models.clustering_service import ClusteringService
+from src.config.fleet_config import FLEET_CONFIG, SIMULATION_START_DATE
+from src.utils.stage_cache import StageCache
+from src.utils import profiling
+
+OUTPUT_SIMULATION = "data/simulation"
+
+
+class RollingHorizonSimulator:
+
+    def __init__(self, df_maestro, flota=None, respetar_disponibilidad=True):
+        """
+        df_maestro: dataset maestro completo del horizonte (se construye una sola vez).
+        flota: {tipo_vehiculo: cantidad} disponible cada día. Si es None se usa la flota
+               óptima calculada para el primer día y se mantiene fija.
+        respetar_disponibilidad: un pedido no entra en planificación hasta que está
+               fabricado (Fecha_Limite_Entrega - Caducidad).
+        """
+        self.master = df_maestro.reset_index(drop=True)
+        self.flota = flota
+        self.cache = LogisticsController._get_cache()
+
+        limite = pd.to_datetime(self.master['Fecha_Limite_Entrega'])
+        self.master['Fecha_Limite_Entrega'] = limite
+        if respetar_disponibilidad and 'Caducidad' in self.master.columns:
+            self.master['Fecha_Disponible'] = (limite - pd.to_timedelta(self.master['Caducidad'], unit='D')).dt.normalize()
+        else:
+            self.master['Fecha_Disponible'] = pd.Timestamp.min
+
+    def _clustering_dia(self, pool, flota):
+        """Clustering del día, memoizado: si el pool no cambia respecto a otro día no se repite."""
+        key = StageCache.hash_inputs('sim_clustering', pool, flota, FLEET_CONFIG, ClusteringService.MAX_STOPS,
+                                     ClusteringService.ASIGNACION)
+
+        def calcular():
+            res = ClusteringService(pool).run_user_fleet_clustering(flota)
+            if res[0] is None:  # flota vacía: no sale ningún vehículo
+                return pool.iloc[0:0], pool, 0, []
+            return res
+
+        return self.cache.cached('sim_clustering', key, calcular)
+
+    def _flota_optima(self, pool):
+        service = ClusteringService(pool)
+        ideal_details, _ = service.run_optimal_clustering()
+        name_to_id = {v['nombre']: k for k, v in FLEET_CONFIG.items()}
+        flota = {}
+        for route in ideal_details:
+            v_id = name_to_id.get(route['vehiculo'])
+            if v_id: flota[v_id] = flota.get(v_id, 0) + 1
+        return flota
+
+    def simular(self, fecha_inicio=SIMULATION_START_DATE, dias=30):
+        """
+        Retorna: (df_kpis_diarios, kpis_acumulados, planes_por_dia)
+        """
+        inicio = pd.to_datetime(fecha_inicio)
+        cols = list(self.master.columns)
+
+        pendientes = self.master.iloc[0:0].copy()   # backlog arrastrado
+        pendientes['Dias_En_Backlog'] = pd.Series(dtype='int64')
+        planificados = set()                        # PedidoID ya puestos en cola alguna vez
+        kpis, planes = [], {}
+        flota = self.flota
+
+        for d in range(dias):
+            dia = inicio + pd.Timedelta(days=d)
+            fin_dia = dia.normalize() + pd.Timedelta(days=1)
+            t0 = time.perf_counter()
+
+            # 1. Nuevos pedidos disponibles hoy
+            nuevos_mask = (self.master['Fecha_Disponible'] < fin_dia) & (~self.master['PedidoID'].isin(planificados))
+            nuevos = self.master[nuevos_mask].copy()
+            nuevos['Dias_En_Backlog'] = 0
+            planificados.update(nuevos['PedidoID'].tolist())
+
+            pool = pd.concat([pendientes, nuevos], ignore_index=True)
+
+            # 2. Caducados: ya no se pueden entregar
+            caducados_mask = pool['Fecha_Limite_Entrega'] < dia
+            n_caducados = int(caducados_mask.sum())
+            pool = pool[~caducados_mask].reset_index(drop=True)
+
+            fila = {
+                'fecha': dia.strftime('%Y-%m-%d'),
+                'pedidos_nuevos': len(nuevos),
+                'pedidos_arrastrados': len(pendientes),
+                'pedidos_en_cola': len(pool),
+                'caducados': n_caducados,
+                'entregados': 0, 'descartados_capacidad': 0, 'backlog_tiempo': 0, 'sin_ruta': 0,
+                'rutas': 0, 'coste': 0.0, 'km': 0.0
+            }
+
+            if pool.empty:
+                pendientes = pool
+                fila['tiempo_s'] = round(time.perf_counter() - t0, 3)
+                kpis.append(fila)
+                continue
+
+            if flota is None:
+                flota = self._flota_optima(pool[cols])
+                print(f"   💡 Flota fija para la simulación (óptima día 1): {flota}")
+
+            # 3. Clustering + routing del día (sobre las columnas del maestro)
+            plan_pool = pool[cols]
+            df_acc, df_disc, _, _ = self._clustering_dia(plan_pool, flota)
+            rutas = LogisticsController._ejecutar_routing(df_acc, fecha_inicio=dia)
+            planes[fila['fecha']] = rutas
+
+            entregados = {pid for r in rutas for pid in r['ruta'].columna('PedidoID').tolist()}
+            pool_ids = pool['PedidoID']
+            ids_disc = set(df_disc['PedidoID']) if df_disc is not None and not df_disc.empty else set()
+            # Clusters sin ruta (p.ej. de un solo pedido): sus pedidos no son backlog de plazo
+            con_ruta = {r['cluster_id'] for r in rutas}
+            ids_acc, ids_sin_ruta = set(), set()
+            if df_acc is not None and not df_acc.empty:
+                en_ruta = df_acc['cluster_id'].isin(con_ruta)
+                ids_acc = set(df_acc.loc[en_ruta, 'PedidoID'])
+                ids_sin_ruta = set(df_acc.loc[~en_ruta, 'PedidoID'])
+
+            fila.update({
+                'entregados': len(entregados),
+                'descartados_capacidad': len(ids_disc),
+                'backlog_tiempo': len(ids_acc - entregados),
+                'sin_ruta': len(ids_sin_ruta),
+                'rutas': len(rutas),
+                'coste': RollingHorizonSimulator._coste_rutas(rutas, df_acc),
+                'km': float(sum(r.get('km', 0) for r in rutas))
+            })
+
+            # 4. Lo no entregado pasa al día siguiente (la fecha límite se reevalúa contra el nuevo día)
+            pendientes = pool[~pool_ids.isin(entregados)].copy()
+            pendientes['Dias_En_Backlog'] = pendientes['Dias_En_Backlog'] + 1
+
+            fila['tiempo_s'] = round(time.perf_counter() - t0, 3)
+            kpis.append(fila)
+            print(f"   📅 {fila['fecha']}: {fila['entregados']} entregados, "
+                  f"{len(pendientes)} pendientes, {n_caducados} caducados")
+
+        df_kpis = pd.DataFrame(kpis)
+        acumulado = RollingHorizonSimulator._acumular(df_kpis, pendientes)
+        return df_kpis, acumulado, planes
+
+    @staticmethod
+    def _coste_rutas(rutas, df_acc):
+        """Coste real del día: fijo por viaje + km x €/km del vehículo de cada ruta construida."""
+        if not rutas:
+            return 0.0
+        tipo = df_acc.groupby('cluster_id')['tipoVehiculo_id'].first()
+        coste = 0.0
+        for r in rutas:
+            specs = FLEET_CONFIG[int(tipo[r['cluster_id']])]
+            coste += specs['coste_fijo_por_viaje'] + r['km'] * specs['coste_variable_por_km']
+        return round(float(coste), 2)
+
+    @staticmethod
+    def _acumular(df_kpis, pendientes):
+        if df_kpis.empty:
+            return {}
+        entregados = int(df_kpis['entregados'].sum())
+        caducados = int(df_kpis['caducados'].sum())
+        pendientes_fin = len(pendientes)
+        total = entregados + caducados + pendientes_fin
+        return {
+            'dias': len(df_kpis),
+            'entregados': entregados,
+            'caducados': caducados,
+            'pendientes_final': pendientes_fin,
+            'nivel_servicio': round(entregados / total, 4) if total else 1.0,
+            'coste_total': round(float(df_kpis['coste'].sum()), 2),
+            'km_total': round(float(df_kpis['km'].sum()), 2),
+            'coste_por_pedido': round(float(df_kpis['coste'].sum()) / entregados, 2) if entregados else None,
+            'dias_medios_en_backlog': round(float(pendientes['Dias_En_Backlog'].mean()), 2) if pendientes_fin else 0.0,
+            'tiempo_s': round(float(df_kpis['tiempo_s'].sum()), 3)
+        }
+
+
+def main(argv=None):
+    from src.controllers.batch_runner import _parse_flota
+
+    parser = argparse.ArgumentParser(description="Simulación multi-día con arrastre de backlog")
+    parser.add_argument("--carpeta", default="data/raw")
+    parser.add_argument("--fecha", default=SIMULATION_START_DATE)
+    parser.add_argument("--dias", type=int, default=30)
+    parser.add_argument("--flota", default=None, help="p.ej. 1=2,3=1 (por defecto la óptima del día 1)")
+    parser.add_argument("--sin-disponibilidad", action="store_true",
+                        help="Planificar todos los pedidos desde el día 1 (ignora fabricación)")
+    parser.add_argument("--salida", default=OUTPUT_SIMULATION)
+    parser.add_argument("--profile", nargs="?", const=profiling.PROFILE_DIR, default=None, metavar="DIR",
+                        help="Perfila cada etapa (cProfile + tracemalloc)")
+    args = parser.parse_args(argv)
+
+    if args.profile: profiling.enable(args.profile)
+
+    df_maestro, error = LogisticsController.obtener_dataset_maestro('csv', carpeta_datos=args.carpeta)
+    if error:
+        print(f"❌ {error}")
+        return 1
+
+    sim = RollingHorizonSimulator(df_maestro, _parse_flota(args.flota), not args.sin_disponibilidad)
+    df_kpis, acumulado, _ = sim.simular(args.fecha, args.dias)
+
+    os.makedirs(args.salida, exist_ok=True)
+    df_kpis.to_csv(os.path.join(args.salida, "kpis_diarios.csv"), index=False)
+    with open(os.path.join(args.salida, "kpis_acumulados.json"), "w", encoding="utf-8") as f:
+        json.dump(acumulado, f, ensure_ascii=False, indent=1)
+
+    print("\n" + df_kpis.to_string(index=False))
+    print(f"\n📊 Acumulado: {acumulado}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,66 +1,163 @@
 import pandas as pd
 import os
-from src.config.db_config import DBConfig 
+from concurrent.futures import ThreadPoolExecutor
+from src.config.db_config import DBConfig
+from src.utils.instrumentation import traced, count
 
 class DataLoader:
-    
+
     REQUIRED_TABLES = ['Pedidos', 'LineasPedido', 'Productos', 'Clientes', 'Destinos']
 
+    CSV_FILES = {
+        'Pedidos': 'Pedidos.csv', 'LineasPedido': 'LineasPedido.csv',
+        'Productos': 'Productos.csv', 'Clientes': 'Clientes.csv',
+        'Destinos': 'Destinos.csv', 'Provincias_geo': 'Provincias_geo.csv',
+        'Provincias': 'Provincias.csv'
+    }
+
+    # Esquema explícito por tabla: columnas que usa el pipeline y su tipo.
+    # Las columnas que no aparecen aquí no se parsean (p.ej. coordenadas_gps).
+    # Los IDs de provincia se leen como texto para conservar los ceros ("01").
+    TABLE_SPECS = {
+        'Pedidos': {
+            'PedidoID': 'int64', 'FechaPedido': 'str',
+            'ClienteID': 'int64', 'DestinoEntregaID': 'int64'
+        },
+        'LineasPedido': {
+            'LineaPedidoID': 'int64', 'PedidoID': 'int64',
+            'ProductoID': 'int64', 'Cantidad': 'float64'
+        },
+        'Productos': {
+            'ProductoID': 'int64', 'Nombre': 'str', 'PrecioVenta': 'float64',
+            'TiempoFabricacionMedio': 'int64', 'Caducidad': 'int64', 'Peso': 'float64'
+        },
+        'Clientes': {
+            'ClienteID': 'int64', 'nombre': 'str', 'email': 'str', 'fecha_registro': 'str'
+        },
+        'Destinos': {
+            'DestinoID': 'int64', 'nombre_completo': 'str', 'distancia_km': 'float64',
+            'provinciaID': 'str', 'ProvinciaID': 'str'
+        },
+        'Provincias': {
+            'ProvinciaID': 'str', 'nombre': 'str', 'pais': 'str'
+        },
+        'Provincias_geo': {
+            'ProvinciaID': 'str', 'nombre': 'str', 'pais': 'str',
+            'Latitud': 'float64', 'Longitud': 'float64'
+        }
+    }
+
+    # Motor de parseo: 'c' (pandas) o 'pyarrow' (multihilo, más rápido en ficheros grandes)
+    CSV_ENGINE = os.environ.get('IADELIVERY_CSV_ENGINE', 'c')
+    MAX_WORKERS = 4
+
+    @staticmethod
+    def _read_header(source):
+        """Lee solo la cabecera del CSV (sin consumir el buffer)."""
+        if isinstance(source, str):
+            with open(source, 'r', encoding='utf-8-sig') as f:
+                line = f.readline()
+        else:
+            pos = source.tell()
+            line = source.readline()
+            source.seek(pos)
+            if isinstance(line, bytes): line = line.decode('utf-8-sig')
+        return [c.strip().strip('"') for c in line.strip().split(',')]
+
+    @staticmethod
+    def _read_table(key, source, engine=None):
+        """
+        Lee una tabla con su esquema de TABLE_SPECS.
+        Si los tipos declarados no encajan (nulos en un ID, etc.) se reintenta con inferencia.
+        """
+        engine = engine or DataLoader.CSV_ENGINE
+        spec = DataLoader.TABLE_SPECS.get(key)
+        kwargs = {'sep': ','}
+        if engine == 'pyarrow': kwargs['engine'] = 'pyarrow'
+
+        src = source
+        if not isinstance(source, str):
+            source.seek(0)
+            # Buffer subido: pyarrow lo lee directamente sobre la memoria del upload
+            if engine == 'pyarrow' and hasattr(source, 'getbuffer'):
+                import pyarrow as pa
+                src = pa.BufferReader(source.getbuffer())
+
+        if spec:
+            header = DataLoader._read_header(source)
+            usecols = [c for c in header if c in spec]
+            if usecols:
+                try:
+                    return pd.read_csv(src, usecols=usecols, dtype={c: spec[c] for c in usecols}, **kwargs)
+                except (ValueError, TypeError) as e:
+                    print(f"   ⚠️ Tipos de {key} no coinciden con el esquema ({e}). Usando inferencia.")
+                    if not isinstance(src, str): src.seek(0)
+
+        return pd.read_csv(src, **kwargs)
+
+    @staticmethod
+    def _read_many(sources, engine=None):
+        """Lee varias tablas en paralelo. sources: {clave: ruta o buffer}."""
+        if not sources: return {}
+        workers = min(DataLoader.MAX_WORKERS, len(sources))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {k: pool.submit(DataLoader._read_table, k, src, engine) for k, src in sources.items()}
+            dfs = {k: f.result() for k, f in futures.items()}
+        count('tablas', len(dfs))
+        count('rows', sum(len(df) for df in dfs.values()))
+        return dfs
+
     @staticmethod
-    def load_manual_buffers(uploaded_files_dict):
+    @traced('carga')
+    def load_manual_buffers(uploaded_files_dict, engine=None):
         """
         Carga CSVs desde memoria.
         """
         print("📂 Leyendo archivos subidos por el usuario...")
-        dfs = {}
         try:
-            # 1. Leer lo que subió el usuario
-            for key, file_obj in uploaded_files_dict.items():
-                if file_obj is not None:
-                    file_obj.seek(0)
-                    dfs[key] = pd.read_csv(file_obj, sep=',')
-                    print(f"   ✅ Leído usuario: {key} ({len(dfs[key])} filas)")
-            
+            # 1. Leer lo que subió el usuario (en paralelo, sin copiar el buffer)
+            sources = {k: f for k, f in uploaded_files_dict.items() if f is not None}
+
             # 2. CARGA HÍBRIDA DE COORDENADAS
             path_geo_interno = "data/raw/Provincias_geo.csv"
             if os.path.exists(path_geo_interno):
                 print("   🌍 Cargando caché de coordenadas interna (Provincias_geo.csv)...")
-                dfs['Provincias_geo'] = pd.read_csv(path_geo_interno, sep=',')
-            
+                sources['Provincias_geo'] = path_geo_interno
+
+            dfs = DataLoader._read_many(sources, engine)
+            for key in uploaded_files_dict:
+                if key in dfs: print(f"   ✅ Leído usuario: {key} ({len(dfs[key])} filas)")
+
             # Validación
             if len(dfs) < len(DataLoader.REQUIRED_TABLES):
                 faltan = set(DataLoader.REQUIRED_TABLES) - set(dfs.keys())
                 print(f"⚠️ Faltan archivos obligatorios: {faltan}")
                 return None
-                
+
             return dfs
         except Exception as e:
             print(f"❌ Error leyendo buffers CSV: {e}")
             return None
 
     @staticmethod
-    def load_from_csv(folder_path="data/raw"):
+    @traced('carga')
+    def load_from_csv(folder_path="data/raw", engine=None):
         print(f"📂 Cargando CSVs desde {folder_path}...")
-        dfs = {}
         try:
-            files = {
-                'Pedidos': 'Pedidos.csv', 'LineasPedido': 'LineasPedido.csv',
-                'Productos': 'Productos.csv', 'Clientes': 'Clientes.csv',
-                'Destinos': 'Destinos.csv', 'Provincias_geo': 'Provincias_geo.csv',
-                'Provincias': 'Provincias.csv' 
-            }
-            for key, filename in files.items():
+            sources = {}
+            for key, filename in DataLoader.CSV_FILES.items():
                 path = os.path.join(folder_path, filename)
                 if os.path.exists(path):
-                    dfs[key] = pd.read_csv(path, sep=',')
+                    sources[key] = path
                 elif key not in ['Provincias_geo', 'Provincias']:
                     raise FileNotFoundError(f"Falta: {filename}")
-            return dfs
+            return DataLoader._read_many(sources, engine)
         except Exception as e:
             print(f"❌ Error: {e}")
             return None
 
     @staticmethod
+    @traced('carga')
     def load_from_sql():
         print("🔌 Conectando SQL...")
         dfs = {}
@@ -72,11 +169,13 @@ class DataLoader:
                     dfs[table] = pd.read_sql(query, engine)
                 else:
                     dfs[table] = pd.read_sql_table(table, engine)
-            
+
             # Cargar geo interno siempre
             if os.path.exists("data/raw/Provincias_geo.csv"):
-                dfs['Provincias_geo'] = pd.read_csv("data/raw/Provincias_geo.csv", sep=',')
+                dfs['Provincias_geo'] = DataLoader._read_table('Provincias_geo', "data/raw/Provincias_geo.csv")
+            count('tablas', len(dfs))
+            count('rows', sum(len(df) for df in dfs.values()))
             return dfs
         except Exception as e:
             print(f"❌ Error SQL: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -1,11 +1,13 @@
 import pandas as pd
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
 import time
+from src.utils.instrumentation import traced, count, span
+from src.utils.profiling import profiled
 
 class FeatureEngineering:
     
     @staticmethod
+    @traced('maestro')
+    @profiled('maestro')
     def create_master_dataset(dfs):
         print("\n\u001b[1;36m Generando Dataset Maestro (Merges & Geocoding)...\u001b[0m")
         
@@ -68,20 +70,22 @@ class FeatureEngineering:
                     
                     if len(prov_faltantes) > 0:
                         print(f"   Consultando API para {len(prov_faltantes)} provincias...")
-                        geolocator = Nominatim(user_agent="logistic_ia_system")
+                        from geopy.geocoders import Nominatim  # solo si hay que geocodificar
+                        with span('geocoding', provincias=len(prov_faltantes)):
+                            geolocator = Nominatim(user_agent="logistic_ia_system")
 
-                        for i, p_nombre in enumerate(prov_faltantes):
-                            try:
-                                if i % 5 == 0: print(f"      > Geocodificando: {p_nombre}...")
+                            for i, p_nombre in enumerate(prov_faltantes):
+                                try:
+                                    if i % 5 == 0: print(f"      > Geocodificando: {p_nombre}...")
                                 
-                                loc = geolocator.geocode(f"{p_nombre}, Spain")
-                                if loc:
-                                    mask = (df_final['nombre'] == p_nombre) & (df_final['Latitud'].isna())
-                                    df_final.loc[mask, 'Latitud'] = loc.latitude
-                                    df_final.loc[mask, 'Longitud'] = loc.longitude
-                                time.sleep(1)
-                            except Exception as e:
-                                print(f"Error geo {p_nombre}: {e}")
+                                    loc = geolocator.geocode(f"{p_nombre}, Spain")
+                                    if loc:
+                                        mask = (df_final['nombre'] == p_nombre) & (df_final['Latitud'].isna())
+                                        df_final.loc[mask, 'Latitud'] = loc.latitude
+                                        df_final.loc[mask, 'Longitud'] = loc.longitude
+                                    time.sleep(1)
+                                except Exception as e:
+                                    print(f"Error geo {p_nombre}: {e}")
                 else:
                     print("   ❌ Faltan coordenadas y no hay 'Provincias.csv' para buscarlas.")
 
@@ -100,6 +104,7 @@ class FeatureEngineering:
                                                    pd.to_timedelta(df_final['TiempoFabricacionMedio'] + 1, unit='D') + \
                                                    pd.to_timedelta(df_final['Caducidad'], unit='D')
 
+            count('rows', len(df_final))
             print(f"✅ Dataset Maestro: {len(df_final)} pedidos. (Sin coords: {df_final['Latitud'].isna().sum()})")
             return df_final
             
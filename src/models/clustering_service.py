@@ -1,7 +1,5 @@
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-from geopy.distance import great_circle
 import sys
 import os
 
@@ -10,38 +8,196 @@ try:
     from src.config.fleet_config import FLEET_CONFIG
 except ImportError:
     FLEET_CONFIG = {} 
+from src.utils.instrumentation import traced, span
+from src.utils.profiling import profiled
+from src.models.distance_provider import proveedor_distancias
 
 HUB_COORDS = (41.5381, 2.4447) 
 
+# Asignación vehículo -> cluster con flota fija:
+#   optima: asignación lineal sobre la matriz vehículo x cluster (coste + penalización por descarte)
+#   rango:  el cluster i-ésimo más pesado recibe el vehículo i-ésimo de más capacidad (comportamiento anterior)
+ASSIGNMENT_MODE = os.environ.get('IADELIVERY_ASSIGNMENT', 'optima')
+
 class ClusteringService:
-    def __init__(self, data):
-        self.df = data.copy()
+    MAX_STOPS = 20
+
+    # Factor de la estimación en línea recta: recorrido interno ~ dispersión media x paradas x factor
+    SPREAD_FACTOR = 0.8
+
+    ASIGNACION = ASSIGNMENT_MODE
+    # € por pedido que no cabe en el vehículo asignado: mayor que cualquier viaje, así
+    # la asignación minimiza primero los descartes y después el coste
+    PENALIZACION_DESCARTE = 100_000
+
+    def __init__(self, data, distancias=None, semillas=None):
+        """
+        data: tabla de pedidos compartida, de solo lectura (no se copia ni se modifica).
+        Cada ejecución trabaja con arrays de posiciones y etiquetas sobre ella y solo
+        materializa las tablas de aceptados/descartados al final. En los workers es un dict
+        con las columnas en memoria compartida (solo sirve para evaluar k, ver _evaluar_k).
+        semillas: centroides [lat, lon] de un plan anterior para arrancar el KMeans en caliente.
+        """
+        self.df = data
+        self.X = np.column_stack((np.asarray(data['Latitud'], dtype=float), np.asarray(data['Longitud'], dtype=float)))
+        self.pesos = np.asarray(data['Peso_Total_Kg'], dtype=float)
         self.sorted_fleet = sorted(FLEET_CONFIG.items(), key=lambda x: x[1]['capacidad_kg'])
-        self.MAX_STOPS = 20
         self.HUB = HUB_COORDS
+        self.distancias = distancias or proveedor_distancias()
+        self._precargado = False
+        self.semillas = None
+        if semillas is not None and len(semillas):
+            self.semillas = np.asarray(semillas, dtype=float).reshape(-1, 2)
+
+    def _kmeans(self, k):
+        from sklearn.cluster import KMeans  # import diferido: sklearn tarda ~1 s en cargar
+        if self.semillas is None:
+            return KMeans(n_clusters=k, random_state=42, n_init=10)
+        # Arranque en caliente: una sola inicialización desde los centros del plan anterior
+        return KMeans(n_clusters=k, init=self._centros_iniciales(k), n_init=1, random_state=42)
+
+    def _centros_iniciales(self, k):
+        """
+        k centros iniciales a partir de las semillas: primero las que tienen más pedidos
+        cerca; si faltan, el pedido más alejado de los centros ya elegidos (farthest-first).
+        """
+        from sklearn.metrics import pairwise_distances_argmin, pairwise_distances_argmin_min
+        X = self.X
+        cerca = np.bincount(pairwise_distances_argmin(X, self.semillas), minlength=len(self.semillas))
+        centros = self.semillas[np.argsort(-cerca, kind='stable')[:k]]
+        if len(centros) < k:
+            d_min = pairwise_distances_argmin_min(X, centros)[1] ** 2
+            extra = []
+            for _ in range(k - len(centros)):
+                i = int(np.argmax(d_min))
+                extra.append(X[i])
+                d_min = np.minimum(d_min, ((X - X[i]) ** 2).sum(axis=1))
+            centros = np.vstack([centros, extra])
+        return centros
+
+    def _km_carretera(self, posiciones):
+        """
+        Km por carretera de un recorrido hub -> vecino más próximo -> ... -> hub.
+        Las distancias salen de la matriz del proveedor, calculada una sola vez para
+        el hub y todos los pedidos (los clusters son recortes, sin más peticiones).
+        """
+        if not self._precargado:
+            self.distancias.precargar(np.vstack([[self.HUB], self.X]))
+            self._precargado = True
+        coords = np.vstack([[self.HUB], self.X[posiciones]])
+        D = self.distancias.matriz(coords)
+        visitado = np.zeros(len(coords), dtype=bool); visitado[0] = True
+        actual, km = 0, 0.0
+        for _ in range(len(coords) - 1):
+            d = np.where(visitado, np.inf, D[actual])
+            siguiente = int(np.argmin(d))
+            km += d[siguiente]; visitado[siguiente] = True; actual = siguiente
+        return km + D[actual, 0]
 
-    def _calculate_estimated_cost(self, cluster_df, vehicle_id):
+    def _calculate_estimated_cost(self, posiciones, vehicle_id):
+        """posiciones: filas del cluster en la tabla compartida."""
         specs = FLEET_CONFIG[vehicle_id]
-        center_lat = cluster_df['Latitud'].mean()
-        center_lon = cluster_df['Longitud'].mean()
-        centroid = (center_lat, center_lon)
-        
-        dist_hub_km = great_circle(self.HUB, centroid).km * 2
-        
-        if len(cluster_df) > 1:
-            avg_spread = np.mean([great_circle((r['Latitud'], r['Longitud']), centroid).km 
-                                  for _, r in cluster_df.iterrows()])
-            dist_internal_km = avg_spread * len(cluster_df) * 0.8
-        else:
-            dist_internal_km = 0
-            
-        total_km_est = dist_hub_km + dist_internal_km
+        total_km_est = self._km_estimados(posiciones)
+
         coste_fijo = specs['coste_fijo_por_viaje']
         coste_variable = total_km_est * specs['coste_variable_por_km']
         total_euros = coste_fijo + coste_variable
         
         return total_euros, total_km_est
 
+    def _km_estimados(self, posiciones):
+        """Km estimados de la ruta de un cluster (por carretera o en línea recta)."""
+        if self.distancias.red_viaria:
+            total_km_est = self._km_carretera(posiciones)
+        else:
+            from geopy.distance import great_circle
+            puntos = self.X[posiciones]
+            center_lat = puntos[:, 0].mean()
+            center_lon = puntos[:, 1].mean()
+            centroid = (center_lat, center_lon)
+
+            dist_hub_km = great_circle(self.HUB, centroid).km * 2
+
+            if len(puntos) > 1:
+                avg_spread = np.mean([great_circle(p, centroid).km for p in puntos.tolist()])
+                dist_internal_km = avg_spread * len(puntos) * self.SPREAD_FACTOR
+            else:
+                dist_internal_km = 0
+
+            total_km_est = dist_hub_km + dist_internal_km
+
+        return total_km_est
+
+    @staticmethod
+    def _miembros(labels, k):
+        """Posiciones de cada cluster (en el orden de la tabla) con una sola ordenación."""
+        orden = np.argsort(labels, kind='stable')
+        cortes = np.cumsum(np.bincount(labels, minlength=k))[:-1]
+        return np.split(orden, cortes)
+
+    def _cargar(self, orden, capacidad, pesos):
+        """Carga voraz en el orden dado hasta capacidad y MAX_STOPS: (aceptados, descartados, kg cargados)."""
+        aceptados, descartados = [], []
+        curr_w = 0
+        for p in orden.tolist():
+            if len(aceptados) < self.MAX_STOPS and curr_w + pesos[p] <= capacidad:
+                aceptados.append(p); curr_w += pesos[p]
+            else:
+                descartados.append(p)
+        return aceptados, descartados, curr_w
+
+    def _asignar_vehiculos(self, vehicle_objs, clusters, orden_carga, pesos):
+        """
+        Vehículo de cada cluster ({cluster: vehículo o None}), con `clusters` ordenados por peso.
+        En modo 'optima' se resuelve una asignación lineal sobre la matriz vehículo x cluster:
+        coste fijo + coste/km x km estimados de lo que carga + PENALIZACION_DESCARTE x pedidos que no caben.
+        """
+        if self.ASIGNACION == 'rango' or not clusters:
+            return {cid: vehicle_objs[i] if i < len(vehicle_objs) else None for i, cid in enumerate(clusters)}
+        from scipy.optimize import linear_sum_assignment
+
+        # Carga de cada cluster con cada tipo de vehículo: solo hay tantas filas distintas como tipos
+        tipos = sorted({v['id'] for v in vehicle_objs})
+        descartes = np.zeros((len(tipos), len(clusters)))
+        km = np.zeros((len(tipos), len(clusters)))
+        for c, cid in enumerate(clusters):
+            km_carga = {}  # tipos con la misma carga comparten estimación
+            for t, v_id in enumerate(tipos):
+                aceptados, descartados, _ = self._cargar(orden_carga[cid], FLEET_CONFIG[v_id]['capacidad_kg'], pesos)
+                descartes[t, c] = len(descartados)
+                if aceptados and tuple(aceptados) not in km_carga:
+                    km_carga[tuple(aceptados)] = self._km_estimados(np.asarray(aceptados))
+                km[t, c] = km_carga.get(tuple(aceptados), 0.0)
+
+        fila_tipo = np.array([tipos.index(v['id']) for v in vehicle_objs])
+        fijo = np.array([FLEET_CONFIG[v['id']]['coste_fijo_por_viaje'] for v in vehicle_objs], dtype=float)
+        por_km = np.array([FLEET_CONFIG[v['id']]['coste_variable_por_km'] for v in vehicle_objs], dtype=float)
+        coste = (fijo[:, None] + por_km[:, None] * km[fila_tipo]
+                 + self.PENALIZACION_DESCARTE * descartes[fila_tipo])
+
+        with span('asignacion', vehiculos=len(vehicle_objs), clusters=len(clusters)):
+            filas, columnas = linear_sum_assignment(coste)
+        asignacion = {cid: None for cid in clusters}
+        for f, c in zip(filas, columnas):
+            asignacion[clusters[c]] = vehicle_objs[f]
+        return asignacion
+
+    def _distancia_centroide(self, kmeans):
+        """
+        Distancia de cada pedido a su centroide más cercano, por bloques de filas:
+        kmeans.transform de toda la tabla crea una matriz n x k (360 MB con 30k pedidos y k=1500).
+        """
+        bloque = max(1024, (1 << 22) // kmeans.n_clusters)  # ~32 MB por bloque
+        return np.concatenate([np.min(kmeans.transform(self.X[i:i + bloque]), axis=1)
+                               for i in range(0, len(self.X), bloque)])
+
+    def _materializar(self, posiciones, columnas):
+        """Tabla de salida: filas `posiciones` de la tabla compartida con las columnas dadas."""
+        df = self.df.take(posiciones)
+        for nombre, valores in columnas.items():
+            df[nombre] = valores
+        return df
+
     def _get_cheapest_vehicle_for_cluster(self, weight):
         valid_vehicles = []
         for v_id, specs in self.sorted_fleet:
@@ -54,60 +210,106 @@ class ClusteringService:
         best_v_id = valid_vehicles[0]
         return best_v_id, FLEET_CONFIG[best_v_id]['nombre'], FLEET_CONFIG[best_v_id]['capacidad_kg']
 
+    def _evaluar_k(self, k):
+        """KMeans con k clusters y coste estimado de la flota: (factible, coste, detalle por ruta)."""
+        kmeans = self._kmeans(k)
+        with span('kmeans', k=k, rows=len(self.X)):
+            labels = kmeans.fit_predict(self.X)
+        miembros = self._miembros(labels, k)
+        
+        current_solution_cost = 0
+        current_iteration_details = []
+        
+        for cid in range(k):
+            posiciones = miembros[cid]
+            w = self.pesos[posiciones].sum()
+            stops = len(posiciones)
+            
+            if stops > self.MAX_STOPS:
+                return False, None, None
+            
+            v_id, v_name, v_cap = self._get_cheapest_vehicle_for_cluster(w)
+            
+            if v_id == 99:
+                return False, None, None
+            
+            cost_eur, dist_km = self._calculate_estimated_cost(posiciones, v_id)
+            current_solution_cost += cost_eur
+            
+            current_iteration_details.append({
+                'cluster_id': cid + 1,
+                'vehiculo': v_name,
+                'peso': w,
+                'paradas': stops,
+                'coste': cost_eur,
+                'capacidad_max': v_cap
+            })
+        return True, current_solution_cost, current_iteration_details
+
+    @staticmethod
+    def _evaluar_k_compartido(descriptor, k, semillas=None, clave_distancias=None):
+        """_evaluar_k en un proceso worker sobre las columnas publicadas en memoria compartida."""
+        from src.utils.shared_data import adjuntar
+        from src.models.distance_provider import SharedMatrixProvider
+        datos = adjuntar(descriptor)
+        distancias = None
+        if 'distancias' in datos:
+            distancias = SharedMatrixProvider(datos['ubicaciones'], datos['distancias'], clave_distancias)
+        service = ClusteringService(datos, distancias=distancias, semillas=semillas)
+        service._precargado = True  # la tabla de km ya viene calculada
+        return service._evaluar_k(k)
+
+    def _evaluaciones(self, ks):
+        """
+        Resultado de _evaluar_k para cada k, en orden. Con pool de procesos (IADELIVERY_POOL_WORKERS)
+        los k se evalúan en paralelo: Latitud, Longitud, Peso_Total_Kg y la tabla de km de OSRM
+        se publican una vez en memoria compartida y a cada worker solo le llega el descriptor.
+        """
+        from src.utils.shared_data import DatosCompartidos, pool_procesos
+        pool = pool_procesos()
+        if pool is None or len(ks) < 2:
+            for k in ks:
+                yield self._evaluar_k(k)
+            return
+
+        arrays = {'Latitud': self.X[:, 0], 'Longitud': self.X[:, 1], 'Peso_Total_Kg': self.pesos}
+        if self.distancias.red_viaria:
+            self.distancias.precargar(np.vstack([[self.HUB], self.X]))
+            self._precargado = True
+            tabla = self.distancias.tabla_ubicaciones()
+            if tabla is not None:
+                arrays['ubicaciones'], arrays['distancias'] = tabla
+        with DatosCompartidos(arrays) as datos:
+            futuros = [pool.submit(ClusteringService._evaluar_k_compartido, datos.descriptor, k, self.semillas,
+                                   self.distancias.clave()) for k in ks]
+            for futuro in futuros:
+                yield futuro.result()
+
+    @traced('clustering_optimo')
+    @profiled('clustering_optimo')
     def run_optimal_clustering(self):
         """
         Calcula la flota ideal y devuelve EL DETALLE de las rutas óptimas.
         """
         print("   ...Analizando configuraciones de flota óptima...")
         
-        total_weight = self.df['Peso_Total_Kg'].sum()
-        min_k = max(int(np.ceil(total_weight / 25000)), int(np.ceil(len(self.df) / self.MAX_STOPS)), 1)
+        total_weight = self.pesos.sum()
+        min_k = max(int(np.ceil(total_weight / 25000)), int(np.ceil(len(self.X) / self.MAX_STOPS)), 1)
         
         best_solution_details = [] # Lista de diccionarios con info de cada ruta
         min_total_cost = float('inf')
         
-        for k in range(min_k, min_k + 15):
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(self.df[['Latitud', 'Longitud']])
-            
-            temp_df = self.df.copy()
-            temp_df['cluster'] = labels
-            
-            current_solution_cost = 0
-            feasible = True
-            current_iteration_details = []
-            
-            for cid in range(k):
-                cluster_data = temp_df[temp_df['cluster'] == cid]
-                w = cluster_data['Peso_Total_Kg'].sum()
-                stops = len(cluster_data)
-                
-                if stops > self.MAX_STOPS:
-                    feasible = False; break
-                
-                v_id, v_name, v_cap = self._get_cheapest_vehicle_for_cluster(w)
-                
-                if v_id == 99:
-                    feasible = False; break
-                
-                cost_eur, dist_km = self._calculate_estimated_cost(cluster_data, v_id)
-                current_solution_cost += cost_eur
-                
-                current_iteration_details.append({
-                    'cluster_id': cid + 1,
-                    'vehiculo': v_name,
-                    'peso': w,
-                    'paradas': stops,
-                    'coste': cost_eur,
-                    'capacidad_max': v_cap
-                })
-            
+        # No más clusters que pedidos (KMeans falla con k > n)
+        ks = range(min_k, min(min_k + 15, len(self.X) + 1))
+        for feasible, current_solution_cost, current_iteration_details in self._evaluaciones(ks):
             if feasible and current_solution_cost < min_total_cost:
                 min_total_cost = current_solution_cost
                 best_solution_details = current_iteration_details
         
         return best_solution_details, min_total_cost
 
+    @traced('clustering_flota')
+    @profiled('clustering_flota')
     def run_user_fleet_clustering(self, user_fleet_counts):
         
         available_vehicles = []
@@ -124,44 +326,38 @@ class ClusteringService:
         if K == 0: return None, None, 0
         if K > len(self.df): K = len(self.df)
 
-        kmeans = KMeans(n_clusters=K, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(self.df[['Latitud', 'Longitud']])
-        distances = np.min(kmeans.transform(self.df[['Latitud', 'Longitud']]), axis=1)
-        
-        self.df['cluster_id'] = clusters
-        self.df['distancia_centroide'] = distances
-        cluster_weights = self.df.groupby('cluster_id')['Peso_Total_Kg'].sum().sort_values(ascending=False)
+        kmeans = self._kmeans(K)
+        with span('kmeans', k=K, rows=len(self.df)):
+            clusters = kmeans.fit_predict(self.X)
+        distances = self._distancia_centroide(kmeans)
+        miembros = self._miembros(clusters, K)
+        cluster_weights = pd.Series(self.pesos).groupby(clusters).sum().sort_values(ascending=False)
+        pesos = self.pesos.tolist()
+        # Orden de carga de cada cluster: del pedido más cercano al centroide al más lejano
+        orden_carga = {cid: miembros[cid][np.argsort(distances[miembros[cid]], kind='quicksort')]
+                       for cid in cluster_weights.index}
+        asignacion = self._asignar_vehiculos(vehicle_objs, list(cluster_weights.index), orden_carga, pesos)
         
-        df_accepted_list = []
-        df_discarded_list = []
+        # Asignaciones de la etapa: posiciones en la tabla compartida + etiquetas por posición
+        acc_pos, acc_cluster, acc_vehiculo = [], [], []
+        disc_pos = []
         total_cost_user = 0
         
         used_routes_details = [] 
 
         for i, (cluster_id, total_weight) in enumerate(cluster_weights.items()):
-            if i < len(vehicle_objs):
-                vehicle = vehicle_objs[i]
-                cluster_orders = self.df[self.df['cluster_id'] == cluster_id].sort_values('distancia_centroide')
-                
-                accepted = []
-                curr_w = 0; curr_s = 0
-                for _, order in cluster_orders.iterrows():
-                    if curr_s >= self.MAX_STOPS:
-                        df_discarded_list.append(order); continue
-                    if curr_w + order['Peso_Total_Kg'] <= vehicle['cap']:
-                        accepted.append(order)
-                        curr_w += order['Peso_Total_Kg']; curr_s += 1
-                    else:
-                        df_discarded_list.append(order)
+            vehicle = asignacion[cluster_id]
+            if vehicle is not None:
+                accepted, descartados, curr_w = self._cargar(orden_carga[cluster_id], vehicle['cap'], pesos)
+                disc_pos += descartados
+                curr_s = len(accepted)
                 
                 if accepted:
-                    df_acc = pd.DataFrame(accepted)
-                    df_acc['tipoVehiculo_id'] = vehicle['id']
-                    df_acc['vehiculo_nombre'] = vehicle['name']
-                    df_acc['cluster_id'] = i + 1
-                    df_accepted_list.append(df_acc)
+                    acc_pos += accepted
+                    acc_cluster += [i + 1] * len(accepted)
+                    acc_vehiculo += [vehicle['id']] * len(accepted)
                     
-                    cost_eur, _ = self._calculate_estimated_cost(df_acc, vehicle['id'])
+                    cost_eur, _ = self._calculate_estimated_cost(np.asarray(accepted), vehicle['id'])
                     total_cost_user += cost_eur
                     
                     # Guardar resumen para devolver
@@ -175,14 +371,25 @@ class ClusteringService:
                     })
             else:
                  # Resto clusters descartados enteros
-                 rest_orders = self.df[self.df['cluster_id'] == cluster_id]
-                 for _, r in rest_orders.iterrows(): df_discarded_list.append(r)
+                 disc_pos += miembros[cluster_id].tolist()
 
-        if df_accepted_list: df_final_acc = pd.concat(df_accepted_list)
-        else: df_final_acc = pd.DataFrame(columns=self.df.columns)
+        # Única materialización de la etapa: filas de la tabla compartida + columnas de asignación
+        columnas = list(dict.fromkeys([*self.df.columns, 'cluster_id', 'distancia_centroide']))
+        if acc_pos:
+            df_final_acc = self._materializar(acc_pos, {
+                'cluster_id': np.asarray(acc_cluster, dtype=np.int64),
+                'distancia_centroide': distances[acc_pos],
+                'tipoVehiculo_id': np.asarray(acc_vehiculo, dtype=np.int64),
+                'vehiculo_nombre': [FLEET_CONFIG[v]['nombre'] for v in acc_vehiculo]
+            })
+        else: df_final_acc = pd.DataFrame(columns=columnas)
             
-        if df_discarded_list: df_final_disc = pd.concat([pd.DataFrame(df_discarded_list)]) if isinstance(df_discarded_list[0], pd.Series) else pd.DataFrame(df_discarded_list)
-        else: df_final_disc = pd.DataFrame(columns=self.df.columns)
+        if disc_pos:
+            df_final_disc = self._materializar(disc_pos, {
+                'cluster_id': clusters[disc_pos].astype(np.int64),
+                'distancia_centroide': distances[disc_pos]
+            })
+        else: df_final_disc = pd.DataFrame(columns=columnas)
             
         return df_final_acc, df_final_disc, total_cost_user, used_routes_details
 
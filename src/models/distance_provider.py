@@ -0,0 +1,223 @@
+"""
+Proveedores de matrices de distancias (km) entre ubicaciones [lat, lon].
+
+- HaversineProvider: distancia great-circle (por defecto, sin red).
+- OSRMTableProvider: km reales por carretera con el endpoint /table de un OSRM
+  (src/config/osrm_config.py). Las ubicaciones se deduplican, la matriz se pide por
+  teselas (OSRM limita el nº de coordenadas por petición) en paralelo y se guarda en
+  disco (StageCache, etapa 'distancias'). Las teselas que fallan y los pares sin ruta
+  se rellenan con haversine.
+- SharedMatrixProvider: recortes de una tabla ya calculada (ubicaciones + km), p. ej.
+  la publicada en memoria compartida para los procesos worker (src/utils/shared_data.py).
+
+Selección por entorno: IADELIVERY_DISTANCE=haversine|osrm (ver proveedor_distancias()).
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.config.osrm_config import OSRM_URL, OSRM_PROFILE, OSRM_TIMEOUT, osrm_workers
+
+DISTANCE_SOURCE = os.environ.get('IADELIVERY_DISTANCE', 'haversine')
+# Ubicaciones por lado de tesela (origen + destino <= 2 * TILE coordenadas por petición)
+OSRM_TABLE_TILE = int(os.environ.get('IADELIVERY_OSRM_TABLE_TILE', 50))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia great-circle vectorizada (acepta escalares o arrays numpy)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 6371 * 2 * np.arcsin(np.sqrt(a))
+
+
+class HaversineProvider:
+    red_viaria = False
+
+    def clave(self):
+        return 'haversine'
+
+    def matriz(self, coords):
+        """coords: array (n, 2) [lat, lon] -> matriz (n, n) de km."""
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        lat, lon = coords[:, 0], coords[:, 1]
+        return haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+    def precargar(self, coords):
+        pass
+
+
+class OSRMTableProvider:
+    red_viaria = True
+
+    def __init__(self, base_url=OSRM_URL, profile=OSRM_PROFILE, timeout=OSRM_TIMEOUT,
+                 tile=OSRM_TABLE_TILE, workers=None, cache=None):
+        from src.utils.stage_cache import StageCache
+        self.base_url = base_url.rstrip('/')
+        self.profile = profile
+        self.timeout = timeout
+        self.tile = max(1, int(tile))
+        self.workers = osrm_workers(self.base_url, workers)
+        self.cache = cache if cache is not None else StageCache()
+        self.fallback = HaversineProvider()
+        self._local = threading.local()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._ultima = None  # (índice {ubicación: fila}, matriz) de la última matriz grande
+
+    def clave(self):
+        return f"osrm|{self.base_url}|{self.profile}"
+
+    def _session(self):
+        s = getattr(self._local, 'session', None)
+        if s is None:
+            import requests
+            s = self._local.session = requests.Session()
+        return s
+
+    # ------------------------------------------------------------------
+    # PETICIONES
+    # ------------------------------------------------------------------
+    def _tesela(self, ubic, src, dst):
+        """Bloque src x dst de la matriz (km) con una petición /table, o None si falla."""
+        mismo = src.start == dst.start
+        idx = list(src) if mismo else list(src) + list(dst)
+        coords = ";".join(f"{ubic[i, 1]:.6f},{ubic[i, 0]:.6f}" for i in idx)
+        # Query a mano: OSRM espera los ';' sin codificar (requests los pasaría a %3B)
+        query = "annotations=distance"
+        if not mismo:
+            query += ("&sources=" + ";".join(str(i) for i in range(len(src))) +
+                      "&destinations=" + ";".join(str(len(src) + j) for j in range(len(dst))))
+        try:
+            r = self._session().get(f"{self.base_url}/table/v1/{self.profile}/{coords}?{query}",
+                                    timeout=self.timeout)
+            if r.status_code == 200:
+                data = r.json()
+                if data.get('distances') is not None:
+                    # null = sin ruta -> NaN (se rellena con haversine)
+                    return np.array([[np.nan if d is None else d / 1000.0 for d in fila]
+                                     for fila in data['distances']], dtype=float)
+        except Exception:
+            pass
+        return None
+
+    def _pedir(self, ubic):
+        m = len(ubic)
+        bloques = [range(i, min(i + self.tile, m)) for i in range(0, m, self.tile)]
+        pares = [(s, d) for s in bloques for d in bloques]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="osrm_table")
+        resultados = list(self._executor.map(lambda p: self._tesela(ubic, *p), pares))
+
+        D = self.fallback.matriz(ubic)
+        fallos = 0
+        for (s, d), bloque in zip(pares, resultados):
+            if bloque is None or bloque.shape != (len(s), len(d)):
+                fallos += 1
+                continue
+            sub = D[s.start:s.stop, d.start:d.stop]
+            D[s.start:s.stop, d.start:d.stop] = np.where(np.isnan(bloque), sub, bloque)
+        np.fill_diagonal(D, 0.0)
+        if fallos:
+            print(f"   ⚠️ OSRM /table: {fallos}/{len(pares)} teselas fallidas ({self.base_url}); "
+                  f"se usa haversine en ellas.")
+        return D, fallos
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def matriz(self, coords):
+        """coords: array (n, 2) [lat, lon] -> matriz (n, n) de km por carretera."""
+        from src.utils.stage_cache import StageCache
+        from src.utils.instrumentation import span
+
+        coords = np.round(np.asarray(coords, dtype=float).reshape(-1, 2), 6)
+        if len(coords) == 0:
+            return np.zeros((0, 0))
+        ubic, inv = np.unique(coords, axis=0, return_inverse=True)
+        inv = inv.reshape(-1)
+
+        # ¿Es un subconjunto de la última matriz grande? -> se recorta sin pedir nada
+        with self._lock:
+            ultima = self._ultima
+        if ultima is not None:
+            filas = [ultima[0].get(tuple(u)) for u in ubic]
+            if all(f is not None for f in filas):
+                filas = np.array(filas)
+                return ultima[1][np.ix_(filas, filas)][np.ix_(inv, inv)]
+
+        key = StageCache.hash_inputs('distancias', self.clave(), ubic)
+        hit, D = self.cache.get('distancias', key)
+        if not hit:
+            with span('osrm_table', ubicaciones=len(ubic)) as s:
+                D, fallos = self._pedir(ubic)
+                s.set('teselas_fallidas', fallos)
+            if not fallos:
+                self.cache.put('distancias', key, D)
+        return D[np.ix_(inv, inv)]
+
+    def precargar(self, coords):
+        """Calcula (o recupera) la matriz de todas las ubicaciones y la deja en memoria para recortes."""
+        coords = np.round(np.asarray(coords, dtype=float).reshape(-1, 2), 6)
+        ubic = np.unique(coords, axis=0)
+        with self._lock:
+            self._ultima = None
+        D = self.matriz(ubic)
+        with self._lock:
+            self._ultima = ({tuple(u): i for i, u in enumerate(ubic)}, D, ubic)
+
+    def tabla_ubicaciones(self):
+        """(ubicaciones (m, 2), km (m, m)) de la última precarga, o None si no la hay."""
+        with self._lock:
+            return None if self._ultima is None else (self._ultima[2], self._ultima[1])
+
+
+class SharedMatrixProvider:
+    """
+    Km por carretera recortados de una tabla precalculada (ubicaciones deduplicadas y su
+    matriz), sin red ni caché en disco. Lo usan los workers sobre la tabla que publica el
+    proceso principal; los recortes son los mismos que haría OSRMTableProvider tras precargar.
+    Las ubicaciones que no estén en la tabla se completan con haversine.
+    """
+    red_viaria = True
+
+    def __init__(self, ubicaciones, D, clave):
+        self.ubicaciones = ubicaciones
+        self.D = D
+        self._clave = clave
+        self._indice = None
+        self.fallback = HaversineProvider()
+
+    def clave(self):
+        return self._clave
+
+    def matriz(self, coords):
+        coords = np.round(np.asarray(coords, dtype=float).reshape(-1, 2), 6)
+        if len(coords) == 0:
+            return np.zeros((0, 0))
+        if self._indice is None:
+            self._indice = {tuple(u): i for i, u in enumerate(self.ubicaciones)}
+        ubic, inv = np.unique(coords, axis=0, return_inverse=True)
+        inv = inv.reshape(-1)
+        filas = np.array([self._indice.get(tuple(u), -1) for u in ubic])
+        conocidas = filas >= 0
+        if conocidas.all():
+            return self.D[np.ix_(filas, filas)][np.ix_(inv, inv)]
+        sub = self.fallback.matriz(ubic)
+        sub[np.ix_(conocidas, conocidas)] = self.D[np.ix_(filas[conocidas], filas[conocidas])]
+        return sub[np.ix_(inv, inv)]
+
+    def precargar(self, coords):
+        pass
+
+
+_default = None
+
+
+def proveedor_distancias():
+    """Proveedor configurado por IADELIVERY_DISTANCE (instancia compartida)."""
+    global _default
+    if _default is None:
+        _default = OSRMTableProvider() if DISTANCE_SOURCE == 'osrm' else HaversineProvider()
+    return _default
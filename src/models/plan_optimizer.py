@@ -0,0 +1,468 @@
+"""
+Optimizador anytime del plan completo: búsqueda de vecindario grande (LNS) entre rutas.
+
+El clustering decide qué pedidos lleva cada vehículo y RouteSolver solo ordena cada ruta
+por separado, así que ningún pedido cambia de ruta. PlanOptimizer parte de las rutas de
+LogisticsController._ejecutar_routing y, mientras quede presupuesto de tiempo, aplica:
+
+- insertar:     un pedido que el solver dejó fuera por plazo entra en el mejor hueco factible,
+- recolocar:    un pedido pasa a la ruta vecina donde más baja el coste total,
+- intercambiar: dos pedidos cercanos de rutas distintas se cambian el sitio,
+- destruir y reparar (LNS): se quita un grupo de pedidos vecinos y se reinsertan por
+  arrepentimiento (regret-2); se aceptan empeoramientos pequeños (record-to-record)
+  para salir de los óptimos locales.
+
+Cada movimiento se evalúa de forma incremental: primero el delta de km en O(1) y, solo
+si mejora, la re-simulación desde el punto de cambio (capacidad, MAX_STOPS, fecha límite
+y tacógrafo con las mismas reglas que RouteSolver). Coste = € por km de cada vehículo
+más PENALIZACION_DESCARTE por pedido sin servir. La primera parada de cada ruta es su
+origen y no se mueve. Los candidatos salen de los k pedidos más cercanos (BallTree).
+"""
+import math
+import os
+import random
+import time
+from collections import deque
+
+import numpy as np
+
+from src.config.fleet_config import FLEET_CONFIG, SIMULATION_START_DATE
+from src.models.clustering_service import ClusteringService
+from src.models.distance_provider import proveedor_distancias
+from src.models.route_result import RouteResult
+from src.models.routing import RouteSolver, RADIO_TIERRA_KM
+from src.utils.instrumentation import span
+
+# Segundos de búsqueda tras el routing (0 = desactivado)
+LNS_BUDGET = float(os.environ.get('IADELIVERY_LNS_SEGUNDOS', 0))
+# Vecinos por pedido que definen los movimientos candidatos
+LNS_VECINOS = int(os.environ.get('IADELIVERY_LNS_VECINOS', 12))
+
+MOVIMIENTOS = ('insertar', 'recolocar', 'intercambiar', 'lns')
+
+
+class PlanOptimizer:
+    # Pedidos que se quitan en cada iteración LNS (mín, máx)
+    DESTRUIR = (3, 15)
+    # Record-to-record: se acepta hasta un +0,5 % sobre el mejor coste en km, bajando a 0 al agotar el presupuesto
+    UMBRAL = 0.005
+    EPS = 1e-7
+    # Puntos máximos del historial de mejoras que se devuelven
+    MAX_HISTORIAL = 200
+    # Iteraciones entre avisos al callback de progreso (punto de cancelación)
+    AVISO_CADA = 64
+
+    def __init__(self, tabla, rutas, fecha_inicio=None, distancias=None, semilla=0, vecinos=LNS_VECINOS):
+        """
+        tabla: dataset clusterizado compartido sobre el que están las rutas (de solo lectura).
+        rutas: salida de LogisticsController._ejecutar_routing sobre esa tabla.
+        """
+        self.tabla = tabla
+        self.rutas_previas = list(rutas)
+        self.distancias = distancias or proveedor_distancias()
+        self.rng = random.Random(semilla)
+        self.n = len(tabla)
+        self.coords = np.column_stack((tabla['Latitud'].to_numpy(dtype=float), tabla['Longitud'].to_numpy(dtype=float)))
+        self.peso = tabla['Peso_Total_Kg'].to_numpy(dtype=float).tolist()
+        self.plazo = RouteSolver.plazos(tabla, fecha_inicio or SIMULATION_START_DATE).tolist()
+        self.max_drv = RouteSolver.OPTIONS['max_conduccion_min']
+        self.descanso = RouteSolver.OPTIONS['descanso_min']
+        self.servicio = RouteSolver.OPTIONS['servicio_min']
+        self._d = self._distancia()
+        self.vecinos = self._vecinos(vecinos)
+
+        # Vehículo de cada ruta: el de su primera parada (como en el routing)
+        tipos = tabla['tipoVehiculo_id'].to_numpy()
+        self.tipo, self.cap, self.vel, self.eur, self.lim = [], [], [], [], []
+        secuencias = []
+        for d in self.rutas_previas:
+            paradas = d['ruta'].paradas.tolist()[:-1]  # sin la vuelta al origen
+            specs = FLEET_CONFIG.get(tipos[paradas[0]], FLEET_CONFIG[1])
+            self.tipo.append(tipos[paradas[0]])
+            self.cap.append(specs['capacidad_kg'])
+            self.vel.append(specs['velocidad_media_kmh'] / 60.0)
+            self.eur.append(specs['coste_variable_por_km'])
+            self.lim.append(max(ClusteringService.MAX_STOPS, len(paradas)))
+            secuencias.append(paradas)
+        servidos = {x for s in secuencias for x in s}
+        self._deshacer = {}
+        self._cargar_estado(secuencias, set(range(self.n)) - servidos)
+        self.ruta_inicial = list(self.ruta_de)
+
+    # ------------------------------------------------------------------ distancias y vecinos
+
+    def _distancia(self):
+        """d(i, j) en km: matriz del proveedor con red viaria (ya precargada en el routing); si no, haversine."""
+        if self.distancias.red_viaria:
+            M = self.distancias.matriz(self.coords)
+            np.fill_diagonal(M, 0.0)
+            return M.item
+        rlat = np.radians(self.coords[:, 0]).tolist()
+        rlon = np.radians(self.coords[:, 1]).tolist()
+        cos = np.cos(np.radians(self.coords[:, 0])).tolist()
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+
+        def d(i, j):
+            a = sin((rlat[j] - rlat[i]) / 2)**2 + cos[i] * cos[j] * sin((rlon[j] - rlon[i]) / 2)**2
+            return 2 * RADIO_TIERRA_KM * asin(sqrt(min(a, 1.0)))
+        return d
+
+    def _vecinos(self, k):
+        """Los k pedidos más cercanos de cada pedido (BallTree haversine)."""
+        k = min(k, self.n - 1)
+        if k <= 0: return [[] for _ in range(self.n)]
+        from sklearn.neighbors import BallTree  # import diferido (sklearn tarda en cargar)
+        rad = np.radians(self.coords)
+        idx = BallTree(rad, metric='haversine').query(rad, k=k + 1, return_distance=False)
+        return [[j for j in fila if j != i][:k] for i, fila in enumerate(idx.tolist())]
+
+    def _rutas_vecinas(self, x):
+        """Rutas de los vecinos de x (en orden de cercanía, sin repetir)."""
+        return [r for r in dict.fromkeys(self.ruta_de[v] for v in self.vecinos[x]) if r >= 0]
+
+    # ------------------------------------------------------------------ estado
+
+    def _cargar_estado(self, secuencias, pool):
+        self.seq = [list(s) for s in secuencias]
+        self.pool = set(pool)
+        self.ruta_de = [-1] * self.n
+        for r, s in enumerate(self.seq):
+            for x in s: self.ruta_de[x] = r
+        self.carga = [sum(self.peso[x] for x in s) for s in self.seq]
+        self.km_ruta = [self._km_secuencia(s) for s in self.seq]
+        # Sin comprobar plazos: una ruta de entrada al límite no bloquea la carga
+        self.est = [[(0.0, 0.0)] + self._simular(r, s, estricto=False) for r, s in enumerate(self.seq)]
+        self.coste = sum(e * km for e, km in zip(self.eur, self.km_ruta))
+
+    def objetivo(self):
+        return self.coste + ClusteringService.PENALIZACION_DESCARTE * len(self.pool)
+
+    def _km_secuencia(self, s):
+        if len(s) < 2: return 0.0
+        return sum(self._d(a, b) for a, b in zip(s, s[1:])) + self._d(s[-1], s[0])
+
+    def _simular(self, r, s, desde=1, previo=(0.0, 0.0), estricto=True):
+        """
+        Estados (conducción acumulada, tiempo de misión) de s[desde:] partiendo del estado
+        de s[desde - 1], con las reglas del tacógrafo de RouteSolver. None si algún pedido
+        llega después de su fecha límite.
+        """
+        vel = self.vel[r]; drv, tot = previo; out = []
+        for p in range(desde, len(s)):
+            t = self._d(s[p - 1], s[p]) / vel if vel > 0 else 0.0
+            drv += t; tot += t + self.servicio
+            if drv > self.max_drv:
+                tot += self.descanso; drv = t
+            if estricto and tot > self.plazo[s[p]]: return None
+            out.append((drv, tot))
+        return out
+
+    def _aplicar(self, r, s, desde, est):
+        """Nueva secuencia de r (cambia a partir de `desde`, con sus estados ya simulados)."""
+        if r not in self._deshacer:
+            self._deshacer[r] = (self.seq[r], self.est[r], self.km_ruta[r], self.carga[r])
+        km = self._km_secuencia(s)
+        self.coste += self.eur[r] * (km - self.km_ruta[r])
+        self.seq[r], self.est[r], self.km_ruta[r] = s, self.est[r][:desde] + est, km
+        self.carga[r] = sum(self.peso[x] for x in s)
+
+    def _revertir(self, pool):
+        """Deshace los cambios registrados desde el último _deshacer = {}."""
+        for r in self._deshacer:
+            for x in self.seq[r]: self.ruta_de[x] = -1
+        for r, (s, est, km, carga) in self._deshacer.items():
+            self.coste += self.eur[r] * (km - self.km_ruta[r])
+            self.seq[r], self.est[r], self.km_ruta[r], self.carga[r] = s, est, km, carga
+            for x in s: self.ruta_de[x] = r
+        self.pool = pool
+
+    # ------------------------------------------------------------------ evaluación incremental
+
+    def _inserciones(self, x, r, limite=math.inf):
+        """
+        Mejor hueco factible de x en la ruta r con delta de coste < limite: (delta €, posición,
+        estados) o None. Los huecos se prueban de menor a mayor delta de km y solo se
+        simula desde el hueco.
+        """
+        s = self.seq[r]
+        if len(s) >= self.lim[r] or self.carga[r] + self.peso[x] > self.cap[r]: return None
+        d = self._d; eur = self.eur[r]
+        huecos = []
+        for p in range(1, len(s) + 1):
+            a = s[p - 1]; b = s[p] if p < len(s) else s[0]
+            delta = eur * (d(a, x) + d(x, b) - d(a, b))
+            if delta < limite: huecos.append((delta, p))
+        huecos.sort()
+        for delta, p in huecos:
+            est = self._simular(r, s[:p] + [x] + s[p:], p, self.est[r][p - 1])
+            if est is not None: return delta, p, est
+        return None
+
+    def _insertar_en(self, x, r, p, est):
+        s = self.seq[r]
+        self._aplicar(r, s[:p] + [x] + s[p:], p, est)
+        self.ruta_de[x] = r
+        self.pool.discard(x)
+
+    def _quitar(self, x):
+        """Quita x de su ruta si sigue siendo factible. Retorna la ruta o -1."""
+        r = self.ruta_de[x]; s = self.seq[r]; i = s.index(x)
+        if i == 0: return -1
+        resto = s[:i] + s[i + 1:]
+        est = self._simular(r, resto, i, self.est[r][i - 1])
+        if est is None: return -1
+        self._aplicar(r, resto, i, est)
+        self.ruta_de[x] = -1
+        self.pool.add(x)
+        return r
+
+    # ------------------------------------------------------------------ movimientos
+
+    def _insertar(self, x):
+        """Pedido sin servir -> mejor hueco factible entre las rutas vecinas."""
+        mejor = None
+        for r in self._rutas_vecinas(x):
+            ins = self._inserciones(x, r, ClusteringService.PENALIZACION_DESCARTE if mejor is None else mejor[1][0])
+            if ins: mejor = (r, ins)
+        if mejor is None: return False
+        r, (_, p, est) = mejor
+        self._insertar_en(x, r, p, est)
+        return True
+
+    def _recolocar(self, x):
+        """Mueve x a la ruta vecina donde más baja el coste total."""
+        r = self.ruta_de[x]; s = self.seq[r]; i = s.index(x)
+        if i == 0: return False
+        a = s[i - 1]; b = s[i + 1] if i + 1 < len(s) else s[0]
+        ahorro = self.eur[r] * (self._d(a, x) + self._d(x, b) - self._d(a, b))
+        mejor = None
+        for q in self._rutas_vecinas(x):
+            if q == r: continue
+            ins = self._inserciones(x, q, (ahorro if mejor is None else mejor[1][0]) - self.EPS)
+            if ins: mejor = (q, ins)
+        if mejor is None: return False
+        resto = s[:i] + s[i + 1:]
+        est = self._simular(r, resto, i, self.est[r][i - 1])
+        if est is None: return False
+        q, (_, p, est_q) = mejor
+        self._aplicar(r, resto, i, est)
+        self._insertar_en(x, q, p, est_q)
+        return True
+
+    def _intercambiar(self, x):
+        """Cambia x por un vecino de otra ruta (cada uno en el hueco del otro) si baja el coste."""
+        r = self.ruta_de[x]; s = self.seq[r]; i = s.index(x)
+        if i == 0: return False
+        d = self._d
+        a = s[i - 1]; b = s[i + 1] if i + 1 < len(s) else s[0]
+        candidatos = []
+        for y in self.vecinos[x]:
+            q = self.ruta_de[y]
+            if q < 0 or q == r: continue
+            t = self.seq[q]; j = t.index(y)
+            if j == 0: continue
+            if (self.carga[r] - self.peso[x] + self.peso[y] > self.cap[r]
+                    or self.carga[q] - self.peso[y] + self.peso[x] > self.cap[q]): continue
+            c = t[j - 1]; e = t[j + 1] if j + 1 < len(t) else t[0]
+            delta = (self.eur[r] * (d(a, y) + d(y, b) - d(a, x) - d(x, b))
+                     + self.eur[q] * (d(c, x) + d(x, e) - d(c, y) - d(y, e)))
+            if delta < -self.EPS: candidatos.append((delta, y, q, j))
+        candidatos.sort()
+        for _, y, q, j in candidatos:
+            t = self.seq[q]
+            nueva_r = s[:i] + [y] + s[i + 1:]
+            est_r = self._simular(r, nueva_r, i, self.est[r][i - 1])
+            if est_r is None: continue
+            nueva_q = t[:j] + [x] + t[j + 1:]
+            est_q = self._simular(q, nueva_q, j, self.est[q][j - 1])
+            if est_q is None: continue
+            self._aplicar(r, nueva_r, i, est_r)
+            self._aplicar(q, nueva_q, j, est_q)
+            self.ruta_de[x], self.ruta_de[y] = q, r
+            return True
+        return False
+
+    def _destruir(self):
+        """Quita un grupo de pedidos vecinos (semilla aleatoria). Retorna (pendientes, ruta de origen de cada uno)."""
+        semilla = self.rng.randrange(self.n)
+        grupo = [semilla] + self.vecinos[semilla]
+        q = self.rng.randint(*self.DESTRUIR)
+        quitados, origen = [], {}
+        for x in grupo:
+            if len(quitados) >= q: break
+            if self.ruta_de[x] < 0:
+                quitados.append(x); continue  # los ya pendientes del grupo también compiten
+            r = self._quitar(x)
+            if r >= 0:
+                quitados.append(x); origen[x] = r
+        return quitados, origen
+
+    def _reparar(self, pendientes, origen):
+        """
+        Inserción por arrepentimiento (regret-2): entra primero el pedido que más perdería
+        si no consiguiera su mejor ruta. Tras cada inserción solo se re-evalúa la ruta que
+        ha cambiado. Los que no caben en ninguna ruta se quedan sin servir.
+        """
+        opciones = {}
+        for x in pendientes:
+            rutas = self._rutas_vecinas(x)
+            if x in origen and origen[x] not in rutas: rutas.append(origen[x])
+            opciones[x] = {r: ins for r in rutas if (ins := self._inserciones(x, r)) is not None}
+        pendientes = list(pendientes)
+        while pendientes:
+            elegido = None
+            for x in pendientes:
+                if not opciones[x]: continue
+                deltas = sorted(ins[0] for ins in opciones[x].values())
+                arrepentimiento = deltas[1] - deltas[0] if len(deltas) > 1 else math.inf
+                clave = (arrepentimiento, -deltas[0])
+                if elegido is None or clave > elegido[0]: elegido = (clave, x)
+            if elegido is None: break
+            x = elegido[1]
+            r, (_, p, est) = min(opciones[x].items(), key=lambda kv: kv[1][0])
+            self._insertar_en(x, r, p, est)
+            pendientes.remove(x); del opciones[x]
+            for y in pendientes:
+                if r in opciones[y] or r in self._rutas_vecinas(y) or origen.get(y) == r:
+                    ins = self._inserciones(y, r)
+                    if ins is None: opciones[y].pop(r, None)
+                    else: opciones[y][r] = ins
+
+    # ------------------------------------------------------------------ bucle anytime
+
+    def optimizar(self, presupuesto_s, max_iteraciones=None, progreso=None):
+        """
+        Mejora el plan durante presupuesto_s segundos (o max_iteraciones). Búsqueda local
+        (insertar / recolocar / intercambiar) hasta un óptimo local y, después, iteraciones
+        LNS seguidas de más búsqueda local. Retorna (rutas, tabla, estadísticas): rutas con
+        el formato de _ejecutar_routing y la tabla con cluster/vehículo al día si algún
+        pedido cambió de ruta. Siempre se devuelve el mejor plan encontrado.
+        progreso: callback opcional progreso(fraccion, mensaje), llamado cada AVISO_CADA
+        iteraciones (si lanza una excepción, p.ej. al cancelar, la búsqueda se interrumpe).
+        """
+        t0 = time.perf_counter()
+        fin = t0 + presupuesto_s
+        km_inicial, sin_servir_inicial, coste_inicial = sum(self.km_ruta), len(self.pool), self.coste
+        historial = [(0.0, self.coste, len(self.pool))]
+        mejor_obj, mejor = self.objetivo(), None  # mejor = None: el estado actual es el mejor
+        movimientos = dict.fromkeys(MOVIMIENTOS, 0)
+        iteraciones = intentos_lns = 0
+
+        cola = [x for x in range(self.n) if self.ruta_de[x] < 0 or self.seq[self.ruta_de[x]][0] != x]
+        self.rng.shuffle(cola)
+        cola = deque(cola); en_cola = set(cola)
+
+        with span('lns', rutas=len(self.seq), pedidos=self.n) as s:
+            while True:
+                ahora = time.perf_counter()
+                if ahora >= fin or (max_iteraciones is not None and iteraciones >= max_iteraciones): break
+                if progreso and iteraciones % self.AVISO_CADA == 0:
+                    fraccion = iteraciones / max_iteraciones if max_iteraciones else (ahora - t0) / presupuesto_s
+                    progreso(fraccion, f"Optimizando entre rutas ({iteraciones} iteraciones)...")
+                iteraciones += 1
+                self._deshacer = {}
+                mov = None
+                if cola:
+                    x = cola.popleft(); en_cola.discard(x)
+                    if self.ruta_de[x] < 0:
+                        mov = 'insertar' if self._insertar(x) else None
+                    elif self._recolocar(x): mov = 'recolocar'
+                    elif self._intercambiar(x): mov = 'intercambiar'
+                else:
+                    intentos_lns += 1
+                    fraccion = iteraciones / max_iteraciones if max_iteraciones else (ahora - t0) / presupuesto_s
+                    umbral = self.UMBRAL * max(0.0, 1.0 - fraccion)
+                    pool_antes, obj_antes = set(self.pool), self.objetivo()
+                    pendientes, origen = self._destruir()
+                    self._reparar(pendientes, origen)
+                    obj = self.objetivo()
+                    if self._deshacer and (obj < obj_antes - self.EPS or obj <= mejor_obj + umbral * self.coste):
+                        mov = 'lns' if abs(obj - obj_antes) > self.EPS else None
+                        if mejor is None and obj > mejor_obj + self.EPS:
+                            # Se acepta un plan peor que el mejor: se guarda el mejor (el de antes del cambio)
+                            secuencias = list(self.seq)
+                            for r, (seq, *_) in self._deshacer.items(): secuencias[r] = seq
+                            mejor = (secuencias, pool_antes)
+                    else:
+                        self._revertir(pool_antes)
+
+                if mov:
+                    movimientos[mov] += 1
+                    # Vuelven a la cola los pedidos de las rutas tocadas y los pendientes cercanos
+                    for r in self._deshacer:
+                        for y in self.seq[r][1:]:
+                            if y not in en_cola: cola.append(y); en_cola.add(y)
+                            for v in self.vecinos[y]:
+                                if self.ruta_de[v] < 0 and v not in en_cola: cola.append(v); en_cola.add(v)
+                    obj = self.objetivo()
+                    if obj < mejor_obj - self.EPS:
+                        mejor_obj, mejor = obj, None
+                        historial.append((time.perf_counter() - t0, self.coste, len(self.pool)))
+            self._deshacer = {}
+
+            if mejor is not None: self._cargar_estado(*mejor)
+            else: self.coste = sum(e * km for e, km in zip(self.eur, self.km_ruta))
+            rutas, tabla = self._exportar()
+            s.set('iteraciones', iteraciones)
+            for k, v in movimientos.items(): s.set(k, v)
+
+        paso = max(1, math.ceil(len(historial) / self.MAX_HISTORIAL))
+        historial = historial[::paso] + ([historial[-1]] if (len(historial) - 1) % paso else [])
+        stats = {
+            "status": "success",
+            "segundos": round(time.perf_counter() - t0, 3),
+            "iteraciones": iteraciones,
+            "intentos_lns": intentos_lns,
+            "movimientos": movimientos,
+            "coste_km_inicial": round(coste_inicial, 2),
+            "coste_km_final": round(self.coste, 2),
+            "km_inicial": round(km_inicial, 2),
+            "km_final": round(sum(self.km_ruta), 2),
+            "sin_servir_inicial": sin_servir_inicial,
+            "sin_servir_final": len(self.pool),
+            "pedidos_movidos": sum(1 for a, b in zip(self.ruta_de, self.ruta_inicial) if a != b),
+            # (segundos, € en km, pedidos sin servir) cada vez que mejora el mejor plan
+            "historial": [[round(t, 3), round(c, 2), p] for t, c, p in historial]
+        }
+        return rutas, tabla, stats
+
+    # ------------------------------------------------------------------ salida
+
+    def _acumulados(self, r, s):
+        """km y minutos acumulados de la ruta s + vuelta al origen (como RouteSolver.solve_route)."""
+        orden = s + [s[0]]
+        D = self.distancias.matriz(self.coords[orden])
+        tramos = D[np.arange(len(orden) - 1), np.arange(1, len(orden))]
+        km_acum = np.concatenate(([0.0], np.cumsum(tramos)))
+        minutos = [0.0] + [tot for _, tot in self._simular(r, s, estricto=False)]
+        vel = self.vel[r]
+        minutos.append(minutos[-1] + (tramos[-1] / vel if vel > 0 else 0.0))
+        return np.asarray(orden), km_acum, minutos
+
+    def _exportar(self):
+        """Rutas en el formato de _ejecutar_routing y tabla con la asignación final."""
+        tabla = self.tabla
+        if self.ruta_de != self.ruta_inicial:
+            # Los pedidos que cambian de ruta pasan al cluster y vehículo de su nueva ruta
+            cluster = tabla['cluster_id'].to_numpy().copy()
+            tipo = tabla['tipoVehiculo_id'].to_numpy().copy()
+            nombre = tabla['vehiculo_nombre'].to_numpy().copy() if 'vehiculo_nombre' in tabla else None
+            for r, d in enumerate(self.rutas_previas):
+                idx = np.asarray(self.seq[r], dtype=int)
+                cluster[idx] = d['cluster_id']; tipo[idx] = self.tipo[r]
+                if nombre is not None: nombre[idx] = d['vehiculo']
+            columnas = {'cluster_id': cluster, 'tipoVehiculo_id': tipo}
+            if nombre is not None: columnas['vehiculo_nombre'] = nombre
+            tabla = tabla.assign(**columnas)
+
+        rutas = []
+        for r, d in enumerate(self.rutas_previas):
+            s = self.seq[r]; previa = d['ruta']
+            if s == previa.paradas.tolist()[:-1]:
+                if tabla is self.tabla: rutas.append(d); continue
+                ruta = RouteResult(tabla, previa.paradas, previa.km_acum, previa.min_acum)
+                rutas.append({**d, "ruta": ruta})
+                continue
+            ruta = RouteResult(tabla, *self._acumulados(r, s))
+            rutas.append({**d, "ruta": ruta, "carga": self.carga[r], "km": ruta.km})
+        return rutas, tabla
@@ -0,0 +1,141 @@
+"""
+Reparación rápida de descartes sobre un plan ya calculado, sin volver a planificar.
+
+Reinserta en las rutas existentes los pedidos que el clustering dejó fuera (cluster
+desbordado o MAX_STOPS, discarded_df) y los que el solver no pudo servir a tiempo
+(backlog del routing). Un BallTree haversine sobre los centroides de las rutas da las
+IADELIVERY_REPARAR_VECINOS rutas más cercanas a cada pedido; de ellas solo se prueban
+las que aún tienen capacidad (kg) y hueco de paradas (MAX_STOPS) para él, y en cada
+una el hueco más barato que respeta fechas límite y tacógrafo (la evaluación
+incremental de PlanOptimizer). Los pedidos entran del más cercano a una ruta al más
+lejano; el resto se informa con su motivo ('capacidad' o 'plazo').
+
+Los centroides no se recalculan tras cada inserción: unos pocos pedidos apenas los mueven.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.models.clustering_service import ClusteringService
+from src.models.plan_optimizer import PlanOptimizer
+from src.models.route_result import RouteResult
+from src.utils.instrumentation import span
+
+# Reparación tras el routing (0 = desactivada)
+REPAIR_ENABLED = os.environ.get('IADELIVERY_REPARAR', '0') == '1'
+# Rutas vecinas (por centroide) que se prueban para cada pedido
+REPAIR_VECINOS = int(os.environ.get('IADELIVERY_REPARAR_VECINOS', 8))
+
+
+class PlanRepair(PlanOptimizer):
+
+    def __init__(self, tabla, rutas, descartados=None, fecha_inicio=None, distancias=None, vecinos=REPAIR_VECINOS):
+        """
+        tabla / rutas: plan actual (accepted_df y salida de _ejecutar_routing sobre ella).
+        descartados: discarded_df del clustering. Sus filas se añaden al final de la tabla
+        para poder insertarlas; las que no entran no pasan a la tabla final.
+        """
+        self.aceptados = tabla
+        self.n_aceptados = len(tabla)
+        self.descartados = descartados if descartados is not None else tabla.iloc[:0]
+        if len(self.descartados):
+            tabla = pd.concat([tabla, self._como_aceptados(self.descartados, tabla)])
+        # Sin vecinos por pedido: los candidatos salen del índice de centroides
+        super().__init__(tabla, rutas, fecha_inicio, distancias, vecinos=0)
+        self.k_rutas = max(1, min(vecinos, len(self.seq)))
+        self._arbol = self._indice_rutas()
+
+    @staticmethod
+    def _como_aceptados(descartados, tabla):
+        """Filas descartadas con las columnas y tipos de la tabla de aceptados."""
+        extra = {}
+        if 'tipoVehiculo_id' in tabla: extra['tipoVehiculo_id'] = 0
+        if 'vehiculo_nombre' in tabla: extra['vehiculo_nombre'] = ""
+        return (descartados.assign(**extra).reindex(columns=tabla.columns)
+                .astype(tabla.dtypes.to_dict(), errors='ignore'))
+
+    def _indice_rutas(self):
+        """BallTree haversine sobre el centroide de cada ruta (None si no hay rutas)."""
+        if not self.seq: return None
+        from sklearn.neighbors import BallTree  # import diferido (sklearn tarda en cargar)
+        centroides = np.array([self.coords[s].mean(axis=0) for s in self.seq])
+        return BallTree(np.radians(centroides), metric='haversine')
+
+    def _con_hueco(self, x, rutas):
+        """Rutas de `rutas` con capacidad y hueco de paradas libres para x."""
+        return [r for r in rutas if len(self.seq[r]) < self.lim[r] and self.carga[r] + self.peso[x] <= self.cap[r]]
+
+    def reparar(self, progreso=None):
+        """
+        Retorna (rutas, tabla de aceptados, tabla de descartados, estadísticas). Si no entra
+        ningún pedido se devuelven las rutas y tablas de entrada sin tocar.
+        progreso: callback opcional progreso(fraccion, mensaje) cada AVISO_CADA pedidos.
+        """
+        t0 = time.perf_counter()
+        pendientes = sorted(self.pool)
+        km_inicial, coste_inicial = sum(self.km_ruta), self.coste
+        motivos = {}
+
+        with span('reparacion', pendientes=len(pendientes), rutas=len(self.seq)) as s:
+            if pendientes and self._arbol is not None:
+                dist, vecinas = self._arbol.query(np.radians(self.coords[pendientes]), k=self.k_rutas)
+                # Primero los pedidos más cercanos a una ruta
+                for j, i in enumerate(np.argsort(dist[:, 0], kind='stable').tolist()):
+                    if progreso and j % self.AVISO_CADA == 0:
+                        progreso(j / len(pendientes), f"Reinsertando descartes ({j}/{len(pendientes)})...")
+                    x = pendientes[i]
+                    candidatas = self._con_hueco(x, vecinas[i].tolist())
+                    mejor = None
+                    for r in candidatas:
+                        ins = self._inserciones(x, r, ClusteringService.PENALIZACION_DESCARTE if mejor is None else mejor[1][0])
+                        if ins: mejor = (r, ins)
+                    if mejor is None:
+                        motivos[x] = 'plazo' if candidatas else 'capacidad'
+                        continue
+                    r, (_, p, est) = mejor
+                    self._insertar_en(x, r, p, est)
+            else:
+                motivos = dict.fromkeys(pendientes, 'capacidad')
+            self._deshacer = {}
+            reinsertados = [x for x in pendientes if self.ruta_de[x] >= 0]
+            s.set('reinsertados', len(reinsertados))
+
+            if reinsertados:
+                rutas, tabla, descartados = self._exportar_reparado()
+            else:
+                rutas, tabla, descartados = self.rutas_previas, self.aceptados, self.descartados
+
+        ids = self.tabla['PedidoID'].to_numpy()
+        stats = {
+            "status": "success",
+            "segundos": round(time.perf_counter() - t0, 4),
+            "pendientes": len(pendientes),
+            "reinsertados": len(reinsertados),
+            "reinsertados_clustering": sum(1 for x in reinsertados if x >= self.n_aceptados),
+            "reinsertados_routing": sum(1 for x in reinsertados if x < self.n_aceptados),
+            "coste_km_inicial": round(coste_inicial, 2),
+            "coste_km_final": round(self.coste, 2),
+            "km_inicial": round(km_inicial, 2),
+            "km_final": round(sum(self.km_ruta), 2),
+            # Lo que no se pudo colocar: origen (clustering / routing) y motivo (capacidad / plazo)
+            "no_colocados": [{"PedidoID": ids[x].item() if hasattr(ids[x], 'item') else ids[x],
+                              "origen": 'clustering' if x >= self.n_aceptados else 'routing',
+                              "motivo": motivos[x]} for x in sorted(motivos)]
+        }
+        return rutas, tabla, descartados, stats
+
+    def _exportar_reparado(self):
+        """Como _exportar, pero sin las filas descartadas que no entraron en ninguna ruta."""
+        rutas, tabla = self._exportar()
+        fuera = [x for x in range(self.n_aceptados, self.n) if self.ruta_de[x] < 0]
+        if not fuera:
+            return rutas, tabla, self.descartados.iloc[:0]
+        mantener = np.ones(self.n, dtype=bool)
+        mantener[fuera] = False
+        nueva = np.cumsum(mantener) - 1  # posición de cada fila en la tabla final
+        tabla = tabla[mantener]
+        rutas = [{**d, "ruta": RouteResult(tabla, nueva[d['ruta'].paradas], d['ruta'].km_acum, d['ruta'].min_acum)}
+                 for d in rutas]
+        return rutas, tabla, self.descartados.iloc[[x - self.n_aceptados for x in fuera]]
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+class RouteResult:
+    """
+    Ruta compacta: posiciones (iloc) de las paradas sobre una tabla de pedidos compartida,
+    más km y minutos acumulados en cada parada. Por parada solo se guardan un entero y
+    dos floats; las filas completas se materializan al acceder (UI, exportación).
+
+    La ruta empieza y termina en el nodo 0 (depósito): [p0, p1, ..., pk, p0].
+    El paso s de la animación del solver es el prefijo paradas[:s + 1].
+    """
+    __slots__ = ('tabla', 'paradas', 'km_acum', 'min_acum')
+
+    def __init__(self, tabla, paradas, km_acum=None, min_acum=None):
+        self.tabla = tabla
+        self.paradas = np.asarray(paradas, dtype=np.int32)
+        n = len(self.paradas)
+        self.km_acum = np.zeros(n) if km_acum is None else np.asarray(km_acum, dtype=float)
+        self.min_acum = np.zeros(n) if min_acum is None else np.asarray(min_acum, dtype=float)
+
+    def __len__(self):
+        return len(self.paradas)
+
+    def __bool__(self):
+        return len(self.paradas) > 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.registros(posiciones=self.paradas[i])
+        return self.tabla.iloc[[self.paradas[i]]].to_dict('records')[0]
+
+    def __iter__(self):
+        return iter(self.registros())
+
+    def __repr__(self):
+        return f"RouteResult(paradas={len(self)}, km={self.km:.1f})"
+
+    @property
+    def km(self):
+        return float(self.km_acum[-1]) if len(self.km_acum) else 0.0
+
+    @property
+    def duracion_min(self):
+        return float(self.min_acum[-1]) if len(self.min_acum) else 0.0
+
+    @property
+    def pasos(self):
+        """Número de pasos de la animación (un prefijo por parada)."""
+        return len(self.paradas)
+
+    def columna(self, nombre):
+        """Valores de una columna en orden de visita (array numpy, sin copiar filas)."""
+        return self.tabla[nombre].to_numpy()[self.paradas]
+
+    def coordenadas(self):
+        """Array (n, 2) de [Latitud, Longitud] en orden de visita."""
+        return np.column_stack((self.columna('Latitud'), self.columna('Longitud')))
+
+    def registros(self, columnas=None, posiciones=None):
+        """Filas como lista de dicts (solo las columnas pedidas, si se indican)."""
+        pos = self.paradas if posiciones is None else posiciones
+        df = self.tabla.iloc[pos]
+        if columnas is not None:
+            df = df[[c for c in columnas if c in df.columns]]
+        return df.to_dict('records')
+
+    def reubicar(self, tabla, posiciones):
+        """
+        Misma ruta referida a otra tabla: `posiciones[i]` es la posición en `tabla`
+        de la fila i de la tabla actual (p.ej. un subset de cluster -> dataset completo).
+        """
+        return RouteResult(tabla, np.asarray(posiciones)[self.paradas], self.km_acum, self.min_acum)
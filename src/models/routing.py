@@ -1,113 +1,194 @@
+import os
 import pandas as pd
 import numpy as np
-from math import radians, cos, sin, asin, sqrt
 from datetime import datetime, timedelta
+from src.utils.instrumentation import span
+from src.utils.profiling import profiled
+from src.models.route_result import RouteResult
+from src.models.distance_provider import proveedor_distancias, haversine_km
+
+# Modo del solver:
+#   denso:      matriz n x n de km/minutos (memoria O(n^2))
+#   candidatos: BallTree haversine + k vecinos no visitados por paso, km bajo demanda (memoria O(n))
+#   auto:       candidatos a partir de IADELIVERY_ROUTING_KNN_MIN paradas
+ROUTING_MODE = os.environ.get('IADELIVERY_ROUTING', 'auto')
+ROUTING_KNN_MIN = int(os.environ.get('IADELIVERY_ROUTING_KNN_MIN', 1500))
+ROUTING_KNN_K = int(os.environ.get('IADELIVERY_ROUTING_KNN_K', 16))
+
+RADIO_TIERRA_KM = 6371
 
 class RouteSolver:
-    def __init__(self, df_pedidos, vehicle_speed_kmh=50, max_hours=None, start_date_str=None):
-        self.points = df_pedidos.copy()
-        self.points.reset_index(drop=True, inplace=True)
-        
-        column_mapping = {
-            'PedidoID': 'id',
-            'Latitud': 'lat',
-            'Longitud': 'lon',
-            'vehiculo_nombre': 'nombre',
-            'Fecha_Limite_Entrega': 'deadline_str'
-        }
-        self.points.rename(columns=column_mapping, inplace=True)
-
-        self.n_points = len(self.points)
+    # Parámetros del tacógrafo (minutos). Forman parte de la clave de caché de rutas.
+    OPTIONS = {
+        'max_conduccion_min': 480,
+        'descanso_min': 720,
+        'servicio_min': 10
+    }
+    # Búsqueda por vecinos (ver _solve_candidatos). También forma parte de la clave de caché.
+    CANDIDATOS = {
+        'modo': ROUTING_MODE,
+        'min_paradas': ROUTING_KNN_MIN,
+        'k': ROUTING_KNN_K
+    }
+
+    def __init__(self, df_pedidos, vehicle_speed_kmh=50, max_hours=None, start_date_str=None, distancias=None,
+                 semilla=None, posiciones=None, plazos=None):
+        """
+        df_pedidos: tabla de pedidos compartida, de solo lectura (no se copia ni se renombra).
+        También vale un dict de arrays por columna (las vistas de memoria compartida de un worker).
+        posiciones: filas de df_pedidos que forman la ruta (por defecto, todas). El nodo i
+        del solver es la fila posiciones[i]; solo se extraen los arrays que usa el solver.
+        plazos: minutos hasta la fecha límite por fila de df_pedidos, ya calculados con
+        RouteSolver.plazos (si no, se calculan desde Fecha_Limite_Entrega).
+        En modo candidatos no hay matriz: los km son haversine calculados bajo demanda
+        (también con el proveedor OSRM, cuya matriz no cabría en memoria).
+        """
+        # Proveedor de la matriz de km (haversine por defecto, OSRM /table si está configurado)
+        self.distancias = distancias or proveedor_distancias()
+        filas = slice(None) if posiciones is None else np.asarray(posiciones)
+
+        def columna(nombre):
+            return np.asarray(df_pedidos[nombre])[filas] if nombre in df_pedidos else None
+
+        self.coords = np.column_stack((columna('Latitud').astype(float), columna('Longitud').astype(float)))
+        self.n_points = len(self.coords)
         self.speed_km_min = vehicle_speed_kmh / 60.0 
+        self.start_time = self._hora_salida(start_date_str)
+
+        if plazos is not None:
+            self.deadlines = np.asarray(plazos, dtype=float)[filas]
+        else:
+            self.deadlines = self._calculate_deadlines(columna('PedidoID'), columna('vehiculo_nombre'),
+                                                       columna('Fecha_Limite_Entrega'), self.start_time, self.n_points)
+        
+        modo = self.CANDIDATOS['modo']
+        self.usa_candidatos = modo == 'candidatos' or (modo == 'auto' and self.n_points >= self.CANDIDATOS['min_paradas'])
 
+        if self.n_points > 0 and not self.usa_candidatos:
+            self.dist_matrix, self.time_matrix = self._calculate_matrices()
+        else:
+            self.dist_matrix, self.time_matrix = [], []
+
+        # Arranque en caliente: orden de visita previo de los destinos que se repiten
+        self.secuencia = self._secuencia_semilla(semilla) if semilla else []
+
+    def _secuencia_semilla(self, semilla):
+        """Nodos (sin el depósito) cuyo destino aparece en `semilla`, en el orden de la semilla."""
+        from src.utils.plan_store import clave_destino
+        rango = {c: i for i, c in enumerate(semilla)}
+        claves = clave_destino(self.coords[:, 0], self.coords[:, 1])
+        nodos = [(rango[c], j) for j, c in enumerate(claves) if j > 0 and c in rango]
+        return [j for _, j in sorted(nodos)]
+
+    @staticmethod
+    def _hora_salida(start_date_str):
+        """Salida a las 08:00 del día de inicio (de hoy si no se indica o no se puede leer)."""
         if start_date_str:
             try:
                 base_date = pd.to_datetime(start_date_str)
-                self.start_time = base_date.replace(hour=8, minute=0, second=0, microsecond=0)
+                return base_date.replace(hour=8, minute=0, second=0, microsecond=0)
             except:
-                self.start_time = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
-        else:
-            self.start_time = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+                pass
+        return datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
 
-        if 'deadline_str' in self.points.columns:
-            self.points['deadline_minutos'] = self.points.apply(self._calculate_deadline_minutes, axis=1)
-        else:
-            self.points['deadline_minutos'] = 99999999
+    @staticmethod
+    def plazos(pedidos, fecha_inicio=None):
+        """Minutos desde la salida hasta la fecha límite de cada fila de `pedidos` (el mismo cálculo que el solver)."""
+        def columna(nombre):
+            return pedidos[nombre].to_numpy() if nombre in pedidos.columns else None
+        return RouteSolver._calculate_deadlines(columna('PedidoID'), columna('vehiculo_nombre'),
+                                                columna('Fecha_Limite_Entrega'),
+                                                RouteSolver._hora_salida(fecha_inicio), len(pedidos))
 
-        if 'id' not in self.points.columns: self.points['id'] = self.points.index 
-        if 'nombre' not in self.points.columns: self.points['nombre'] = "Cliente_" + self.points['id'].astype(str)
-        
-        if self.n_points > 0:
-            self.dist_matrix, self.time_matrix = self._calculate_matrices()
-        else:
-            self.dist_matrix, self.time_matrix = [], []
+    @staticmethod
+    def _calculate_deadlines(ids, nombres, limites, inicio, n):
+        """Minutos desde el inicio hasta la fecha límite de cada nodo (sin plazo: 99999999)."""
+        if limites is None:
+            return np.full(n, 99999999, dtype=float)
+        # Las fechas límite se repiten mucho: se convierte cada valor distinto una sola vez
+        codigos, valores = pd.factorize(limites, use_na_sentinel=False)
+        minutos = np.array([RouteSolver._calculate_deadline_minutes(v, inicio) for v in valores], dtype=float)[codigos]
+        # El depósito/central no tiene plazo
+        sin_plazo = np.zeros(n, dtype=bool)
+        if ids is not None: sin_plazo |= np.array([str(i) == "0" for i in ids], dtype=bool)
+        if nombres is not None: sin_plazo |= (nombres == "CENTRAL")
+        minutos[sin_plazo] = 99999999
+        return minutos
 
-    def _calculate_deadline_minutes(self, row):
+    @staticmethod
+    def _calculate_deadline_minutes(limite, inicio):
         try:
-            if str(row.get('id')) == "0" or row.get('nombre') == "CENTRAL": return 99999999
-            dt = pd.to_datetime(row['deadline_str'])
-            return (dt - self.start_time).total_seconds() / 60.0
+            dt = pd.to_datetime(limite)
+            return (dt - inicio).total_seconds() / 60.0
         except: return 99999999
 
-    def _haversine(self, lat1, lon1, lat2, lon2):
-        R = 6371
-        try:
-            dlat = radians(lat2 - lat1); dlon = radians(lon2 - lon1)
-            a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-            return R * 2 * asin(sqrt(a))
-        except: return 0 
-
     def _calculate_matrices(self):
-        dist = np.zeros((self.n_points, self.n_points))
-        time = np.zeros((self.n_points, self.n_points))
-        coords = self.points[['lat', 'lon']].values
-        for i in range(self.n_points):
-            for j in range(self.n_points):
-                if i != j:
-                    d = self._haversine(coords[i][0], coords[i][1], coords[j][0], coords[j][1])
-                    dist[i][j] = d
-                    if self.speed_km_min > 0: time[i][j] = d / self.speed_km_min
+        dist = self.distancias.matriz(self.coords)
+        np.fill_diagonal(dist, 0.0)
+        if self.speed_km_min > 0: time = dist / self.speed_km_min
+        else: time = np.zeros_like(dist)
         return dist, time
 
     @staticmethod
-    def solve_route(pedidos, velocidad_kmh, fecha_inicio=None):
+    def solve_route(pedidos, velocidad_kmh, fecha_inicio=None, distancias=None, semilla=None, posiciones=None,
+                    plazos=None):
         """
-        Retorna: (ruta_detallada, historial_pasos)
+        Retorna: RouteResult con las paradas en orden de visita (posiciones sobre `pedidos`).
+        posiciones: filas de `pedidos` que forman la ruta (por defecto, todas), sin recortar la tabla.
+        El historial de la animación son los prefijos de la ruta (RouteResult.pasos).
         """
-        if pedidos.empty: return [], []
+        n = len(pedidos['Latitud']) if posiciones is None else len(posiciones)
+        if n == 0: return RouteResult(pedidos, [])
             
-        solver = RouteSolver(pedidos, vehicle_speed_kmh=velocidad_kmh, start_date_str=fecha_inicio)
-        
-        # Obtenemos ruta final IDs y el historial de pasos
-        ruta_ids, _, history_steps = solver.solve()
-        
-        # Reconstrucción de datos
-        pedidos_dict = pedidos.to_dict('records')
-        id_to_data = {row.get('PedidoID'): row for row in pedidos_dict}
-        
-        # Ruta Final Detallada
-        ruta_final = []
-        for rid in ruta_ids:
-            if rid in id_to_data: ruta_final.append(id_to_data[rid])
-            
-        # Historial Detallado (Para la animación)
-        # Convertimos [[id1], [id1, id2]...] a objetos completos
-        history_detailed = []
-        for step_idx, step_ids in enumerate(history_steps):
-            step_data = []
-            for rid in step_ids:
-                if rid in id_to_data:
-                    d = id_to_data[rid].copy()
-                    d['step_index'] = step_idx
-                    step_data.append(d)
-            history_detailed.extend(step_data)
-            
-        return ruta_final, history_detailed
+        with span('ruta', paradas=n) as s:
+            solver = RouteSolver(pedidos, vehicle_speed_kmh=velocidad_kmh, start_date_str=fecha_inicio,
+                                 distancias=distancias, semilla=semilla, posiciones=posiciones, plazos=plazos)
+            orden, minutos, backlog = solver.solve()
+            s.set('backlog', len(backlog))
+
+        orden = np.asarray(orden, dtype=np.int32)
+        if len(orden) == 0: return RouteResult(pedidos, orden)
+        tramos = solver.tramos(orden)
+        km_acum = np.concatenate(([0.0], np.cumsum(tramos)))
+        paradas = orden if posiciones is None else np.asarray(posiciones)[orden]
+        return RouteResult(pedidos, paradas, km_acum, minutos)
+
+    @staticmethod
+    def resolver_compartido(descriptor, posiciones, velocidad_kmh, fecha_inicio=None, semilla=None,
+                            clave_distancias=None):
+        """
+        Ruta de un cluster en un proceso worker sobre los arrays publicados en memoria compartida
+        (Latitud, Longitud, plazo_min y, con OSRM, ubicaciones/distancias; ver src/utils/shared_data.py).
+        Retorna (paradas relativas al cluster, km acumulados, minutos acumulados), como la caché de rutas.
+        """
+        from src.utils.shared_data import adjuntar
+        from src.models.distance_provider import SharedMatrixProvider
+        datos = adjuntar(descriptor)
+        distancias = None
+        if 'distancias' in datos:
+            distancias = SharedMatrixProvider(datos['ubicaciones'], datos['distancias'], clave_distancias)
+        r = RouteSolver.solve_route(datos, velocidad_kmh, fecha_inicio, distancias=distancias, semilla=semilla,
+                                    posiciones=posiciones, plazos=datos['plazo_min'])
+        return np.searchsorted(posiciones, r.paradas), r.km_acum, r.min_acum
 
+    @profiled('ruta')
     def solve(self):
+        """Retorna: (orden de nodos, minutos acumulados por parada, nodos no visitados)."""
         if self.n_points <= 1: return [], [], []
+        if self.usa_candidatos: return self._solve_candidatos()
         return self._solve_long_haul_tachograph()
 
+    def _km(self, i, nodos):
+        """km del nodo i a cada nodo de `nodos` (haversine bajo demanda, modo candidatos)."""
+        return haversine_km(self.coords[i, 0], self.coords[i, 1], self.coords[nodos, 0], self.coords[nodos, 1])
+
+    def tramos(self, orden):
+        """km de cada tramo consecutivo de `orden`."""
+        if self.usa_candidatos:
+            a, b = orden[:-1], orden[1:]
+            return haversine_km(self.coords[a, 0], self.coords[a, 1], self.coords[b, 0], self.coords[b, 1])
+        return self.dist_matrix[orden[:-1], orden[1:]]
+
     def _solve_long_haul_tachograph(self):
         current_node = 0
         visited = [False] * self.n_points
@@ -115,53 +196,177 @@ class RouteSolver:
         
         accum_driving = 0; total_mission = 0
         
-        node_to_real_id = self.points['id'].to_dict()
-        real_depot_id = node_to_real_id[0]
-        
-        final_route_ids = [real_depot_id]
-        
-        # --- Historial de Pasos ---
-        history = []
-        # Paso 0: Solo el depósito
-        history.append([real_depot_id]) 
+        route = [0]
+        minutes = [0.0]
+
+        max_drv = self.OPTIONS['max_conduccion_min']
+        descanso = self.OPTIONS['descanso_min']
+        servicio = self.OPTIONS['servicio_min']
+
+        def llegada(j):
+            """(conducción acumulada, tiempo de misión) al llegar a j desde el nodo actual."""
+            t_min = self.time_matrix[current_node][j]
+            sim_drv = accum_driving + t_min
+            sim_tot = total_mission + t_min + servicio
+            if sim_drv > max_drv:
+                sim_tot += descanso; sim_drv = t_min
+            return sim_drv, sim_tot
+
+        # Con semilla solo compiten el siguiente destino repetido (en el orden previo)
+        # y los destinos nuevos; sin semilla, todos los no visitados (vecino más próximo)
+        secuencia = self.secuencia; puntero = 0
+        en_semilla = set(secuencia)
+        candidatos = [j for j in range(1, self.n_points) if j not in en_semilla]
 
         for _ in range(self.n_points - 1):
             best_next = -1; min_dist = float('inf')
             next_accum_drv = 0; next_total_time = 0
-            
-            for j in range(1, self.n_points):
+
+            # Siguiente destino de la semilla que aún llega a tiempo (los que no, van al backlog)
+            while puntero < len(secuencia):
+                j = secuencia[puntero]
+                if not visited[j]:
+                    sim_drv, sim_tot = llegada(j)
+                    if sim_tot <= self.deadlines[j]:
+                        min_dist = self.dist_matrix[current_node][j]; best_next = j
+                        next_accum_drv = sim_drv; next_total_time = sim_tot
+                        break
+                puntero += 1
+
+            for j in candidatos:
                 if not visited[j]:
                     d_km = self.dist_matrix[current_node][j]
-                    t_min = self.time_matrix[current_node][j]
+                    sim_drv, sim_tot = llegada(j)
                     
-                    sim_drv = accum_driving + t_min
-                    sim_tot = total_mission + t_min + 10 
-                    
-                    if sim_drv > 480: 
-                        sim_tot += 720; sim_drv = t_min 
-                    
-                    if sim_tot <= self.points.iloc[j]['deadline_minutos']:
+                    if sim_tot <= self.deadlines[j]:
                         if d_km < min_dist:
                             min_dist = d_km; best_next = j
                             next_accum_drv = sim_drv; next_total_time = sim_tot
             
             if best_next != -1:
                 visited[best_next] = True
-                real_next_id = node_to_real_id[best_next]
-                final_route_ids.append(real_next_id)
+                route.append(best_next)
                 current_node = best_next
                 accum_driving = next_accum_drv
                 total_mission = next_total_time
-                
-                # --- Guardamos la foto del momento ---
-                history.append(list(final_route_ids))
+                minutes.append(total_mission)
             else:
                 break
         
-        final_route_ids.append(real_depot_id)
         # Vuelta a casa
-        history.append(list(final_route_ids))
+        route.append(0)
+        minutes.append(total_mission + self.time_matrix[current_node][0])
+
+        backlog = [i for i, v in enumerate(visited) if not v and i != 0]
+
+        return route, minutes, backlog
 
-        backlog = [node_to_real_id[i] for i, v in enumerate(visited) if not v and i != 0]
+    def _solve_candidatos(self):
+        """
+        El mismo voraz con tacógrafo que _solve_long_haul_tachograph, sin matriz n x n.
+        En cada paso solo compiten los k nodos no visitados más cercanos (BallTree haversine),
+        y k se multiplica por 4 mientras ninguno sea factible. Si alguno lo es, el más cercano
+        de todos los factibles está entre ellos, así que la ruta coincide con la del modo
+        denso (salvo empates). Un nodo que ya no llega a tiempo tampoco llegará más tarde
+        (el tiempo de misión solo crece y haversine cumple la desigualdad triangular), así
+        que sale de la búsqueda. El árbol se reconstruye con los nodos pendientes cuando la
+        mitad de los suyos ya se han visitado o descartado.
+        """
+        from sklearn.neighbors import BallTree  # import diferido (sklearn tarda en cargar)
+
+        max_drv = self.OPTIONS['max_conduccion_min']
+        descanso = self.OPTIONS['descanso_min']
+        servicio = self.OPTIONS['servicio_min']
+        rad = np.radians(self.coords)
+
+        visited = np.zeros(self.n_points, dtype=bool); visited[0] = True
+        fuera = visited.copy()  # visitados o que ya no llegan a tiempo
+        secuencia = self.secuencia; puntero = 0
+        en_semilla = np.zeros(self.n_points, dtype=bool)
+        en_semilla[np.asarray(secuencia, dtype=int)] = True
+
+        # Árbol sobre los nodos que compiten por cercanía (no visitados y fuera de la semilla)
+        activos = np.flatnonzero(~visited & ~en_semilla)
+        arbol = BallTree(rad[activos], metric='haversine') if len(activos) else None
+        fuera_arbol = 0
+
+        current_node = 0
+        accum_driving = 0.0; total_mission = 0.0
+        route = [0]
+        minutes = [0.0]
+
+        def llegadas(d_km):
+            """(conducción acumulada, tiempo de misión) al llegar a cada nodo a d_km del actual."""
+            t_min = d_km / self.speed_km_min if self.speed_km_min > 0 else np.zeros_like(d_km)
+            sim_drv = accum_driving + t_min
+            sim_tot = total_mission + t_min + servicio
+            pausa = sim_drv > max_drv
+            return np.where(pausa, t_min, sim_drv), np.where(pausa, sim_tot + descanso, sim_tot)
+
+        for _ in range(self.n_points - 1):
+            best_next = -1; min_dist = np.inf
+            next_accum_drv = 0.0; next_total_time = 0.0
+
+            # Siguiente destino de la semilla que aún llega a tiempo (igual que en el modo denso)
+            while puntero < len(secuencia):
+                j = secuencia[puntero]
+                if not visited[j]:
+                    d = self._km(current_node, np.array([j]))
+                    sim_drv, sim_tot = llegadas(d)
+                    if sim_tot[0] <= self.deadlines[j]:
+                        min_dist = d[0]; best_next = j
+                        next_accum_drv = sim_drv[0]; next_total_time = sim_tot[0]
+                        break
+                puntero += 1
+
+            # k vecinos más cercanos; se amplía mientras ninguno no visitado sea factible
+            k = self.CANDIDATOS['k']
+            while arbol is not None:
+                k = min(k, len(activos))
+                dist_rad, idx = arbol.query(rad[current_node:current_node + 1], k=k)
+                nodos = activos[idx[0]]
+                pos = np.flatnonzero(~fuera[nodos])
+                libres = nodos[pos]
+                if len(libres):
+                    d = self._km(current_node, libres)
+                    sim_drv, sim_tot = llegadas(d)
+                    factible = sim_tot <= self.deadlines[libres]
+                    ok = np.flatnonzero(factible)
+                    tarde = libres[~factible]
+                    fuera[tarde] = True; fuera_arbol += len(tarde)
+                    # Más cercano; a igual distancia, el de menor índice (como el modo denso).
+                    # Si empata con el k-ésimo puede haber otros igual de cerca fuera de la lista.
+                    i = ok[np.lexsort((libres[ok], d[ok]))[0]] if len(ok) else None
+                    if i is not None and (dist_rad[0, pos[i]] < dist_rad[0, -1] or k == len(activos)):
+                        if d[i] < min_dist:
+                            min_dist = d[i]; best_next = libres[i]
+                            next_accum_drv = sim_drv[i]; next_total_time = sim_tot[i]
+                        break
+                # Sin factibles (o empate en el borde): se amplía hasta cubrir todo el árbol o la distancia de la semilla
+                if k == len(activos) or dist_rad[0, -1] * RADIO_TIERRA_KM > min_dist * (1 + 1e-9):
+                    break
+                k *= 4
+
+            if best_next == -1:
+                break
+            visited[best_next] = True; fuera[best_next] = True
+            route.append(int(best_next))
+            current_node = best_next
+            accum_driving = next_accum_drv
+            total_mission = next_total_time
+            minutes.append(total_mission)
+
+            if not en_semilla[best_next]:
+                fuera_arbol += 1
+            if fuera_arbol * 2 > len(activos):
+                activos = activos[~fuera[activos]]
+                arbol = BallTree(rad[activos], metric='haversine') if len(activos) else None
+                fuera_arbol = 0
+
+        # Vuelta a casa
+        route.append(0)
+        d_casa = self._km(current_node, np.array([0]))[0]
+        minutes.append(total_mission + (d_casa / self.speed_km_min if self.speed_km_min > 0 else 0.0))
 
-        return final_route_ids, backlog, history
\ No newline at end of file
+        backlog = np.flatnonzero(~visited)
+        return route, minutes, [int(i) for i in backlog if i != 0]
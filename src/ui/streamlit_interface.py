@@ -1,21 +1,22 @@
 import streamlit as st
-import time
 import sys
 import os
-import pandas as pd
-from streamlit_folium import st_folium
-import plotly.express as px
+import json
+from collections import OrderedDict
 
 # Ajuste de path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from src.controllers.main_controller import LogisticsController
 from src.config.fleet_config import FLEET_CONFIG, SIMULATION_START_DATE
-from src.utils.map_renderer import create_interactive_map
-from src.utils.plot_renderer import AuditPlotter
+from src.utils.instrumentation import PerfRecorder, aggregate, to_prometheus
+
+# pandas, el controlador (sklearn), folium y plotly se importan en la pantalla que los usa:
+# la pantalla de inicio carga sin ellos
 
 st.set_page_config(page_title="IA Delivery Dashboard", layout="wide")
 LOGO_PATH = "assets/IADELIVERYSL_LOGO.png"
+VISTAS = ["Mapa Operativo", "Datos Detallados", "Auditoría IA"]
+MAX_RENDER_CACHE = 6  # mapas/figuras renderizados que se guardan por sesión
 
 # ==============================================================================
 # PANTALLAS
@@ -67,7 +68,18 @@ def mostrar_pantalla_inicio():
                 st.session_state['page'] = 'loading'
                 st.rerun()
 
+@st.fragment(run_every=0.5)
+def seguimiento_job(clave):
+    """Barra de progreso de un PlanningJob; al terminar relanza la página completa."""
+    job = st.session_state.get(clave)
+    if job is None: return
+    st.progress(job.progreso, text=f"{job.mensaje} ({job.segundos:.0f} s)")
+    if job.done(): st.rerun()
+
 def mostrar_pantalla_carga():
+    from src.controllers.main_controller import LogisticsController
+    from src.controllers.planning_jobs import PlanningJob
+
     st.empty()
     st.markdown("<br><br><br>", unsafe_allow_html=True)
     c1, c2, c3 = st.columns([2,1,2])
@@ -75,32 +87,73 @@ def mostrar_pantalla_carga():
         if os.path.exists(LOGO_PATH): st.image(LOGO_PATH, width=100)
         
     st.markdown("<h2 style='text-align: center;'>Procesando Datos...</h2>", unsafe_allow_html=True)
-    bar = st.progress(0); status = st.empty()
-    
-    status.text("Analizando archivos..."); time.sleep(0.5); bar.progress(10)
-    
+
+    # La planificación corre en segundo plano; este script solo sigue su progreso
+    job = st.session_state.get('job_carga')
+    if job is None:
+        job = PlanningJob(LogisticsController.inicializar_sistema,
+                          st.session_state.get('modo_carga'),
+                          st.session_state.get('archivos_subidos'))
+        st.session_state['job_carga'] = job
+
+    if not job.done():
+        seguimiento_job('job_carga')
+        return
+
     try:
-        res = LogisticsController.inicializar_sistema(
-            st.session_state.get('modo_carga'),
-            st.session_state.get('archivos_subidos')
-        )
-        
-        if res['status'] == 'error':
-            st.error(res['msg'])
-            if st.button("Volver"): st.session_state['page'] = 'inicio'; st.rerun()
-            st.stop()
-            
-        bar.progress(100); status.text("¡Completado!")
-        st.session_state['app_state'] = res
-        st.session_state['fleet_config_ui'] = res['fleet_used']
-        st.session_state['page'] = 'dashboard'
-        st.rerun()
-        
+        res = job.result()
     except Exception as e:
-        st.error(f"Error crítico: {e}")
+        res = {"status": "error", "msg": f"Error crítico: {e}"}
+
+    if res['status'] == 'error':
+        job.limpiar()
+        st.error(res['msg'])
+        if st.button("Volver"):
+            del st.session_state['job_carga']
+            st.session_state['page'] = 'inicio'; st.rerun()
         st.stop()
 
+    del st.session_state['job_carga']
+    usar_directorio(job.dir_salida)
+    st.session_state['app_state'] = res
+    st.session_state['fleet_config_ui'] = res['fleet_used']
+    st.session_state['page'] = 'dashboard'
+    st.rerun()
+
+def recoger_recalculo():
+    """Si el recálculo en segundo plano terminó, vuelca su resultado al estado de la app."""
+    from src.controllers.planning_jobs import PlanningCancelled
+
+    job = st.session_state.get('job_recalculo')
+    if job is None or not job.done(): return
+    del st.session_state['job_recalculo']
+    try:
+        res = job.result()
+    except PlanningCancelled:
+        return
+    except Exception as e:
+        res = {"status": "error", "msg": f"Error crítico: {e}"}
+    if res['status'] == 'success':
+        usar_directorio(job.dir_salida)
+        st.session_state['app_state'] = res
+        st.session_state['fleet_config_ui'] = job.etiqueta
+    else:
+        job.limpiar()
+        st.error(res['msg'])
+
+def usar_directorio(dir_salida):
+    """Directorio de salida del plan que se muestra; el del plan anterior se borra."""
+    import shutil
+    previo = st.session_state.get('dir_salida')
+    if previo and previo != dir_salida: shutil.rmtree(previo, ignore_errors=True)
+    st.session_state['dir_salida'] = dir_salida
+
 def mostrar_dashboard():
+    from src.controllers.main_controller import LogisticsController
+    from src.controllers.planning_jobs import PlanningJob
+
+    recoger_recalculo()
+
     c_logo, c_title = st.columns([1, 8])
     with c_logo:
         if os.path.exists(LOGO_PATH):
@@ -118,6 +171,8 @@ def mostrar_dashboard():
     with st.sidebar:
         st.header("Flota")
         if st.button("Inicio / Reset", use_container_width=True):
+            if st.session_state.get('job_recalculo'): st.session_state['job_recalculo'].cancel()
+            usar_directorio(None)
             for k in list(st.session_state.keys()): del st.session_state[k]
             st.session_state['page'] = 'inicio'; st.rerun()
         st.divider()
@@ -127,48 +182,149 @@ def mostrar_dashboard():
         for vid, specs in FLEET_CONFIG.items():
             new_input[vid] = st.number_input(f"{specs['nombre']}", value=int(current.get(vid, 0)), min_value=0)
             
-        if st.button("Recalcular", type="primary", use_container_width=True):
-            with st.spinner("Recalculando rutas..."):
-                res = LogisticsController.recalcular_con_flota_manual(new_input)
-                st.session_state['app_state'] = res
-                st.session_state['fleet_config_ui'] = new_input
+        job = st.session_state.get('job_recalculo')
+        if job is not None and job.etiqueta != new_input:
+            # La flota cambió mientras se calculaba: ese resultado ya no sirve
+            job.cancel(); job = None
+            del st.session_state['job_recalculo']
+            st.caption("Flota modificada: cálculo anterior cancelado.")
+
+        if st.button("Recalcular", type="primary", use_container_width=True, disabled=job is not None):
+            from src.controllers.main_controller import MASTER_FILE
+            job = PlanningJob(LogisticsController.recalcular_con_flota_manual, dict(new_input),
+                              etiqueta=dict(new_input),
+                              archivos=[os.path.join(st.session_state['dir_salida'], MASTER_FILE)])
+            st.session_state['job_recalculo'] = job
+
+        if job is not None:
+            seguimiento_job('job_recalculo')
+            if st.button("Cancelar", use_container_width=True):
+                job.cancel()
+                del st.session_state['job_recalculo']
                 st.rerun()
 
+        st.divider()
+        mostrar_perf = st.toggle("⏱️ Panel de Rendimiento", value=False)
+
     render_metrics(state.get('clustering', {}))
-    
-    tab1, tab2, tab3 = st.tabs(["Mapa Operativo", "Datos Detallados", "Auditoría IA"])
-
-    with tab1:
-        if state.get('rutas'):
-            mapa = create_interactive_map(state['rutas'])
-            st_folium(mapa, width=None, height=600, returned_objects=[])
-        else: st.warning("No hay rutas generadas.")
-
-    with tab2:
-        c1, c2 = st.columns(2)
-        with c1:
-            st.subheader("Cargas")
-            rd = state.get('clustering', {}).get('details', [])
-            if isinstance(rd, dict): rd = rd.get('user_routes', [])
-            if rd: st.dataframe(pd.DataFrame(rd)[['vehiculo', 'peso', 'coste']], use_container_width=True, hide_index=True)
-        with c2:
-            st.subheader("Descartes")
-            di = state.get('clustering', {}).get('discarded_df')
-            if di is not None: st.dataframe(di[['PedidoID', 'nombre_completo']], use_container_width=True, hide_index=True)
-
-    with tab3:
-        st.header("Auditoría")
-        rutas = state.get('rutas', [])
-        if rutas:
-            st.subheader("1. Zonas (Clustering)")
-            fig_c = AuditPlotter.plot_clustering_zones(rutas)
-            if fig_c: st.plotly_chart(fig_c, use_container_width=True)
-            st.divider()
-            st.subheader("2. Animación (Routing)")
-            fig_r = AuditPlotter.plot_routing_animation(rutas)
-            if fig_r: st.plotly_chart(fig_r, use_container_width=True)
-        else: st.info("Calcula rutas primero.")
+    panel_resultados(state)
+
+    if mostrar_perf:
+        render_performance(state.get('perf', []) + recorder_ui().report())
+
+# ==============================================================================
+# VISTAS DE RESULTADOS (solo se construye la seleccionada)
+# ==============================================================================
+
+def recorder_ui():
+    """Spans de render de la interfaz (solo construcciones; los aciertos de caché no cuentan)."""
+    if 'perf_ui' not in st.session_state: st.session_state['perf_ui'] = PerfRecorder()
+    return st.session_state['perf_ui']
+
+def huella_rutas(rutas):
+    """Hash del estado de rutas (vehículo, pedidos y km por parada) para cachear lo renderizado."""
+    import pandas as pd
+    from src.utils.stage_cache import StageCache
+    return StageCache.hash_inputs('render', [
+        (r['cluster_id'], r['vehiculo'], r['ruta'].km_acum, pd.Series(r['ruta'].columna('PedidoID')))
+        for r in rutas or []
+    ])
+
+def cache_render(tipo, huella, construir):
+    """LRU por sesión de mapas y figuras, indexado por (tipo, huella de rutas)."""
+    cache = st.session_state.setdefault('render_cache', OrderedDict())
+    clave = (tipo, huella)
+    if clave in cache:
+        cache.move_to_end(clave)
+        return cache[clave]
+    with recorder_ui().activate():
+        valor = construir()
+    cache[clave] = valor
+    while len(cache) > MAX_RENDER_CACHE: cache.popitem(last=False)
+    return valor
+
+@st.fragment
+def panel_resultados(state):
+    """Cambiar de vista solo relanza este fragmento, no el dashboard completo."""
+    vista = st.radio("Vista", VISTAS, horizontal=True, key='vista', label_visibility="collapsed")
+    if 'huella' not in state: state['huella'] = huella_rutas(state.get('rutas'))
+
+    if vista == VISTAS[0]: vista_mapa(state)
+    elif vista == VISTAS[1]: vista_datos(state)
+    else: vista_auditoria(state)
+
+def vista_mapa(state):
+    if not state.get('rutas'):
+        st.warning("No hay rutas generadas.")
+        return
+    from streamlit_folium import st_folium
+    from src.utils.map_renderer import create_interactive_map
+    mapa = cache_render('mapa', state['huella'], lambda: create_interactive_map(state['rutas']))
+    st_folium(mapa, width=None, height=600, returned_objects=[])
+
+def vista_datos(state):
+    import pandas as pd
+    c1, c2 = st.columns(2)
+    with c1:
+        st.subheader("Cargas")
+        rd = state.get('clustering', {}).get('details', [])
+        if isinstance(rd, dict): rd = rd.get('user_routes', [])
+        if rd: st.dataframe(pd.DataFrame(rd)[['vehiculo', 'peso', 'coste']], use_container_width=True, hide_index=True)
+    with c2:
+        st.subheader("Descartes")
+        di = state.get('clustering', {}).get('discarded_df')
+        if di is not None: st.dataframe(di[['PedidoID', 'nombre_completo']], use_container_width=True, hide_index=True)
+        if di is not None and not di.empty and state.get('rutas'):
+            if st.button("🩹 Reinsertar descartes", use_container_width=True):
+                from src.controllers.main_controller import LogisticsController
+                res = LogisticsController.reparar_descartes(state, dir_salida=st.session_state['dir_salida'])
+                res.pop('huella', None)  # las rutas cambian: mapas y figuras se rehacen
+                st.session_state['app_state'] = res
+                st.rerun()
+        rep = state.get('reparacion')
+        if rep:
+            st.caption(f"Reinsertados {rep['reinsertados']}/{rep['pendientes']} pedidos en {rep['segundos'] * 1000:.0f} ms")
+            if rep['no_colocados']:
+                st.dataframe(pd.DataFrame(rep['no_colocados']), use_container_width=True, hide_index=True)
+
+def vista_auditoria(state):
+    st.header("Auditoría")
+    rutas = state.get('rutas', [])
+    if not rutas:
+        st.info("Calcula rutas primero.")
+        return
+    from src.utils.plot_renderer import AuditPlotter
+    st.subheader("1. Zonas (Clustering)")
+    aceptados = state.get('clustering', {}).get('accepted_df')
+    fig_c = cache_render('zonas', state['huella'], lambda: AuditPlotter.plot_clustering_zones(aceptados))
+    if fig_c: st.plotly_chart(fig_c, use_container_width=True)
+    st.divider()
+    st.subheader("2. Animación (Routing)")
+    fig_r = cache_render('animacion', state['huella'], lambda: AuditPlotter.plot_routing_animation(rutas))
+    if fig_r: st.plotly_chart(fig_r, use_container_width=True)
+
+def render_performance(report):
+    """Panel opcional con los tiempos, contadores y memoria por etapa."""
+    st.divider()
+    st.header("⏱️ Rendimiento")
+    if not report:
+        st.info("Sin datos de instrumentación para este cálculo.")
+        return
+    import pandas as pd
+    df_perf = pd.DataFrame(aggregate(report))
+    df_perf['counters'] = df_perf['counters'].astype(str)
+    c1, c2 = st.columns([2, 1])
+    with c1:
+        st.dataframe(df_perf, use_container_width=True, hide_index=True)
+    with c2:
+        top = df_perf[df_perf['stage'].str.count('/') == 1].set_index('stage')['duration_s']
+        if not top.empty: st.bar_chart(top)
+    d1, d2 = st.columns(2)
+    d1.download_button("Descargar JSON", json.dumps(report, ensure_ascii=False, indent=1), "perf.json",
+                       use_container_width=True)
+    d2.download_button("Descargar Prometheus", to_prometheus(report), "perf.prom", use_container_width=True)
 
+@st.fragment
 def render_metrics(res):
     mets = res.get('metrics', {})
     acc = res.get('accepted_df', [])
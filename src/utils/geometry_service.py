@@ -0,0 +1,99 @@
+"""
+Geometría de carretera de las rutas (OSRM /route), con peticiones concurrentes,
+reutilización de conexiones y caché en disco.
+
+    servicio = GeometryService()                       # usa OSRM_URL (src/config/osrm_config.py)
+    geometrias = servicio.rutas([[[lat, lon], ...], ...])
+
+La clave de caché es la secuencia de waypoints (redondeada a 6 decimales) más el
+servidor y el perfil, así que sobrevive a reinicios. Si OSRM no responde se devuelve
+la línea recta entre waypoints (sin cachearla) y se avisa por consola.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.config.osrm_config import OSRM_URL, OSRM_PROFILE, OSRM_TIMEOUT, osrm_workers
+from src.utils.stage_cache import StageCache
+from src.utils.instrumentation import span
+
+
+class GeometryService:
+
+    def __init__(self, base_url=OSRM_URL, profile=OSRM_PROFILE, timeout=OSRM_TIMEOUT,
+                 workers=None, cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.profile = profile
+        self.timeout = timeout
+        self.workers = osrm_workers(self.base_url, workers)
+        self.cache = cache if cache is not None else StageCache()
+        self._local = threading.local()
+        self._executor = None
+
+    def _session(self):
+        # Una sesión HTTP por hilo: keep-alive sin compartir la sesión entre hilos
+        s = getattr(self._local, 'session', None)
+        if s is None:
+            import requests
+            s = self._local.session = requests.Session()
+        return s
+
+    def _clave(self, waypoints):
+        return StageCache.hash_inputs('geometria', self.base_url, self.profile,
+                                      np.round(np.asarray(waypoints, dtype=float), 6))
+
+    def _fetch(self, waypoints):
+        """Una llamada a OSRM /route. Retorna [[lat, lon], ...] o None si falla."""
+        coords = ";".join(f"{p[1]:.6f},{p[0]:.6f}" for p in waypoints)
+        url = f"{self.base_url}/route/v1/{self.profile}/{coords}"
+        try:
+            r = self._session().get(url, params={'overview': 'full', 'geometries': 'geojson'},
+                                    timeout=self.timeout)
+            if r.status_code == 200:
+                data = r.json()
+                if data.get('routes'):
+                    # OSRM devuelve [lon, lat], convertimos a [lat, lon]
+                    return [[p[1], p[0]] for p in data['routes'][0]['geometry']['coordinates']]
+            print(f"   ⚠️ OSRM respondió {r.status_code} ({self.base_url}); se usa línea recta.")
+        except Exception as e:
+            print(f"   ⚠️ OSRM no disponible ({self.base_url}: {type(e).__name__}); se usa línea recta.")
+        return None
+
+    def ruta(self, waypoints):
+        """Geometría de una ruta (lista de [lat, lon]); línea recta si OSRM falla."""
+        if not waypoints or len(waypoints) < 2:
+            return waypoints
+        key = self._clave(waypoints)
+        hit, geometry = self.cache.get('geometria', key)
+        if hit:
+            return geometry
+        geometry = self._fetch(waypoints)
+        if geometry is None:
+            return [list(p) for p in waypoints]
+        self.cache.put('geometria', key, geometry)
+        return geometry
+
+    def rutas(self, lista_waypoints):
+        """Geometrías de varias rutas en paralelo (mismo orden que la entrada)."""
+        lista_waypoints = list(lista_waypoints)
+        if not lista_waypoints:
+            return []
+        with span('geometria', rutas=len(lista_waypoints)):
+            if len(lista_waypoints) == 1 or self.workers <= 1:
+                return [self.ruta(w) for w in lista_waypoints]
+            if self._executor is None:
+                # Pool persistente: sus hilos conservan la sesión HTTP entre llamadas
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="osrm")
+            return list(self._executor.map(self.ruta, lista_waypoints))
+
+
+_default = None
+
+
+def servicio_geometria():
+    """Instancia compartida (mantiene las conexiones abiertas entre llamadas)."""
+    global _default
+    if _default is None:
+        _default = GeometryService()
+    return _default
@@ -0,0 +1,279 @@
+"""
+Instrumentación ligera del pipeline: spans anidados con duración, contadores
+(filas, paradas, k...) y memoria pico por etapa.
+
+Uso:
+    from src.utils.instrumentation import span, PerfRecorder
+
+    rec = PerfRecorder()
+    with rec.activate():
+        with span('clustering', rows=len(df)) as s:
+            ...
+            s.count('clusters', k)
+    rec.report()                      # lista de spans (dicts anidados)
+    export_json(rec.report(), 'perf.json')
+    export_prometheus(rec.report(), 'perf.prom')
+
+La memoria pico por etapa se mide con tracemalloc solo si IADELIVERY_PERF_MEMORY=1
+(tiene sobrecoste). Siempre se anota el pico de RSS del proceso al cerrar cada span.
+"""
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACK_MEMORY = os.environ.get('IADELIVERY_PERF_MEMORY', '0') == '1'
+
+_state = threading.local()
+
+
+def _rss_max_mb():
+    if resource is None: return None
+    # ru_maxrss está en KB en Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Span:
+    __slots__ = ('name', 'start', 'duration_s', 'counters', 'children', 'peak_mem_bytes', 'rss_max_mb')
+
+    def __init__(self, name, counters):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration_s = None
+        self.counters = dict(counters)
+        self.children = []
+        self.peak_mem_bytes = None
+        self.rss_max_mb = None
+
+    def count(self, key, value=1):
+        """Suma value al contador key de este span."""
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, key, value):
+        self.counters[key] = value
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'duration_s': round(self.duration_s, 6) if self.duration_s is not None else None,
+            'counters': self.counters,
+            'peak_mem_mb': round(self.peak_mem_bytes / 1e6, 3) if self.peak_mem_bytes is not None else None,
+            'rss_max_mb': self.rss_max_mb,
+            'children': [c.to_dict() for c in self.children]
+        }
+
+
+class PerfRecorder:
+
+    def __init__(self, track_memory=TRACK_MEMORY):
+        self.track_memory = track_memory
+        self.roots = []
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+
+    def _stack(self):
+        tid = threading.get_ident()
+        stack = self._stacks.get(tid)
+        if stack is None:
+            stack = self._stacks[tid] = []
+        return stack
+
+    @contextmanager
+    def activate(self):
+        """Hace de este recorder el destino de span() en el hilo actual."""
+        previous = getattr(_state, 'recorder', None)
+        _state.recorder = self
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        try:
+            yield self
+        finally:
+            _state.recorder = previous
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    @contextmanager
+    def span(self, name, **counters):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        s = Span(name, counters)
+
+        tracing = self.track_memory and tracemalloc.is_tracing()
+        if tracing:
+            # Guardamos el pico del padre antes de reiniciarlo para medir solo esta etapa
+            if parent is not None:
+                parent.peak_mem_bytes = max(parent.peak_mem_bytes or 0, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        stack.append(s)
+        try:
+            yield s
+        finally:
+            s.duration_s = time.perf_counter() - s.start
+            stack.pop()
+            if tracing:
+                s.peak_mem_bytes = max(s.peak_mem_bytes or 0, tracemalloc.get_traced_memory()[1])
+                if parent is not None:
+                    parent.peak_mem_bytes = max(parent.peak_mem_bytes or 0, s.peak_mem_bytes)
+            s.rss_max_mb = _rss_max_mb()
+            if parent is not None:
+                parent.children.append(s)
+            else:
+                with self._lock:
+                    self.roots.append(s)
+
+    def current_span(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def reset(self):
+        with self._lock:
+            self.roots = []
+            self._stacks = {}
+
+    def report(self):
+        with self._lock:
+            return [s.to_dict() for s in self.roots]
+
+
+def current_recorder():
+    """Recorder activo en el hilo actual (o None)."""
+    return getattr(_state, 'recorder', None)
+
+
+@contextmanager
+def _span_suelto(name, counters):
+    # Sin recorder activo (simulador, scripts, servicios usados directamente) no se guarda
+    # nada: un recorder global acumularía spans sin límite en procesos de larga vida
+    yield Span(name, counters)
+
+
+def span(name, **counters):
+    """Abre un span en el recorder activo del hilo (sin recorder no se registra)."""
+    rec = current_recorder()
+    if rec is None:
+        return _span_suelto(name, counters)
+    return rec.span(name, **counters)
+
+
+def count(key, value=1):
+    """Suma un contador en el span abierto actualmente (si lo hay)."""
+    rec = current_recorder()
+    s = rec.current_span() if rec is not None else None
+    if s is not None: s.count(key, value)
+
+
+def traced(name):
+    """Decorador: ejecuta la función dentro de un span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recorded(name):
+    """
+    Decorador para puntos de entrada que devuelven un dict de resultado:
+    ejecuta la función con un PerfRecorder propio y adjunta el informe en res['perf'].
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rec = PerfRecorder()
+            with rec.activate():
+                with rec.span(name):
+                    res = fn(*args, **kwargs)
+            if isinstance(res, dict):
+                res['perf'] = rec.report()
+            return res
+        return wrapper
+    return decorator
+
+
+# ----------------------------------------------------------------------
+# EXPORTACIÓN
+# ----------------------------------------------------------------------
+def flatten(report, prefix=""):
+    """Spans anidados -> filas planas con la ruta completa ('pipeline/clustering/kmeans')."""
+    rows = []
+    for s in report:
+        path = f"{prefix}/{s['name']}" if prefix else s['name']
+        rows.append({
+            'stage': path,
+            'duration_s': s['duration_s'],
+            'peak_mem_mb': s['peak_mem_mb'],
+            'rss_max_mb': s['rss_max_mb'],
+            **{f"n_{k}": v for k, v in s['counters'].items() if isinstance(v, (int, float))}
+        })
+        rows.extend(flatten(s['children'], path))
+    return rows
+
+
+def aggregate(report):
+    """Agrega por etapa: llamadas, tiempo total, contadores sumados y pico de memoria máximo."""
+    agg = {}
+    for row in flatten(report):
+        a = agg.setdefault(row['stage'], {'stage': row['stage'], 'calls': 0, 'duration_s': 0.0,
+                                          'peak_mem_mb': None, 'counters': {}})
+        a['calls'] += 1
+        a['duration_s'] += row['duration_s'] or 0.0
+        if row['peak_mem_mb'] is not None:
+            a['peak_mem_mb'] = max(a['peak_mem_mb'] or 0, row['peak_mem_mb'])
+        for k, v in row.items():
+            if k.startswith('n_'):
+                a['counters'][k[2:]] = a['counters'].get(k[2:], 0) + v
+    return list(agg.values())
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def export_json(report, path):
+    _write_atomic(path, json.dumps(report, ensure_ascii=False, indent=1))
+
+
+def to_prometheus(report, prefix="iadelivery"):
+    """Informe -> texto en formato de exposición de Prometheus."""
+    lines = []
+
+    def metric(name, help_text, values):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        for labels, v in values:
+            lab = ",".join(f'{k}="{val}"' for k, val in labels.items())
+            lines.append(f"{prefix}_{name}{{{lab}}} {v}")
+
+    agg = aggregate(report)
+    metric("stage_duration_seconds", "Tiempo total por etapa del pipeline",
+           [({'stage': a['stage']}, round(a['duration_s'], 6)) for a in agg])
+    metric("stage_calls", "Número de ejecuciones de la etapa",
+           [({'stage': a['stage']}, a['calls']) for a in agg])
+    metric("stage_count", "Contadores por etapa (filas, paradas, clusters...)",
+           [({'stage': a['stage'], 'counter': k}, v) for a in agg for k, v in a['counters'].items()])
+    metric("stage_peak_memory_bytes", "Memoria Python pico por etapa (tracemalloc)",
+           [({'stage': a['stage']}, int(a['peak_mem_mb'] * 1e6)) for a in agg if a['peak_mem_mb'] is not None])
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(report, path, prefix="iadelivery"):
+    """Escribe el informe como textfile de Prometheus (node_exporter textfile collector)."""
+    _write_atomic(path, to_prometheus(report, prefix))
@@ -1,47 +1,147 @@
+import os
+
 import folium
-import requests
+import numpy as np
 import pandas as pd
-import streamlit as st
+from src.utils.instrumentation import traced, count
+from src.utils.profiling import profiled
+from src.utils.geometry_service import servicio_geometria
+from src.models.route_result import RouteResult
 
 # Constantes visuales
 HUB_COORDS = [41.5381, 2.4447]  # Mataró
 COLORS = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'cadetblue', 'darkpurple', 'black']
 
-@st.cache_data(show_spinner=False)
-def get_full_route_geometry(waypoints):
+# Modo de dibujo: 'detallado' (un CircleMarker con popup HTML por pedido), 'escalable'
+# (GeoJSON por ruta sobre canvas, popups construidos al hacer clic) o 'auto' (escalable
+# a partir de MAP_MAX_MARKERS paradas)
+MAP_MODE = os.environ.get('IADELIVERY_MAP_MODE', 'auto')
+MAP_MAX_MARKERS = int(os.environ.get('IADELIVERY_MAP_MAX_MARKERS', 500))
+# Zoom al que la simplificación de las polilíneas pierde como mucho 1 píxel
+MAP_DETAIL_ZOOM = int(os.environ.get('IADELIVERY_MAP_DETAIL_ZOOM', 14))
+
+
+def tolerancia_zoom(zoom=MAP_DETAIL_ZOOM, pixeles=1.0):
+    """Grados que ocupa `pixeles` en un mapa web Mercator (teselas de 256 px) al zoom dado."""
+    return pixeles * 360.0 / (256 * 2 ** zoom)
+
+
+def simplificar_rdp(puntos, tolerancia):
     """
-    Obtiene la geometría completa de la ruta en UNA SOLA llamada a OSRM.
-    Esto es mucho más rápido que pedir tramo a tramo.
+    Ramer-Douglas-Peucker sobre [[lat, lon], ...]; conserva extremos.
+    Por rondas: todos los segmentos abiertos se parten a la vez (vectorizado),
+    así el coste es O(n) por nivel de profundidad y no un bucle por vértice.
     """
-    if not waypoints or len(waypoints) < 2:
-        return waypoints
+    p = np.asarray(puntos, dtype=float)
+    if len(p) < 3 or tolerancia <= 0:
+        return p
+    conservar = np.zeros(len(p), dtype=bool)
+    conservar[[0, -1]] = True
+    pendientes = np.arange(1, len(p) - 1)
+    while len(pendientes):
+        claves = np.flatnonzero(conservar)
+        seg = np.searchsorted(claves, pendientes) - 1
+        a = p[claves[seg]]
+        ab = p[claves[seg + 1]] - a
+        rel = p[pendientes] - a
+        norma = np.hypot(ab[:, 0], ab[:, 1])
+        d = np.where(norma > 0,
+                     np.abs(ab[:, 0] * rel[:, 1] - ab[:, 1] * rel[:, 0]) / np.where(norma > 0, norma, 1),
+                     np.hypot(rel[:, 0], rel[:, 1]))
+        # Máxima desviación de cada segmento, repetida sobre sus puntos
+        inicios = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        maximo = np.repeat(np.maximum.reduceat(d, inicios), np.diff(np.r_[inicios, len(seg)]))
+        partir = maximo > tolerancia
+        # Primer punto de máxima desviación de cada segmento que se parte
+        candidatos = np.flatnonzero(partir & (d == maximo))
+        _, primero = np.unique(seg[candidatos], return_index=True)
+        conservar[pendientes[candidatos[primero]]] = True
+        pendientes = pendientes[partir & ~conservar[pendientes]]
+    return p[conservar]
 
-    try:
-        # Construir string de coordenadas "lon,lat;lon,lat..."
-        coords = ";".join([f"{p[1]:.6f},{p[0]:.6f}" for p in waypoints])
-        
-        # OSRM Demo Server
-        url = f"http://router.project-osrm.org/route/v1/driving/{coords}?overview=full&geometries=geojson"
-        
-        # Timeout corto para no bloquear la app
-        r = requests.get(url, timeout=2.0) 
-        
-        if r.status_code == 200:
-            data = r.json()
-            if 'routes' in data and len(data['routes']) > 0:
-                geometry = data['routes'][0]['geometry']['coordinates']
-                # OSRM devuelve [lon, lat], convertimos a [lat, lon]
-                return [[p[1], p[0]] for p in geometry]
-    except Exception:
-        pass
-
-    return waypoints
-
-def create_interactive_map(rutas_data):
+
+def _dato(detalle, clave, defecto):
+    valor = detalle.get(clave, defecto)
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+
+def _capas_detalladas(m, i, color, nombre_vehiculo, raw_points, detalles_pedidos, linea):
+    folium.PolyLine(
+        locations=linea.tolist(),
+        color=color,
+        weight=4,
+        opacity=0.7,
+        tooltip=f"Ruta {i+1}: {nombre_vehiculo}"
+    ).add_to(m)
+
+    # Marcadores de Pedidos
+    for idx, (coord, detalle) in enumerate(zip(raw_points, detalles_pedidos)):
+        pid = detalle.get('PedidoID', detalle.get('id', '?'))
+        peso = detalle.get('Peso_Total_Kg', 0)
+        nombre = detalle.get('nombre_completo', 'Cliente')
+
+        folium.CircleMarker(
+            location=coord,
+            radius=5,
+            color=color,
+            fill=True,
+            fill_color="white",
+            fill_opacity=1,
+            popup=folium.Popup(f"<b>P{idx+1}</b><br>{nombre}<br>Pedido: {pid}<br>{peso} Kg", max_width=200),
+            tooltip=f"{idx+1}. {nombre}"
+        ).add_to(m)
+
+
+def _capas_escalables(m, i, color, nombre_vehiculo, raw_points, detalles_pedidos, linea):
+    """
+    Una FeatureGroup por ruta con dos GeoJSON (línea y paradas). Los datos de cada
+    parada viajan como propiedades; el popup se construye en el navegador al hacer clic.
+    """
+    grupo = folium.FeatureGroup(name=f"Ruta {i+1}: {nombre_vehiculo}")
+
+    folium.GeoJson(
+        {'type': 'Feature', 'properties': {},
+         'geometry': {'type': 'LineString', 'coordinates': linea[:, ::-1].round(6).tolist()}},
+        style_function=lambda _, c=color: {'color': c, 'weight': 4, 'opacity': 0.7},
+        tooltip=f"Ruta {i+1}: {nombre_vehiculo}",
+        control=False
+    ).add_to(grupo)
+
+    paradas = [
+        {'type': 'Feature',
+         'geometry': {'type': 'Point', 'coordinates': [round(float(coord[1]), 6), round(float(coord[0]), 6)]},
+         'properties': {'n': idx + 1,
+                        'cliente': str(_dato(detalle, 'nombre_completo', 'Cliente')),
+                        'pedido': str(_dato(detalle, 'PedidoID', detalle.get('id', '?'))),
+                        'kg': _dato(detalle, 'Peso_Total_Kg', 0)}}
+        for idx, (coord, detalle) in enumerate(zip(raw_points, detalles_pedidos))
+    ]
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': paradas},
+        marker=folium.CircleMarker(radius=4, color=color, fill=True, fill_color="white", fill_opacity=1),
+        popup=folium.GeoJsonPopup(fields=['n', 'cliente', 'pedido', 'kg'],
+                                  aliases=['Parada', 'Cliente', 'Pedido', 'Kg']),
+        control=False
+    ).add_to(grupo)
+
+    grupo.add_to(m)
+
+
+@traced('mapa')
+@profiled('mapa')
+def create_interactive_map(rutas_data, modo=None, geometrias=None):
     """
     Genera el objeto Mapa de Folium con las rutas y marcadores.
+    `modo`: 'detallado' | 'escalable' | 'auto' (por defecto MAP_MODE).
+    `geometrias`: trazados ya calculados (uno por ruta dibujable); si no, se piden a OSRM.
     """
-    m = folium.Map(location=[40.4168, -3.7038], zoom_start=6, tiles="CartoDB positron")
+    modo = modo or MAP_MODE
+    total_paradas = sum(len(r.get('ruta', [])) for r in rutas_data or [])
+    escalable = modo == 'escalable' or (modo == 'auto' and total_paradas > MAP_MAX_MARKERS)
+
+    # En modo escalable los vectores se pintan sobre canvas (un único elemento DOM)
+    m = folium.Map(location=[40.4168, -3.7038], zoom_start=6, tiles="CartoDB positron",
+                   prefer_canvas=escalable)
 
     # Marcador HUB
     folium.Marker(
@@ -54,13 +154,18 @@ def create_interactive_map(rutas_data):
     if not rutas_data:
         return m
 
+    # 1. Paradas de cada ruta
+    trazados = []
     for i, ruta_info in enumerate(rutas_data):
         color = COLORS[i % len(COLORS)]
         nombre_vehiculo = ruta_info.get('vehiculo', f'Vehículo {i+1}')
         orden_paradas = ruta_info.get('ruta', [])
         
-        # Extracción de datos agnóstica (acepta DF o lista de dicts)
-        if isinstance(orden_paradas, pd.DataFrame):
+        # Extracción de datos agnóstica (acepta RouteResult, DF o lista de dicts)
+        if isinstance(orden_paradas, RouteResult):
+            raw_points = orden_paradas.coordenadas().tolist()
+            detalles_pedidos = orden_paradas.registros(['PedidoID', 'Peso_Total_Kg', 'nombre_completo'])
+        elif isinstance(orden_paradas, pd.DataFrame):
             raw_points = orden_paradas[['Latitud', 'Longitud']].values.tolist()
             detalles_pedidos = orden_paradas.to_dict('records')
         elif isinstance(orden_paradas, list):
@@ -71,34 +176,21 @@ def create_interactive_map(rutas_data):
 
         if not raw_points:
             continue
+        count('paradas', len(raw_points))
+        trazados.append((i, color, nombre_vehiculo, raw_points, detalles_pedidos))
 
-        # 1. Trazado de Carretera (Llamada optimizada)
-        ruta_completa_puntos = [HUB_COORDS] + raw_points + [HUB_COORDS]
-        road_geometry = get_full_route_geometry(ruta_completa_puntos)
+    # 2. Trazado de Carretera: todas las rutas a la vez (OSRM concurrente + caché en disco)
+    if geometrias is None:
+        geometrias = servicio_geometria().rutas([[HUB_COORDS] + t[3] + [HUB_COORDS] for t in trazados])
 
-        folium.PolyLine(
-            locations=road_geometry,
-            color=color,
-            weight=4,
-            opacity=0.7,
-            tooltip=f"Ruta {i+1}: {nombre_vehiculo}"
-        ).add_to(m)
+    # 3. Capas por ruta (polilínea simplificada a 1 px al zoom de detalle)
+    tolerancia = tolerancia_zoom()
+    capas = _capas_escalables if escalable else _capas_detalladas
+    for (i, color, nombre_vehiculo, raw_points, detalles_pedidos), road_geometry in zip(trazados, geometrias):
+        linea = simplificar_rdp(road_geometry, tolerancia)
+        count('vertices', len(linea))
+        capas(m, i, color, nombre_vehiculo, raw_points, detalles_pedidos, linea)
 
-        # 2. Marcadores de Pedidos
-        for idx, (coord, detalle) in enumerate(zip(raw_points, detalles_pedidos)):
-            pid = detalle.get('PedidoID', detalle.get('id', '?'))
-            peso = detalle.get('Peso_Total_Kg', 0)
-            nombre = detalle.get('nombre_completo', 'Cliente')
-            
-            folium.CircleMarker(
-                location=coord,
-                radius=5,
-                color=color,
-                fill=True,
-                fill_color="white",
-                fill_opacity=1,
-                popup=folium.Popup(f"<b>P{idx+1}</b><br>{nombre}<br>Pedido: {pid}<br>{peso} Kg", max_width=200),
-                tooltip=f"{idx+1}. {nombre}"
-            ).add_to(m)
-
-    return m
\ No newline at end of file
+    if escalable:
+        folium.LayerControl(collapsed=True).add_to(m)
+    return m
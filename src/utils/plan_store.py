@@ -0,0 +1,237 @@
+"""
+Histórico de planes en SQLite (data/plans/planes.sqlite).
+
+Cada plan guarda sus KPIs, sus clusters (vehículo, centroide, carga) y la secuencia de
+paradas de cada ruta. Sirve para consultar y comparar planes pasados y para arrancar
+en caliente el siguiente: centroides iniciales del KMeans y orden de visita previo de
+los destinos que se repiten (ver LogisticsController._semillas).
+
+    python -m src.utils.plan_store                 # últimos planes
+    python -m src.utils.plan_store --plan 12       # rutas de un plan
+    python -m src.utils.plan_store --comparar 11 12
+"""
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+PLANS_ENABLED = os.environ.get('IADELIVERY_PLANS', '1') != '0'
+PLANS_DB = os.environ.get('IADELIVERY_PLANS_DB', 'data/plans/planes.sqlite')
+WARM_START = os.environ.get('IADELIVERY_WARM_START', '0') == '1'
+# Fracción mínima de destinos compartidos para arrancar en caliente desde un plan
+WARM_START_SOLAPE = float(os.environ.get('IADELIVERY_WARM_START_SOLAPE', 0.5))
+# Planes más recientes entre los que se busca uno que se solape
+WARM_START_RECIENTES = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS planes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    creado TEXT, modo TEXT, fecha_inicio TEXT, flota TEXT,
+    coste REAL, km REAL, n_rutas INTEGER,
+    pedidos_entregados INTEGER, pedidos_descartados INTEGER, plan_previo INTEGER
+);
+CREATE TABLE IF NOT EXISTS clusters (
+    plan_id INTEGER, cluster_id INTEGER, vehiculo TEXT, tipo_vehiculo INTEGER,
+    centro_lat REAL, centro_lon REAL, pedidos INTEGER, carga REAL, km REAL
+);
+CREATE TABLE IF NOT EXISTS paradas (
+    plan_id INTEGER, cluster_id INTEGER, orden INTEGER, pedido_id TEXT, destino TEXT,
+    lat REAL, lon REAL, km_acum REAL, min_acum REAL
+);
+CREATE INDEX IF NOT EXISTS idx_clusters_plan ON clusters(plan_id);
+CREATE INDEX IF NOT EXISTS idx_paradas_plan ON paradas(plan_id);
+"""
+
+
+def clave_destino(lat, lon):
+    """Clave de un destino (coordenadas a 5 decimales, ~1 m); acepta escalares o arrays."""
+    lat, lon = np.atleast_1d(lat), np.atleast_1d(lon)
+    return [f"{a:.5f},{b:.5f}" for a, b in zip(lat, lon)]
+
+
+def elegir_secuencia(secuencias, claves):
+    """
+    Secuencia previa con más destinos en común con `claves`, filtrada a esos destinos.
+    (Un cluster nuevo hereda el orden de la ruta anterior con la que más se solapa.)
+    """
+    claves = set(claves)
+    if not secuencias or not claves:
+        return []
+    solape = Counter(i for i, s in enumerate(secuencias) for c in s if c in claves)
+    if not solape:
+        return []
+    mejor = secuencias[solape.most_common(1)[0][0]]
+    return [c for c in mejor if c in claves]
+
+
+class PlanStore:
+
+    def __init__(self, path=PLANS_DB, enabled=PLANS_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._iniciado = False
+
+    def _conectar(self):
+        if not self._iniciado:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=30)
+        if not self._iniciado:
+            con.execute("PRAGMA journal_mode=WAL")  # varios procesos del batch escribiendo
+            con.executescript(SCHEMA)
+            self._iniciado = True
+        return con
+
+    @contextlib.contextmanager
+    def _conexion(self):
+        """Conexión con transacción (commit/rollback) que se cierra al salir."""
+        con = self._conectar()
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # ------------------------------------------------------------------
+    # ESCRITURA
+    # ------------------------------------------------------------------
+    def guardar(self, modo, fecha_inicio, res_clustering, rutas, plan_previo=None):
+        """Registra un plan (resultado de clustering + rutas). Retorna su id o None si está desactivado."""
+        if not self.enabled:
+            return None
+        acc = res_clustering.get('accepted_df')
+        disc = res_clustering.get('discarded_df')
+        rutas = [r for r in rutas or [] if r.get('ruta')]
+        entregados = {pid for r in rutas for pid in r['ruta'].columna('PedidoID').tolist()}
+
+        clusters = []
+        if acc is not None and not acc.empty:
+            g = acc.groupby('cluster_id')
+            resumen = pd.DataFrame({
+                'lat': g['Latitud'].mean(), 'lon': g['Longitud'].mean(),
+                'pedidos': g.size(), 'carga': g['Peso_Total_Kg'].sum(),
+                'vehiculo': g['vehiculo_nombre'].first() if 'vehiculo_nombre' in acc else None,
+                'tipo': g['tipoVehiculo_id'].first() if 'tipoVehiculo_id' in acc else None
+            })
+            km = {r['cluster_id']: r['km'] for r in rutas}
+            clusters = [(int(cid), f.vehiculo, None if pd.isna(f.tipo) else int(f.tipo),
+                         float(f.lat), float(f.lon), int(f.pedidos), float(f.carga), float(km.get(cid, 0.0)))
+                        for cid, f in resumen.iterrows()]
+
+        paradas = []
+        for r in rutas:
+            ruta = r['ruta']
+            lat, lon = ruta.columna('Latitud'), ruta.columna('Longitud')
+            for i, (pid, destino, la, lo, km_i, min_i) in enumerate(zip(
+                    ruta.columna('PedidoID').tolist(), clave_destino(lat, lon), lat.tolist(), lon.tolist(),
+                    ruta.km_acum.tolist(), ruta.min_acum.tolist())):
+                paradas.append((int(r['cluster_id']), i, str(pid), destino, la, lo, km_i, min_i))
+
+        fila = (datetime.now().isoformat(timespec='seconds'), modo, str(fecha_inicio),
+                json.dumps({str(k): int(v) for k, v in (res_clustering.get('fleet_used') or {}).items()}),
+                float(res_clustering.get('metrics', {}).get('cost') or 0.0),
+                float(sum(r['km'] for r in rutas)), len(rutas), len(entregados),
+                0 if disc is None else len(disc), plan_previo)
+
+        with self._conexion() as con:
+            plan_id = con.execute(
+                "INSERT INTO planes (creado, modo, fecha_inicio, flota, coste, km, n_rutas, "
+                "pedidos_entregados, pedidos_descartados, plan_previo) VALUES (?,?,?,?,?,?,?,?,?,?)", fila).lastrowid
+            con.executemany("INSERT INTO clusters VALUES (?,?,?,?,?,?,?,?,?)", [(plan_id, *c) for c in clusters])
+            con.executemany("INSERT INTO paradas VALUES (?,?,?,?,?,?,?,?,?)", [(plan_id, *p) for p in paradas])
+        return plan_id
+
+    # ------------------------------------------------------------------
+    # CONSULTA
+    # ------------------------------------------------------------------
+    def _consulta(self, sql, params=()):
+        if not os.path.exists(self.path):
+            return pd.DataFrame()
+        with self._conexion() as con:
+            return pd.read_sql_query(sql, con, params=params)
+
+    def ultimo(self, destinos=None, solape_min=WARM_START_SOLAPE, recientes=WARM_START_RECIENTES):
+        """
+        Id del plan más reciente (o None). Con `destinos` (claves de clave_destino), el más
+        reciente de los últimos `recientes` cuyos destinos coinciden al menos en `solape_min`
+        con ellos (sobre el menor de los dos conjuntos): un plan de otro origen de datos no
+        sirve de semilla.
+        """
+        if destinos is None:
+            df = self._consulta("SELECT MAX(id) AS id FROM planes")
+            return None if df.empty or pd.isna(df['id'].iloc[0]) else int(df['id'].iloc[0])
+        destinos = set(destinos)
+        df = self._consulta("SELECT DISTINCT plan_id, destino FROM paradas WHERE plan_id IN "
+                            "(SELECT id FROM planes ORDER BY id DESC LIMIT ?)", (recientes,))
+        if df.empty or not destinos:
+            return None
+        for plan_id, g in sorted(df.groupby('plan_id'), key=lambda x: -x[0]):
+            previos = set(g['destino'])
+            if len(previos & destinos) >= solape_min * min(len(previos), len(destinos)):
+                return int(plan_id)
+        return None
+
+    def listar(self, limite=20):
+        return self._consulta("SELECT * FROM planes ORDER BY id DESC LIMIT ?", (limite,))
+
+    def clusters(self, plan_id):
+        return self._consulta("SELECT * FROM clusters WHERE plan_id = ? ORDER BY cluster_id", (plan_id,))
+
+    def paradas(self, plan_id):
+        return self._consulta("SELECT * FROM paradas WHERE plan_id = ? ORDER BY cluster_id, orden", (plan_id,))
+
+    def comparar(self, plan_a, plan_b):
+        """KPIs de dos planes y la diferencia (b - a)."""
+        df = self._consulta("SELECT * FROM planes WHERE id IN (?, ?)", (plan_a, plan_b)).set_index('id')
+        if plan_a not in df.index or plan_b not in df.index:
+            return {'status': 'error', 'msg': f"No existen los planes {plan_a} y {plan_b}."}
+        kpis = ['coste', 'km', 'n_rutas', 'pedidos_entregados', 'pedidos_descartados']
+        a, b = df.loc[plan_a, kpis], df.loc[plan_b, kpis]
+        destinos = [set(self.paradas(p)['destino']) for p in (plan_a, plan_b)]
+        return {
+            'status': 'success',
+            'a': a.to_dict(), 'b': b.to_dict(), 'diferencia': (b - a).to_dict(),
+            'destinos_comunes': len(destinos[0] & destinos[1])
+        }
+
+    def semillas(self, plan_id):
+        """
+        Semillas de arranque en caliente de un plan:
+        (centroides (m, 2) [lat, lon], [secuencia de destinos de cada ruta]).
+        """
+        cl = self.clusters(plan_id)
+        centros = cl[['centro_lat', 'centro_lon']].to_numpy(dtype=float) if not cl.empty else None
+        secuencias = []
+        for _, g in self.paradas(plan_id).groupby('cluster_id', sort=True):
+            # Orden de primera visita de cada destino (la ruta vuelve al inicio al final)
+            secuencias.append(list(dict.fromkeys(g['destino'])))
+        return centros, secuencias
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta del histórico de planes")
+    parser.add_argument("--db", default=PLANS_DB)
+    parser.add_argument("--plan", type=int, default=None, help="Muestra los clusters y paradas de un plan")
+    parser.add_argument("--comparar", type=int, nargs=2, default=None, metavar=("A", "B"))
+    parser.add_argument("--limite", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    store = PlanStore(args.db)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        if args.comparar:
+            print(json.dumps(store.comparar(*args.comparar), indent=1, ensure_ascii=False, default=str))
+        elif args.plan is not None:
+            print(store.clusters(args.plan).to_string(index=False))
+            print(store.paradas(args.plan).to_string(index=False))
+        else:
+            print(store.listar(args.limite).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
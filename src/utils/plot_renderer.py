@@ -1,90 +1,130 @@
+import os
+
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 import pandas as pd
 
+from src.models.clustering_service import HUB_COORDS
+
+# Máximo de fotogramas de la animación de rutas (con más pasos se diezman) y de trazas
+# en total (fotogramas x vehículos), que es lo que marca el peso de la figura con flotas grandes
+ANIMATION_MAX_FRAMES = int(os.environ.get('IADELIVERY_ANIM_MAX_FRAMES', 60))
+ANIMATION_MAX_TRAZAS = int(os.environ.get('IADELIVERY_ANIM_MAX_TRAZAS', 2000))
+# Mapa de zonas: por encima de ZONES_MAX_POINTS pedidos se pinta la densidad en vez de
+# cada punto; con más de ZONES_MAX_LEGEND zonas, una sola traza coloreada por código
+ZONES_MAX_POINTS = int(os.environ.get('IADELIVERY_ZONES_MAX_POINTS', 20000))
+ZONES_MAX_LEGEND = 24
+ZONES_GRID = 250
+
+
+def pasos_animacion(max_steps, max_frames=ANIMATION_MAX_FRAMES):
+    """Pasos que se convierten en fotograma: todos, o `max_frames` equiespaciados (incluye el último)."""
+    if max_frames is None or max_steps + 1 <= max_frames:
+        return np.arange(max_steps + 1)
+    return np.unique(np.linspace(0, max_steps, max(int(max_frames), 2)).round().astype(int))
+
 class AuditPlotter:
-    
+
     @staticmethod
-    def plot_clustering_zones(rutas):
+    def plot_clustering_zones(pedidos, max_puntos=ZONES_MAX_POINTS):
         """
-        Genera el mapa estático de zonas (Clustering).
+        Genera el mapa estático de zonas (Clustering) a partir de los pedidos aceptados
+        (Latitud, Longitud, cluster_id, vehiculo_nombre). Trazas WebGL (MapLibre); con más
+        de `max_puntos` pedidos, densidad sobre una rejilla agregada. Centroides y hub superpuestos.
         """
-        puntos_cluster = []
-        for r in rutas:
-            for p in r.get('ruta', []):
-                puntos_cluster.append({
-                    'Latitud': p.get('Latitud'),
-                    'Longitud': p.get('Longitud'),
-                    'Zona': f"C{r['cluster_id']} ({r['vehiculo']})",
-                    'Cliente': p.get('nombre_completo')
-                })
-        
-        if not puntos_cluster:
+        if pedidos is None or len(pedidos) == 0:
             return None
 
-        df_clust = pd.DataFrame(puntos_cluster)
-        
-        fig = px.scatter_mapbox(
-            df_clust, 
-            lat="Latitud", 
-            lon="Longitud", 
-            color="Zona",
-            hover_name="Cliente", 
-            zoom=5, 
-            height=500
-        )
-        fig.update_layout(mapbox_style="carto-positron", margin={"r":0,"t":0,"l":0,"b":0})
+        lat = pedidos['Latitud'].to_numpy(dtype=float)
+        lon = pedidos['Longitud'].to_numpy(dtype=float)
+        zona, ids = pd.factorize(pedidos['cluster_id'], sort=True)
+        vehiculo = pedidos['vehiculo_nombre'].to_numpy() if 'vehiculo_nombre' in pedidos else np.full(len(lat), '')
+        etiquetas = [f"C{c} ({v})" for c, v in zip(ids, pd.Series(vehiculo).groupby(zona).first())]
+
+        fig = go.Figure()
+        if len(lat) > max_puntos:
+            # Rejilla de ~ZONES_GRID celdas por lado: un punto ponderado por celda
+            celda = max(np.ptp(lat), np.ptp(lon), 1e-6) / ZONES_GRID
+            claves, n_celda = np.unique(np.column_stack((np.floor(lat / celda), np.floor(lon / celda))),
+                                        axis=0, return_counts=True)
+            fig.add_trace(go.Densitymap(lat=(claves[:, 0] + 0.5) * celda, lon=(claves[:, 1] + 0.5) * celda,
+                                        z=n_celda, radius=10, colorscale='Viridis', showscale=False,
+                                        name='Densidad', hovertemplate='%{z} pedidos<extra></extra>'))
+        elif len(ids) <= ZONES_MAX_LEGEND:
+            # Una traza por zona (leyenda clicable)
+            cliente = pedidos['nombre_completo'].to_numpy() if 'nombre_completo' in pedidos else None
+            orden = np.argsort(zona, kind='stable')
+            cortes = np.flatnonzero(np.diff(zona[orden])) + 1
+            for z, filas in zip(np.unique(zona), np.split(orden, cortes)):
+                fig.add_trace(go.Scattermap(
+                    lat=lat[filas], lon=lon[filas], mode='markers', name=etiquetas[z],
+                    marker=dict(size=8, color=px.colors.qualitative.Plotly[z % len(px.colors.qualitative.Plotly)]),
+                    text=None if cliente is None else cliente[filas], hoverinfo='text+name'
+                ))
+        else:
+            # Muchas zonas: una sola traza coloreada por código de zona
+            fig.add_trace(go.Scattermap(
+                lat=lat, lon=lon, mode='markers', name='Pedidos', showlegend=False,
+                marker=dict(size=5, color=zona, colorscale='Turbo', opacity=0.8),
+                customdata=zona, hovertemplate='Zona %{customdata}<extra></extra>'
+            ))
+
+        # Centroides de cada zona (medias por código, sin agrupar DataFrames)
+        n_zona = np.bincount(zona)
+        fig.add_trace(go.Scattermap(
+            lat=np.bincount(zona, lat) / n_zona, lon=np.bincount(zona, lon) / n_zona,
+            mode='markers', name='Centroides', text=etiquetas, hoverinfo='text',
+            marker=dict(size=11, color='black', opacity=0.7)
+        ))
+        fig.add_trace(go.Scattermap(
+            lat=[HUB_COORDS[0]], lon=[HUB_COORDS[1]], mode='markers', name='Hub',
+            marker=dict(size=16, color='red'), hoverinfo='name'
+        ))
+
+        fig.update_layout(map=dict(style="carto-positron", zoom=5,
+                                   center=dict(lat=float(np.mean(lat)), lon=float(np.mean(lon)))),
+                          height=500, margin={"r":0,"t":0,"l":0,"b":0})
         return fig
 
     @staticmethod
-    def plot_routing_animation(rutas):
+    def plot_routing_animation(rutas, max_frames=ANIMATION_MAX_FRAMES):
         """
         Genera la animación global de todas las rutas simultáneas.
+        El fotograma s de cada vehículo es el prefijo de su ruta hasta la parada s
+        (si el camión acabó antes, se queda quieto en su última posición).
+        Como mucho `max_frames` fotogramas (y ANIMATION_MAX_TRAZAS trazas); None = todos los pasos.
         """
-        # 1. Preparar estructura de datos
-        veh_histories = {}
-        max_steps = 0
-        
-        for r in rutas:
-            raw_hist = r.get('audit_history', [])
-            if not raw_hist: continue
-            
-            # Agrupar por step_index
-            steps_dict = {}
-            for item in raw_hist:
-                s_idx = item['step_index']
-                if s_idx not in steps_dict: steps_dict[s_idx] = []
-                steps_dict[s_idx].append(item)
-                if s_idx > max_steps: max_steps = s_idx
-            
-            veh_id = f"{r['vehiculo']} #{r['cluster_id']}"
-            veh_histories[veh_id] = steps_dict
+        # 1. Preparar estructura de datos: paradas de todos los vehículos en arrays planos
+        rutas = [r for r in rutas if r.get('ruta')]
+        max_steps = max((r['ruta'].pasos - 1 for r in rutas), default=0)
 
         if max_steps == 0:
             return None
 
-        # 2. Sincronizar Frames (Rellenar huecos)
-        combined_rows = []
-        for s in range(max_steps + 1):
-            for v_name, v_steps in veh_histories.items():
-                current_data = []
-                if s in v_steps:
-                    current_data = v_steps[s]
-                else:
-                    # Si el camión acabó antes, se queda quieto en su última posición
-                    last_step = max([k for k in v_steps.keys() if k < s], default=0)
-                    current_data = v_steps.get(last_step, [])
-                
-                for item in current_data:
-                    row = item.copy()
-                    row['Time_Step'] = s
-                    row['Vehiculo_ID'] = v_name
-                    combined_rows.append(row)
-        
-        if not combined_rows:
-            return None
+        lat = np.concatenate([r['ruta'].columna('Latitud') for r in rutas])
+        lon = np.concatenate([r['ruta'].columna('Longitud') for r in rutas])
+        nombres = np.concatenate([r['ruta'].columna('nombre_completo') for r in rutas])
+        largos = np.array([r['ruta'].pasos for r in rutas])
+        inicios = np.concatenate(([0], np.cumsum(largos)[:-1]))
+        veh_ids = np.array([f"{r['vehiculo']} #{r['cluster_id']}" for r in rutas], dtype=object)
+
+        # 2. Fotogramas (diezmados a max_frames) x vehículos, sin bucles por fila:
+        #    prefijo de n paradas = min(paso, largo - 1) + 1
+        if max_frames is not None:
+            max_frames = min(max_frames, max(2, ANIMATION_MAX_TRAZAS // len(rutas)))
+        pasos = pasos_animacion(max_steps, max_frames)
+        n = (np.minimum(pasos[:, None], largos[None, :] - 1) + 1).ravel()
+        comienzo = np.broadcast_to(inicios, (len(pasos), len(rutas))).ravel()
+        desplaz = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        filas = np.repeat(comienzo, n) + desplaz
+
+        df_anim = pd.DataFrame({
+            'Latitud': lat[filas], 'Longitud': lon[filas], 'nombre_completo': nombres[filas],
+            'Time_Step': np.repeat(np.repeat(pasos, len(rutas)), n),
+            'Vehiculo_ID': np.repeat(np.tile(veh_ids, len(pasos)), n)
+        })
 
-        df_anim = pd.DataFrame(combined_rows)
-        
         # 3. Generar Plotly
         fig = px.line_mapbox(
             df_anim,
@@ -93,16 +133,16 @@ class AuditPlotter:
             color="Vehiculo_ID",
             animation_frame="Time_Step",
             animation_group="Vehiculo_ID",
-            zoom=5, 
+            zoom=5,
             height=600
         )
-        
-        # Puntos de referencia
+
+        # Puntos de referencia (cada parada una vez)
         fig.add_scattermapbox(
-            lat=df_anim["Latitud"], lon=df_anim["Longitud"],
+            lat=lat, lon=lon,
             mode='markers', marker=dict(size=6, opacity=0.8), showlegend=False,
-            hoverinfo='text', text=df_anim['nombre_completo']
+            hoverinfo='text', text=nombres
         )
-        
+
         fig.update_layout(mapbox_style="carto-positron", margin={"r":0,"t":0,"l":0,"b":0})
-        return fig
\ No newline at end of file
+        return fig
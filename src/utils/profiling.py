@@ -0,0 +1,106 @@
+"""
+Perfilado bajo demanda de las etapas del pipeline (cProfile + tracemalloc).
+
+Desactivado por defecto. Se activa con IADELIVERY_PROFILE=1 (directorio en
+IADELIVERY_PROFILE_DIR) o desde la CLI con --profile. Por cada llamada a una etapa
+decorada con @profiled se escriben en el directorio:
+    <etapa>_<n>.prof   -> volcado de cProfile (abrir con pstats / snakeviz)
+    <etapa>_<n>.heap   -> snapshot de tracemalloc (tracemalloc.Snapshot.load)
+    <etapa>_<n>.txt    -> resumen: top-N funciones por tiempo acumulado y top-N líneas por memoria
+
+Con el perfilado desactivado el decorador solo comprueba un booleano.
+Las etapas anidadas (p.ej. solve dentro de un pipeline perfilado) no abren un segundo
+cProfile: quedan incluidas en el perfil de la etapa exterior.
+"""
+import cProfile
+import functools
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+PROFILE_DIR = os.environ.get('IADELIVERY_PROFILE_DIR', 'data/profiles')
+TOP_N = int(os.environ.get('IADELIVERY_PROFILE_TOP', '30'))
+
+_config = {'enabled': os.environ.get('IADELIVERY_PROFILE', '0') == '1', 'dir': PROFILE_DIR}
+_state = threading.local()
+_seq = itertools.count(1)
+
+
+def enable(profile_dir=None):
+    """Activa el perfilado (también para procesos hijos, vía entorno)."""
+    _config['enabled'] = True
+    if profile_dir: _config['dir'] = profile_dir
+    os.environ['IADELIVERY_PROFILE'] = '1'
+    os.environ['IADELIVERY_PROFILE_DIR'] = _config['dir']
+
+
+def disable():
+    _config['enabled'] = False
+    os.environ.pop('IADELIVERY_PROFILE', None)
+
+
+def is_enabled():
+    return _config['enabled']
+
+
+def _resumen(stage, duration_s, prof, snapshot, top_n):
+    out = io.StringIO()
+    out.write(f"Etapa: {stage}\nDuración: {duration_s:.3f} s\n\n")
+    out.write(f"=== cProfile: top {top_n} por tiempo acumulado ===\n")
+    pstats.Stats(prof, stream=out).sort_stats('cumulative').print_stats(top_n)
+    if snapshot is not None:
+        out.write(f"\n=== tracemalloc: top {top_n} líneas por memoria viva al final ===\n")
+        for stat in snapshot.statistics('lineno')[:top_n]:
+            out.write(f"{stat}\n")
+    return out.getvalue()
+
+
+def _volcar(stage, duration_s, prof, snapshot):
+    os.makedirs(_config['dir'], exist_ok=True)
+    base = os.path.join(_config['dir'], f"{stage}_{os.getpid()}_{next(_seq):03d}")
+    prof.dump_stats(f"{base}.prof")
+    if snapshot is not None:
+        snapshot.dump(f"{base}.heap")
+    with open(f"{base}.txt", "w", encoding="utf-8") as f:
+        f.write(_resumen(stage, duration_s, prof, snapshot, TOP_N))
+    print(f"   🔬 Perfil '{stage}' ({duration_s:.2f} s): {base}.txt")
+    return base
+
+
+def profiled(stage):
+    """Decorador: perfila la función si el perfilado está activo (sin coste si no)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _config['enabled'] or getattr(_state, 'active', False):
+                return fn(*args, **kwargs)
+
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                # Ya hay otro profiler activo (p.ej. python -m cProfile): no interferimos
+                return fn(*args, **kwargs)
+
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing: tracemalloc.start()
+            _state.active = True
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                prof.disable()
+                _state.active = False
+                duration = time.perf_counter() - t0
+                snapshot = tracemalloc.take_snapshot()
+                if started_tracing: tracemalloc.stop()
+                try:
+                    _volcar(stage, duration, prof, snapshot)
+                except OSError as e:
+                    print(f"   ⚠️ No se pudo guardar el perfil de '{stage}': {e}")
+        return wrapper
+    return decorator
@@ -0,0 +1,154 @@
+"""
+Plano de datos en memoria compartida para los procesos worker de routing y clustering.
+
+El proceso principal publica una sola vez los arrays que necesitan los workers
+(columnas de pedidos: Latitud, Longitud, Peso_Total_Kg, plazo en minutos; tabla de
+km por ubicación del proveedor OSRM) en un segmento de multiprocessing.shared_memory.
+A cada tarea solo viaja su descriptor (nombre del segmento + dtype, forma y offset de
+cada array, unos cientos de bytes) en vez del DataFrame maestro en pickle; el worker
+se adjunta y obtiene vistas numpy de solo lectura sin copiar.
+
+Ciclo de vida: el segmento es de quien lo publica y se borra (unlink) al salir del
+`with` o con close(); un atexit borra los que queden si el proceso termina antes.
+Cada worker mantiene abiertos solo los últimos segmentos a los que se adjuntó.
+
+    with DatosCompartidos({'Latitud': lat, 'Longitud': lon}) as datos:
+        pool.submit(tarea, datos.descriptor, ...)   # en el worker: adjuntar(descriptor)
+
+Los pools de procesos se crean con 'spawn' (fork tras cargar sklearn/OpenMP puede
+bloquearse). IADELIVERY_POOL_WORKERS fija su tamaño; 0 o 1 = todo en el proceso actual.
+"""
+import atexit
+import os
+import threading
+from collections import OrderedDict
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+POOL_WORKERS = int(os.environ.get('IADELIVERY_POOL_WORKERS', 0))
+
+_publicados = set()
+_lock = threading.Lock()
+
+
+class DatosCompartidos:
+    """Arrays numpy con nombre en un único segmento de memoria compartida (lado que publica)."""
+
+    ALINEACION = 64
+
+    def __init__(self, arrays):
+        arrays = {nombre: np.ascontiguousarray(a) for nombre, a in arrays.items()}
+        for nombre, a in arrays.items():
+            if a.dtype.hasobject:
+                raise ValueError(f"'{nombre}' es de tipo objeto: no se puede compartir sin copiar")
+
+        # Un offset alineado por array dentro del mismo segmento
+        offsets, total = {}, 0
+        for nombre, a in arrays.items():
+            total = -(-total // self.ALINEACION) * self.ALINEACION
+            offsets[nombre] = total
+            total += a.nbytes
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+        for nombre, a in arrays.items():
+            destino = np.ndarray(a.shape, dtype=a.dtype, buffer=self._shm.buf, offset=offsets[nombre])
+            destino[...] = a
+            del destino  # sin vistas vivas: close() no falla
+        self.nbytes = total
+        self.descriptor = {
+            'segmento': self._shm.name,
+            'arrays': {nombre: (a.dtype.str, a.shape, offsets[nombre]) for nombre, a in arrays.items()}
+        }
+        with _lock:
+            _publicados.add(self)
+
+    def close(self):
+        """Libera el segmento (los workers que sigan adjuntos conservan su mapeo hasta cerrarlo)."""
+        with _lock:
+            if self not in _publicados:
+                return
+            _publicados.discard(self)
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@atexit.register
+def _liberar_publicados():
+    for datos in list(_publicados):
+        datos.close()
+
+
+# ----------------------------------------------------------------------------- lado del worker
+
+# Segmentos adjuntos en este proceso: nombre -> (SharedMemory, {nombre: vista})
+_adjuntos = OrderedDict()
+MAX_ADJUNTOS = 4
+
+
+def _abrir(nombre):
+    try:
+        return shared_memory.SharedMemory(name=nombre, track=False)  # Python >= 3.13
+    except TypeError:
+        # Antes de 3.13 adjuntarse también registra el segmento en el resource_tracker. Los
+        # workers (spawn) heredan el tracker de quien publica, donde ya está registrado: no se
+        # des-registra aquí o el unlink del publicador lo quitaría dos veces (KeyError)
+        return shared_memory.SharedMemory(name=nombre)
+
+
+def _cerrar(shm, vistas):
+    vistas.clear()
+    try: shm.close()
+    except BufferError: pass  # alguna vista sigue viva: el mapeo se libera al salir el proceso
+
+
+def adjuntar(descriptor):
+    """Vistas numpy de solo lectura de los arrays publicados (el segmento se abre una vez por proceso)."""
+    nombre = descriptor['segmento']
+    with _lock:
+        if nombre in _adjuntos:
+            _adjuntos.move_to_end(nombre)
+            return _adjuntos[nombre][1]
+        shm = _abrir(nombre)
+        vistas = {}
+        for col, (dtype, forma, offset) in descriptor['arrays'].items():
+            v = np.ndarray(tuple(forma), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            v.flags.writeable = False
+            vistas[col] = v
+        _adjuntos[nombre] = (shm, vistas)
+        while len(_adjuntos) > MAX_ADJUNTOS:
+            _cerrar(*_adjuntos.popitem(last=False)[1])
+        return vistas
+
+
+@atexit.register
+def _cerrar_adjuntos():
+    while _adjuntos:
+        _cerrar(*_adjuntos.popitem()[1])
+
+
+# ----------------------------------------------------------------------------- pool de procesos
+
+_pool = None
+
+
+def pool_procesos():
+    """Pool de procesos compartido (spawn) o None si IADELIVERY_POOL_WORKERS <= 1."""
+    global _pool
+    if POOL_WORKERS <= 1:
+        return None
+    with _lock:
+        if _pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=get_context('spawn'))
+            atexit.register(_pool.shutdown, wait=True, cancel_futures=True)
+        return _pool
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Versión del formato de los resultados cacheados. Subirla invalida toda la caché.
+CACHE_VERSION = 2
+
+CACHE_DIR = os.environ.get('IADELIVERY_CACHE_DIR', 'data/cache')
+CACHE_MAX_MB = float(os.environ.get('IADELIVERY_CACHE_MAX_MB', 512))
+CACHE_ENABLED = os.environ.get('IADELIVERY_CACHE', '1') != '0'
+# Cada cuántas escrituras se vuelve a medir la caché en disco (otros procesos también escriben)
+CACHE_RESCAN_PUTS = 256
+# Fracción del límite hasta la que se vacía la caché al expulsar
+CACHE_EVICT_TARGET = 0.9
+
+
+class StageCache:
+    """
+    Memoización en disco de las etapas del pipeline (maestro, clustering, rutas).
+    Cada resultado se guarda como pickle en <cache_dir>/<etapa>/<clave>.pkl.
+    La clave es un hash de las entradas y la configuración de la etapa.
+    Cuando la caché supera max_mb se borran primero las entradas menos usadas.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_mb=CACHE_MAX_MB, enabled=CACHE_ENABLED):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        # Tamaño estimado en disco: se mide una vez y se actualiza con cada put, así
+        # expulsar no recorre el árbol entero en cada escritura
+        self._bytes = None
+        self._puts = 0
+
+    # ------------------------------------------------------------------
+    # HASHING
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _update(h, obj):
+        if obj is None:
+            h.update(b'N')
+        elif isinstance(obj, pd.DataFrame):
+            h.update(b'DF')
+            h.update(json.dumps([str(c) for c in obj.columns]).encode())
+            h.update(json.dumps([str(t) for t in obj.dtypes]).encode())
+            h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        elif isinstance(obj, pd.Series):
+            h.update(b'S')
+            h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        elif isinstance(obj, np.ndarray):
+            h.update(b'A' + str(obj.dtype).encode() + str(obj.shape).encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
+            h.update(b'B')
+            h.update(obj)
+        elif isinstance(obj, dict):
+            h.update(b'D')
+            for k in sorted(obj, key=str):
+                StageCache._update(h, str(k))
+                StageCache._update(h, obj[k])
+        elif isinstance(obj, (list, tuple)):
+            h.update(b'L' + str(len(obj)).encode())
+            for item in obj:
+                StageCache._update(h, item)
+        elif hasattr(obj, 'getbuffer'):
+            # Buffers subidos (BytesIO / UploadedFile): se hashea su contenido sin copiarlo
+            h.update(b'B')
+            h.update(obj.getbuffer())
+        else:
+            h.update(repr(obj).encode())
+
+    @staticmethod
+    def hash_inputs(*parts):
+        """Hash estable (sha256) de cualquier combinación de DataFrames, dicts, buffers y escalares."""
+        h = hashlib.sha256()
+        h.update(f"v{CACHE_VERSION}".encode())
+        for p in parts:
+            StageCache._update(h, p)
+        return h.hexdigest()
+
+    @staticmethod
+    def hash_files(paths):
+        """Hash del contenido de una lista de ficheros (los que no existen se ignoran)."""
+        h = hashlib.sha256()
+        for path in paths:
+            if not os.path.exists(path): continue
+            h.update(os.path.basename(path).encode())
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+        return h.hexdigest()
+
+    # ------------------------------------------------------------------
+    # LECTURA / ESCRITURA
+    # ------------------------------------------------------------------
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f"{key}.pkl")
+
+    def get(self, stage, key):
+        """Devuelve (hit, valor)."""
+        if not self.enabled or key is None:
+            return False, None
+        path = self._path(stage, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # marca de uso para la expulsión LRU
+            self.hits += 1
+            return True, value
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"   ⚠️ Entrada de caché corrupta ({stage}/{key[:8]}): {e}")
+            try: os.remove(path)
+            except OSError: pass
+        self.misses += 1
+        return False, None
+
+    def put(self, stage, key, value):
+        if not self.enabled or key is None:
+            return
+        path = self._path(stage, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Escritura atómica: otro proceso nunca ve un pickle a medias
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            nuevo = os.path.getsize(tmp)
+            try: previo = os.path.getsize(path)
+            except OSError: previo = 0
+            os.replace(tmp, path)
+            self._anotar(nuevo - previo)
+        except Exception as e:
+            print(f"   ⚠️ No se pudo guardar en caché ({stage}): {e}")
+
+    def cached(self, stage, key, fn):
+        """Devuelve el valor cacheado o lo calcula con fn() y lo guarda."""
+        hit, value = self.get(stage, key)
+        if hit:
+            return value
+        value = fn()
+        self.put(stage, key, value)
+        return value
+
+    # ------------------------------------------------------------------
+    # EXPULSIÓN
+    # ------------------------------------------------------------------
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.pkl'): continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    entries.append((st.st_mtime, st.st_size, path))
+                except OSError:
+                    pass
+        return entries
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _anotar(self, delta):
+        """Suma delta al tamaño estimado y expulsa solo si la estimación pasa del límite."""
+        self._puts += 1
+        if self._bytes is None or self._puts % CACHE_RESCAN_PUTS == 0:
+            self._bytes = self.size_bytes()
+        else:
+            self._bytes += delta
+        if self._bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        self._bytes = total
+        if total <= self.max_bytes:
+            return
+        # Se baja hasta el 90 % del límite: las siguientes escrituras no vuelven a expulsar
+        objetivo = self.max_bytes * CACHE_EVICT_TARGET
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+            if total <= objetivo:
+                break
+        self._bytes = total
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try: os.remove(path)
+            except OSError: pass
+        self._bytes = None